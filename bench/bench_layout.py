@@ -0,0 +1,63 @@
+"""
+Layout/render benchmark on synthetic netlists of increasing size.
+
+    python -m bench.bench_layout [--sizes 10,50,100,200,400] [--format svg]
+
+Each netlist is an MCU driving chains of resistor + LED pairs on its
+digital pins, plus sensor blocks, all sharing 5V and GND nets.
+"""
+import time, argparse
+
+from netlist.model import Netlist
+from draw.layout import Layout
+from draw.render import render_netlist, clear_render_caches
+
+
+def synthetic_netlist(n: int) -> dict:
+    comps = [
+        {"id": "U1", "type": "microcontroller", "model": "Arduino Uno"},
+        {"id": "V1", "type": "voltage_source", "value": "5V"},
+    ]
+    conns = [["V1:+", "U1:5V"], ["V1:-", "U1:GND"]]
+    i = 0
+    while len(comps) < n:
+        i += 1
+        pin = f"D{i % 14}"
+        if i % 5 == 0:
+            sid = f"S{i}"
+            comps.append({"id": sid, "type": "sensor", "model": "DHT11"})
+            conns += [[f"{sid}:VCC", "V1:+"], [f"{sid}:GND", "V1:-"], [f"{sid}:DATA", f"U1:{pin}"]]
+            continue
+        rid, did = f"R{i}", f"D{i}"
+        comps += [{"id": rid, "type": "resistor", "value": "220Ω"}, {"id": did, "type": "led"}]
+        conns += [[f"U1:{pin}", f"{rid}:1"], [f"{rid}:2", f"{did}:+"], [f"{did}:-", "U1:GND"]]
+    return {"components": comps[:n], "connections": conns}
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    p.add_argument("--sizes", default="10,50,100,200,400")
+    p.add_argument("--format", default="svg", choices=["svg", "png"])
+    p.add_argument("--repeat", type=int, default=3)
+    args = p.parse_args(argv)
+
+    render_netlist(synthetic_netlist(5), args.format)   # warm imports/fonts
+    print(f"{'parts':>6} {'wires':>6} {'layout ms':>10} {'render ms':>10} {'width':>7} {'height':>7} {'bytes':>9}")
+    for n in map(int, args.sizes.split(",")):
+        nl = Netlist.from_dict(synthetic_netlist(n))
+        best_layout = best_render = float("inf")
+        for _ in range(args.repeat):
+            t = time.perf_counter()
+            layout = Layout(nl)
+            best_layout = min(best_layout, time.perf_counter() - t)
+            clear_render_caches()   # full draw, no memo or cached pieces
+            t = time.perf_counter()
+            data = render_netlist(nl, args.format)
+            best_render = min(best_render, time.perf_counter() - t)
+        x0, y0, x1, y1 = layout.bbox()
+        print(f"{n:>6} {len(layout.wires):>6} {best_layout * 1e3:>10.1f} {best_render * 1e3:>10.1f} "
+              f"{x1 - x0:>7.1f} {y1 - y0:>7.1f} {len(data):>9}")
+
+
+if __name__ == "__main__":
+    main()
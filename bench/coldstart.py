@@ -0,0 +1,80 @@
+"""
+Cold-start benchmark: every sample is a fresh Python process.
+
+    python -m bench.coldstart [--repeat 5]
+
+Reports the median of:
+  import_ms         `import main`
+  first_cold_ms     process start -> first /generate answered, warm-up off
+                    (that request pays for matplotlib, fonts and clients)
+  ready_ms          process start -> /ready is 200, warm-up on
+  first_warm_ms     the first /generate after /ready
+The LLM and storage are the offline fakes, so only local start-up work counts.
+"""
+import os, sys, json, time, argparse, statistics, subprocess
+from typing import Any, Dict, List
+
+QUERY = "Arduino Nano reading a DHT11 sensor on D4 with an LED on D13"
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _child(mode: str) -> Dict[str, float]:
+    t0 = time.perf_counter()
+    if mode == "import":
+        import main  # noqa: F401
+        return {"import_ms": (time.perf_counter() - t0) * 1e3}
+
+    os.environ["WARMUP_ENABLED"] = "1" if mode == "warm" else "0"
+    os.environ.setdefault("STORAGE_BACKEND", "memory")
+    import main
+    from fastapi.testclient import TestClient
+    from bench.fakes import install_fakes
+
+    out: Dict[str, float] = {}
+    with TestClient(main.app) as client:
+        install_fakes()   # after startup, which configures the real client
+        if mode == "warm":
+            while client.get("/ready").status_code != 200:
+                time.sleep(0.01)
+            out["ready_ms"] = (time.perf_counter() - t0) * 1e3
+        t = time.perf_counter()
+        r = client.post("/generate", json={"query": QUERY, "fast_path": False})
+        r.raise_for_status()
+        if mode == "warm":
+            out["first_warm_ms"] = (time.perf_counter() - t) * 1e3
+        else:
+            out["first_cold_ms"] = (time.perf_counter() - t0) * 1e3
+    return out
+
+
+def _sample(mode: str) -> Dict[str, float]:
+    env = {**os.environ, "SLOW_REQUEST_MS": "1e9"}
+    proc = subprocess.run([sys.executable, "-m", "bench.coldstart", "--child", mode], cwd=_ROOT, env=env,
+                          capture_output=True, text=True, check=True)
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def run(repeat: int = 5) -> Dict[str, Any]:
+    samples: Dict[str, List[float]] = {}
+    for _ in range(repeat):
+        for mode in ("import", "cold", "warm"):
+            for k, v in _sample(mode).items():
+                samples.setdefault(k, []).append(v)
+    result: Dict[str, Any] = {k: round(statistics.median(v), 1) for k, v in samples.items()}
+    result["repeat"] = repeat
+    return result
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    p.add_argument("--repeat", type=int, default=5)
+    p.add_argument("--child", choices=["import", "cold", "warm"], help=argparse.SUPPRESS)
+    args = p.parse_args(argv)
+    if args.child:
+        print(json.dumps(_child(args.child)))
+        return
+    print(json.dumps(run(args.repeat), indent=2))
+
+
+if __name__ == "__main__":
+    main()
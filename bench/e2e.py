@@ -0,0 +1,122 @@
+"""
+End-to-end load test through the ASGI app, fully offline (fake Gemini,
+in-memory image storage).
+
+    python -m bench.e2e [--requests 200] [--concurrency 16] [--latency-ms 300] [--unique]
+
+Reports req/s and p50/p95/p99 latency. With --unique every request gets a
+distinct prompt suffix, so the result caches only help across identical
+netlists (images), not across requests.
+"""
+import json, math, time, asyncio, argparse, itertools
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from bench.fakes import install_fakes, load_corpus
+from bench.micro import DEFAULT_CORPUS
+
+_runs = itertools.count(1)   # keeps --unique prompts distinct across runs in one process
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    # Nearest-rank percentile.
+    k = math.ceil(pct / 100.0 * len(sorted_values)) - 1
+    return sorted_values[max(0, min(len(sorted_values) - 1, k))]
+
+
+async def _load(app, queries: List[str], concurrency: int, path: str, body: Dict[str, Any],
+                warmup: int) -> Dict[str, Any]:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        for q in queries[:warmup]:
+            await client.post(path, json={**body, "query": q})
+
+        latencies: List[float] = []
+        statuses: Dict[str, int] = {}
+        it = iter(queries)
+
+        async def worker():
+            for q in it:
+                t = time.perf_counter()
+                try:
+                    r = await client.post(path, json={**body, "query": q})
+                    await r.aread()
+                    code = str(r.status_code)
+                except Exception as e:
+                    code = type(e).__name__
+                latencies.append(time.perf_counter() - t)
+                statuses[code] = statuses.get(code, 0) + 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    lat = sorted(latencies)
+    return {
+        "requests": len(lat),
+        "concurrency": concurrency,
+        "seconds": round(elapsed, 3),
+        "rps": round(len(lat) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(lat, 50) * 1e3, 1),
+        "p95_ms": round(percentile(lat, 95) * 1e3, 1),
+        "p99_ms": round(percentile(lat, 99) * 1e3, 1),
+        "max_ms": round(lat[-1] * 1e3, 1) if lat else 0.0,
+        "status": statuses,
+    }
+
+
+def run(corpus_path: str = DEFAULT_CORPUS, field: str = "query", requests: int = 200, concurrency: int = 16,
+        latency_ms: float = 300.0, jitter_ms: float = 100.0, fail_rate: float = 0.0, unique: bool = False,
+        path: str = "/generate", image_format: str = "png", one_shot: bool = False,
+        force_fallback: bool = False, warmup: int = 5, seed: int = 0,
+        fast_path: Optional[bool] = None) -> Dict[str, Any]:
+    """One load run; warmup < 0 sends every corpus prompt once before measuring."""
+    backend = install_fakes(seed, latency_ms, jitter_ms, fail_rate)
+    import main   # after the fakes so nothing reaches for real credentials
+
+    corpus = load_corpus(corpus_path, field)
+    queries = [corpus[i % len(corpus)] for i in range(requests)]
+    if unique:
+        run_id = next(_runs)
+        queries = [f"{q} #{run_id:02d}{i:05d}" for i, q in enumerate(queries)]
+    if warmup < 0:
+        warmup = len(corpus)   # one pass over the corpus: measure warm caches
+    body = {"image_format": image_format, "one_shot": one_shot, "force_fallback": force_fallback,
+            "fast_path": fast_path}
+    result = asyncio.run(_load(main.app, queries, concurrency, path, body, warmup))
+    result.update({
+        "path": path, "image_format": image_format, "one_shot": one_shot, "force_fallback": force_fallback,
+        "fast_path": fast_path, "unique": unique, "llm_latency_ms": latency_ms, "llm_jitter_ms": jitter_ms, "fail_rate": fail_rate,
+        "llm_calls": backend.calls,
+    })
+    return result
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    p.add_argument("--corpus", default=DEFAULT_CORPUS)
+    p.add_argument("--field", default="query")
+    p.add_argument("--requests", type=int, default=200)
+    p.add_argument("--concurrency", type=int, default=16)
+    p.add_argument("--latency-ms", type=float, default=300.0)
+    p.add_argument("--jitter-ms", type=float, default=100.0)
+    p.add_argument("--fail-rate", type=float, default=0.0)
+    p.add_argument("--unique", action="store_true", help="make every prompt distinct (cold caches)")
+    p.add_argument("--path", default="/generate", choices=["/generate", "/generate/stream"])
+    p.add_argument("--image-format", default="png", choices=["png", "svg", "both"])
+    p.add_argument("--one-shot", action="store_true")
+    p.add_argument("--force-fallback", action="store_true")
+    p.add_argument("--no-fast-path", action="store_true", help="send every prompt to the (fake) LLM")
+    p.add_argument("--seed", type=int, default=0)
+    args = p.parse_args(argv)
+    result = run(args.corpus, args.field, args.requests, args.concurrency, args.latency_ms, args.jitter_ms,
+                 args.fail_rate, args.unique, args.path, args.image_format, args.one_shot,
+                 args.force_fallback, seed=args.seed, fast_path=False if args.no_fast_path else None)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
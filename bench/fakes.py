@@ -0,0 +1,111 @@
+"""
+Deterministic offline stand-ins for Gemini and image storage, shared by the
+benchmarks. Same prompt + seed always gives the same reply, latency and
+failure, so runs are comparable between commits.
+"""
+import os, json, random, hashlib
+from typing import List, Optional
+
+# Under benchmark load every request is "slow"; keep the log quiet unless asked.
+os.environ.setdefault("SLOW_REQUEST_MS", "1e9")
+
+from netlist.client import FakeBackend, configure_client
+from netlist.llm import _NETLIST_SYS_PROMPT, _ONE_SHOT_SYS_PROMPT
+from netlist.rules import rule_based_netlist
+from blobstore.backends import MemoryBackend, set_backend
+
+
+def _rng(seed: int, *parts: str) -> random.Random:
+    h = hashlib.sha256("\x1f".join((str(seed),) + parts).encode("utf-8")).digest()
+    return random.Random(int.from_bytes(h[:8], "big"))
+
+
+def _user_request(parts: List[str]) -> str:
+    text = parts[1] if len(parts) > 1 else ""
+    if text.startswith("User request: "):
+        text = text[len("User request: "):].split("\n\nSchema example:", 1)[0]
+    return text
+
+
+def _prose(rng: random.Random, chars: int) -> str:
+    words = ["connect", "the", "resistor", "to", "pin", "ground", "supply", "LED", "sensor", "then",
+             "upload", "sketch", "check", "polarity", "and", "wire", "board", "5V", "signal"]
+    out: List[str] = []
+    n = 0
+    while n < chars:
+        w = rng.choice(words)
+        out.append(w)
+        n += len(w) + 1
+    return " ".join(out)
+
+
+def _sketch(rng: random.Random, chars: int) -> str:
+    body = "\n".join(f"  // {_prose(rng, 60)}" for _ in range(max(1, chars // 70)))
+    return ("void setup() {\n  pinMode(13, OUTPUT);\n}\n\n"
+            f"void loop() {{\n{body}\n  digitalWrite(13, HIGH);\n  delay(500);\n"
+            "  digitalWrite(13, LOW);\n  delay(500);\n}\n")
+
+
+class FakeGemini:
+    """
+    Responder for netlist/client.FakeBackend. Netlists come from the rule
+    engine (wrapped in prose and a ```json fence, like real replies);
+    explanation and sketch text are `text_chars` long. `fail_rate` of the
+    calls raise, `latency_ms` +- `jitter_ms` is the simulated round trip.
+    """
+
+    def __init__(self, seed: int = 0, latency_ms: float = 0.0, jitter_ms: float = 0.0,
+                 fail_rate: float = 0.0, text_chars: int = 800):
+        self.seed = seed
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.fail_rate = fail_rate
+        self.text_chars = text_chars
+
+    def latency(self, model: str, parts: List[str]) -> float:
+        rng = _rng(self.seed, "latency", model, *parts)
+        return max(0.0, self.latency_ms + rng.uniform(-self.jitter_ms, self.jitter_ms)) / 1000.0
+
+    def __call__(self, model: str, parts: List[str]) -> str:
+        rng = _rng(self.seed, "reply", model, *parts)
+        if self.fail_rate and rng.random() < self.fail_rate:
+            raise RuntimeError("fake Gemini: injected failure")
+        system = parts[0] if parts else ""
+        if system == _ONE_SHOT_SYS_PROMPT:
+            data = rule_based_netlist(_user_request(parts))
+            data["explanation"] = _prose(rng, self.text_chars)
+            data["arduino_code"] = _sketch(rng, self.text_chars)
+            return json.dumps(data)
+        if system == _NETLIST_SYS_PROMPT:
+            data = rule_based_netlist(_user_request(parts))
+            return f"Here is the netlist:\n```json\n{json.dumps(data, indent=2)}\n```\nLet me know!"
+        if "Arduino code generator" in system:
+            return _sketch(rng, self.text_chars)
+        return _prose(rng, self.text_chars)
+
+
+def install_fakes(seed: int = 0, latency_ms: float = 0.0, jitter_ms: float = 0.0, fail_rate: float = 0.0,
+                  text_chars: int = 800, storage_mb: Optional[int] = 256) -> FakeBackend:
+    """Point the shared LLM client and image storage at the fakes; returns the LLM backend."""
+    gemini = FakeGemini(seed, latency_ms, jitter_ms, fail_rate, text_chars)
+    backend = FakeBackend(gemini, latency=gemini.latency)
+    configure_client(backend)
+    set_backend(MemoryBackend(max_bytes=(storage_mb or 256) * 1024 * 1024))
+    return backend
+
+
+def load_corpus(path: str, field: str = "query") -> List[str]:
+    """Prompts from a JSONL file (one object per line, prompt under `field`) or plain text lines."""
+    out: List[str] = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("{"):
+                value = json.loads(line).get(field)
+                if isinstance(value, str) and value.strip():
+                    out.append(value)
+            else:
+                out.append(line)
+    return out
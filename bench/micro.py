@@ -0,0 +1,159 @@
+"""
+Per-stage microbenchmarks: rule_based_netlist over the prompt corpus,
+extract_json_block on typical and adversarial LLM replies, drawing at
+several netlist sizes, and re-rendering repeated and near-repeated netlists.
+
+    python -m bench.micro [--corpus bench/prompts.jsonl] [--sizes 5,50,200] [--quick]
+
+Times are the median of --repeat runs, each averaging enough calls to
+take a few milliseconds.
+"""
+import os, copy, json, time, argparse, itertools, statistics
+from typing import Any, Callable, Dict, List
+
+from bench.bench_layout import synthetic_netlist
+from bench.fakes import load_corpus
+from netlist.model import Netlist
+from netlist.rules import rule_based_netlist
+from utils.json_extract import extract_json_block
+from draw.render import render_netlist, clear_render_caches
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(__file__), "prompts.jsonl")
+
+
+def timeit(fn: Callable[[], Any], repeat: int = 5, min_time: float = 0.005) -> float:
+    """Median seconds per call."""
+    fn()
+    number = 1
+    while True:
+        t = time.perf_counter()
+        for _ in range(number):
+            fn()
+        if time.perf_counter() - t >= min_time or number >= 1 << 20:
+            break
+        number *= 4
+    runs = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        for _ in range(number):
+            fn()
+        runs.append((time.perf_counter() - t) / number)
+    return statistics.median(runs)
+
+
+def json_replies(n: int) -> Dict[str, str]:
+    """LLM-style replies around a netlist of n components."""
+    body = json.dumps(synthetic_netlist(n))
+    noise = "Note: use {braces} carefully, e.g. {x} or {y: 1}. " * max(1, n // 5)
+    return {
+        "bare": body,
+        "fenced": f"```json\n{body}\n```",
+        "prose": f"Sure! Here is the circuit you asked for.\n{body}\nHope this helps.",
+        "stray_braces": f"{noise}\n{body}\n{noise}",
+        "truncated": body[: len(body) * 3 // 4],
+    }
+
+
+def bench_rules(corpus: List[str], repeat: int) -> Dict[str, Any]:
+    per_prompt = timeit(lambda: [rule_based_netlist(q) for q in corpus], repeat) / max(1, len(corpus))
+    return {"prompts": len(corpus), "us_per_prompt": round(per_prompt * 1e6, 2)}
+
+
+def bench_extract(sizes: List[int], repeat: int) -> Dict[str, Any]:
+    out: Dict[str, Any] = {}
+    for n in sizes:
+        for name, text in json_replies(n).items():
+            out[f"{name}@{n}"] = {"chars": len(text),
+                                  "us": round(timeit(lambda t=text: extract_json_block(t), repeat) * 1e6, 2)}
+    return out
+
+
+def bench_draw(sizes: List[int], repeat: int, formats: List[str]) -> Dict[str, Any]:
+    out: Dict[str, Any] = {}
+    for fmt in formats:
+        render_netlist(Netlist.from_dict(synthetic_netlist(5)), fmt)   # warm imports/fonts
+        for n in sizes:
+            nl = Netlist.from_dict(synthetic_netlist(n))
+
+            def draw():
+                clear_render_caches()   # a full draw, comparable across commits; see bench_rerender
+                render_netlist(nl, fmt)
+
+            out[f"{fmt}@{n}"] = {"ms": round(timeit(draw, repeat, 0.0) * 1e3, 2)}
+    return out
+
+
+def _near_repeats(base: dict) -> Callable[[], Netlist]:
+    """Copies of `base` with one resistor's value changed, a new value every call."""
+    counter = itertools.count(1)
+    idx = next((i for i, c in enumerate(base["components"]) if c["type"] == "resistor"), None)
+
+    def make() -> Netlist:
+        data = copy.deepcopy(base)
+        n = next(counter)
+        if idx is not None:
+            data["components"][idx]["value"] = f"{n}Ω"
+        else:
+            data["components"].append({"id": f"RX{n}", "type": "resistor", "value": f"{n}Ω"})
+        return Netlist.from_dict(data)
+    return make
+
+
+def bench_rerender(sizes: List[int], repeat: int, formats: List[str]) -> Dict[str, Any]:
+    """
+    cold: empty memo and piece cache; repeat: the same netlist again (memo);
+    near: one resistor value changed, so only that part is drawn anew.
+    """
+    netlists = {"esp32_cam": rule_based_netlist("ESP32-CAM video streaming")}
+    netlists.update({f"synthetic@{n}": synthetic_netlist(n) for n in sizes})
+    out: Dict[str, Any] = {}
+    for fmt in formats:
+        render_netlist(Netlist.from_dict(synthetic_netlist(5)), fmt)   # warm imports/fonts
+        for name, data in netlists.items():
+            nl = Netlist.from_dict(data)
+            near = _near_repeats(data)
+
+            def cold():
+                clear_render_caches()
+                render_netlist(nl, fmt)
+
+            cold_s = timeit(cold, repeat, 0.0)
+            repeat_s = timeit(lambda: render_netlist(nl, fmt), repeat)
+            near_s = timeit(lambda: render_netlist(near(), fmt), repeat, 0.0)
+            out[f"{fmt}:{name}"] = {
+                "cold_ms": round(cold_s * 1e3, 2),
+                "repeat_ms": round(repeat_s * 1e3, 4),
+                "near_ms": round(near_s * 1e3, 2),
+                "near_speedup": round(cold_s / near_s, 2),
+            }
+    clear_render_caches()
+    return out
+
+
+def run(corpus_path: str = DEFAULT_CORPUS, field: str = "query", sizes: List[int] = (5, 50, 200),
+        repeat: int = 5, formats: List[str] = ("svg", "png")) -> Dict[str, Any]:
+    corpus = load_corpus(corpus_path, field)
+    return {
+        "rule_based_netlist": bench_rules(corpus, repeat),
+        "extract_json_block": bench_extract(list(sizes), repeat),
+        "draw": bench_draw(list(sizes), max(1, repeat // 2), list(formats)),
+        "rerender": bench_rerender([n for n in sizes if n <= 50], max(1, repeat // 2), list(formats)),
+    }
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    p.add_argument("--corpus", default=DEFAULT_CORPUS)
+    p.add_argument("--field", default="query")
+    p.add_argument("--sizes", default="5,50,200")
+    p.add_argument("--repeat", type=int, default=5)
+    p.add_argument("--quick", action="store_true", help="small sizes, fewer repeats, SVG only")
+    args = p.parse_args(argv)
+    sizes = [5, 50] if args.quick else [int(s) for s in args.sizes.split(",")]
+    result = run(args.corpus, args.field, sizes, 3 if args.quick else args.repeat,
+                 ("svg",) if args.quick else ("svg", "png"))
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
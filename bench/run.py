@@ -0,0 +1,122 @@
+"""
+Run the offline benchmark suite and save the results per commit.
+
+    python -m bench.run [--quick] [--out _out/bench] [--compare _out/bench/<sha>.json]
+
+Results go to <out>/<short commit>.json (plus "-dirty" for uncommitted
+trees). --compare prints every number next to a previous result file.
+"""
+import os, sys, json, time, argparse, platform, subprocess
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from bench import micro, e2e, coldstart
+
+# End-to-end scenarios: (name, keyword arguments for e2e.run). The llm_*
+# and stream runs turn the fast path off so every prompt reaches the fake LLM;
+# fast_path_cold shows the default mix.
+_LLM = {"latency_ms": 300.0, "jitter_ms": 100.0, "fast_path": False}
+SCENARIOS = [
+    ("llm_warm", {**_LLM, "warmup": -1}),
+    ("llm_cold", {**_LLM, "unique": True}),
+    ("llm_one_shot_cold", {**_LLM, "latency_ms": 500.0, "jitter_ms": 150.0, "unique": True, "one_shot": True}),
+    ("llm_flaky_cold", {**_LLM, "unique": True, "fail_rate": 0.2}),
+    ("fallback_cold", {"force_fallback": True, "unique": True}),
+    ("stream_cold", {**_LLM, "unique": True, "path": "/generate/stream"}),
+    ("fast_path_cold", {"latency_ms": 300.0, "jitter_ms": 100.0, "unique": True}),
+]
+
+
+def _git(*args: str) -> Optional[str]:
+    try:
+        return subprocess.run(["git", *args], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def commit_id() -> str:
+    sha = _git("rev-parse", "--short", "HEAD") or "nogit"
+    dirty = _git("status", "--porcelain", "--untracked-files=no")
+    return f"{sha}-dirty" if dirty else sha
+
+
+def _flatten(d: Any, prefix: str = "") -> Iterator[Tuple[str, float]]:
+    if isinstance(d, dict):
+        for k, v in d.items():
+            yield from _flatten(v, f"{prefix}.{k}" if prefix else str(k))
+    elif isinstance(d, (int, float)) and not isinstance(d, bool):
+        yield prefix, float(d)
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any]):
+    base = dict(_flatten(baseline.get("results", {})))
+    print(f"{'metric':<58} {'baseline':>12} {'current':>12} {'change':>8}")
+    for key, value in _flatten(current.get("results", {})):
+        if key not in base:
+            continue
+        old = base[key]
+        change = f"{(value - old) / old * 100:+.1f}%" if old else "n/a"
+        print(f"{key:<58} {old:>12g} {value:>12g} {change:>8}")
+
+
+def main(argv=None) -> int:
+    p = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    p.add_argument("--out", default=os.path.join("_out", "bench"))
+    p.add_argument("--compare", help="previous result file to compare against")
+    p.add_argument("--corpus", default=micro.DEFAULT_CORPUS)
+    p.add_argument("--field", default="query")
+    p.add_argument("--quick", action="store_true", help="smaller sizes and request counts (CI smoke)")
+    p.add_argument("--requests", type=int, default=200)
+    p.add_argument("--concurrency", type=int, default=16)
+    p.add_argument("--skip-e2e", action="store_true")
+    p.add_argument("--skip-coldstart", action="store_true")
+    args = p.parse_args(argv)
+
+    baseline = None
+    if args.compare:
+        # Read first: the baseline may be the very file this run overwrites.
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    requests = 40 if args.quick else args.requests
+    started = time.time()
+    results: Dict[str, Any] = {
+        "micro": micro.run(args.corpus, args.field,
+                           (5, 50) if args.quick else (5, 50, 200),
+                           3 if args.quick else 5,
+                           ("svg",) if args.quick else ("svg", "png")),
+    }
+    if not args.skip_coldstart:
+        results["coldstart"] = coldstart.run(2 if args.quick else 5)
+        print("coldstart " + "  ".join(f"{k} {v}" for k, v in results["coldstart"].items()), file=sys.stderr)
+    if not args.skip_e2e:
+        results["e2e"] = {}
+        for name, kwargs in SCENARIOS:
+            r = e2e.run(args.corpus, args.field, requests, args.concurrency, **kwargs)
+            results["e2e"][name] = {k: r[k] for k in ("rps", "p50_ms", "p95_ms", "p99_ms", "max_ms", "llm_calls")}
+            results["e2e"][name]["errors"] = sum(n for code, n in r["status"].items() if code != "200")
+            print(f"{name:<20} {r['rps']:>8.1f} req/s  p50 {r['p50_ms']:>7.1f}  p95 {r['p95_ms']:>7.1f}  "
+                  f"p99 {r['p99_ms']:>7.1f} ms", file=sys.stderr)
+
+    report = {
+        "commit": commit_id(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(started)),
+        "duration_s": round(time.time() - started, 1),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "quick": args.quick,
+        "results": results,
+    }
+    os.makedirs(args.out, exist_ok=True)
+    path = os.path.join(args.out, f"{report['commit']}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Saved {path}", file=sys.stderr)
+
+    if baseline is not None:
+        compare(report, baseline)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,152 @@
+import os, base64, hashlib, threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional, Set
+
+CONTENT_TYPES = {"png": "image/png", "svg": "image/svg+xml"}
+
+
+def image_name(data: bytes, ext: str) -> str:
+    """Content-addressed object name: identical diagrams map to the same name."""
+    return f"{hashlib.sha256(data).hexdigest()}.{ext}"
+
+
+class StorageBackend:
+    """Stores image bytes under a name and returns a URL the frontend can load."""
+
+    name = "base"
+
+    def put(self, name: str, data: bytes, content_type: str) -> str:
+        raise NotImplementedError
+
+    def get(self, name: str) -> Optional[bytes]:
+        return None
+
+    def url_for(self, name: str) -> str:
+        return f"{os.getenv('PUBLIC_BASE_URL', '').rstrip('/')}/images/{name}"
+
+
+class GCSBackend(StorageBackend):
+    """Public GCS bucket. One client for the process; objects are never re-uploaded."""
+
+    name = "gcs"
+
+    def __init__(self, bucket_name: str, prefix: str = "circuit_images"):
+        from google.cloud import storage   # ✅ GCS client (only needed for this backend)
+        self.bucket_name = bucket_name
+        self.prefix = prefix
+        self._client = storage.Client()
+        self._bucket = self._client.bucket(bucket_name)
+        self._known: Set[str] = set()
+        self._lock = threading.Lock()
+
+    def url_for(self, name: str) -> str:
+        # Works because bucket is public
+        return f"https://storage.googleapis.com/{self.bucket_name}/{self.prefix}/{name}"
+
+    def put(self, name: str, data: bytes, content_type: str) -> str:
+        if name in self._known:
+            return self.url_for(name)
+        blob = self._bucket.blob(f"{self.prefix}/{name}")
+        if not blob.exists():
+            blob.upload_from_string(data, content_type=content_type)
+        with self._lock:
+            self._known.add(name)
+        return self.url_for(name)
+
+
+class LocalBackend(StorageBackend):
+    """Files in a local directory, served by the /images/{name} route."""
+
+    name = "local"
+
+    def __init__(self, root: Path):
+        self.root = root
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def put(self, name: str, data: bytes, content_type: str) -> str:
+        path = self.root / name
+        if not path.exists():
+            tmp = path.with_suffix(path.suffix + ".tmp")
+            tmp.write_bytes(data)
+            tmp.replace(path)
+        return self.url_for(name)
+
+    def get(self, name: str) -> Optional[bytes]:
+        path = self.root / Path(name).name
+        return path.read_bytes() if path.is_file() else None
+
+
+class MemoryBackend(StorageBackend):
+    """Bounded in-process store (LRU by bytes), served by the /images/{name} route."""
+
+    name = "memory"
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._data: "OrderedDict[str, bytes]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def put(self, name: str, data: bytes, content_type: str) -> str:
+        with self._lock:
+            if name in self._data:
+                self._data.move_to_end(name)
+            else:
+                self._data[name] = data
+                self._size += len(data)
+                while self._size > self.max_bytes and len(self._data) > 1:
+                    _, old = self._data.popitem(last=False)
+                    self._size -= len(old)
+        return self.url_for(name)
+
+    def get(self, name: str) -> Optional[bytes]:
+        with self._lock:
+            data = self._data.get(name)
+            if data is not None:
+                self._data.move_to_end(name)
+            return data
+
+
+class InlineBackend(StorageBackend):
+    """No storage at all: the image travels in the response as a data: URL."""
+
+    name = "inline"
+
+    def put(self, name: str, data: bytes, content_type: str) -> str:
+        return f"data:{content_type};base64,{base64.b64encode(data).decode('ascii')}"
+
+
+_backend: Optional[StorageBackend] = None
+_backend_lock = threading.Lock()
+
+
+def _build_backend() -> StorageBackend:
+    kind = os.getenv("STORAGE_BACKEND", "gcs").lower()
+    if kind == "local":
+        default_dir = Path(__file__).resolve().parent.parent / "_out" / "images"
+        return LocalBackend(Path(os.getenv("STORAGE_DIR", str(default_dir))))
+    if kind == "memory":
+        return MemoryBackend(int(float(os.getenv("STORAGE_MEMORY_MB", "64")) * 1024 * 1024))
+    if kind in ("inline", "none", "off"):
+        return InlineBackend()
+    return GCSBackend(os.getenv("GCS_BUCKET", "circuit-image-storage"))  # set in .env
+
+
+def get_backend() -> StorageBackend:
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = _build_backend()
+    return _backend
+
+
+def set_backend(backend: StorageBackend):
+    global _backend
+    _backend = backend
+
+
+def store_image(data: bytes, ext: str = "png") -> str:
+    """Store image bytes content-addressed and return their URL."""
+    return get_backend().put(image_name(data, ext), data, CONTENT_TYPES.get(ext, "application/octet-stream"))
@@ -0,0 +1,13 @@
+import sys
+
+# schemdraw imports matplotlib.pyplot (about 0.6s) as soon as it is imported,
+# only to offer a default canvas; every Drawing here names its canvas. Its
+# matplotlib backend is hidden during that first import, and draw.render
+# attaches it on the first PNG, so SVG-only processes never load matplotlib.
+if "schemdraw" not in sys.modules and "schemdraw.backends.mpl" not in sys.modules:
+    sys.modules["schemdraw.backends.mpl"] = None   # makes that import raise ImportError
+    try:
+        import schemdraw
+    finally:
+        if sys.modules.get("schemdraw.backends.mpl", 0) is None:
+            del sys.modules["schemdraw.backends.mpl"]
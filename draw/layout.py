@@ -0,0 +1,445 @@
+import math
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+from netlist.model import Netlist, Component
+
+XY = Tuple[float, float]
+
+UNIT = 3.0          # schemdraw unit (two-terminal element length)
+STUB = 1.2          # MCU pin stub length
+COL_W = 4.0         # width reserved for a component column
+CHAN_W = 4.0        # routing channel between columns
+TRACK = 0.4         # spacing between parallel trunks in a channel
+GAP = 1.0           # vertical gap between stacked components
+BLOCK_W = 3.0       # width of generic/camera blocks
+ROW_TRIES = 16      # candidate rows tried when joining a net's channels
+
+LEFT_PINS = ["GND", "3.3V", "5V", "VIN", "RESET"]
+RIGHT_PINS = ["D0", "D1", "D2", "D3", "D4", "D5", "D6", "D7", "D8", "D9", "D10", "D11", "D12", "D13"]
+ESP32_LEFT = ["GND", "5V"]
+ESP32_RIGHT = [
+    "CAM_PWDN", "CAM_SIOD", "CAM_SIOC", "CAM_XCLK",
+    "CAM_D0", "CAM_D1", "CAM_D2", "CAM_D3",
+    "CAM_D4", "CAM_D5", "CAM_D6", "CAM_D7",
+]
+
+TWO_TERMINAL = ("resistor", "led", "button")
+FIRST_TERMINAL = ("1", "+", "in", "a", "pos", "anode")
+
+Box = Tuple[float, float, float, float]     # x0, y0, x1, y1
+
+
+class Part:
+    __slots__ = ("component", "kind", "anchor", "height", "pins")
+
+    def __init__(self, component: Component, kind: str, anchor: XY, height: float):
+        self.component = component
+        self.kind = kind
+        self.anchor = anchor
+        self.height = height
+        self.pins: List[Tuple[str, XY]] = []   # block pins drawn as labelled stubs
+
+
+class McuBlock:
+    __slots__ = ("component", "box", "left", "right")
+
+    def __init__(self, component: Component, box: Dict[str, float],
+                 left: List[Tuple[str, XY]], right: List[Tuple[str, XY]]):
+        self.component = component
+        self.box = box
+        self.left = left
+        self.right = right
+
+
+class SegmentIndex:
+    """
+    Uniform-grid spatial index of wire segments and part boxes, used to keep
+    net trunks from running on top of each other and wires from crossing
+    parts or their labels. Lookups only touch the cells a query spans, so
+    cost stays flat as the drawing grows.
+    """
+
+    def __init__(self, cell: float = 2.0):
+        self.cell = cell
+        self._cells: Dict[Tuple[int, int], List[Tuple[float, float, float]]] = {}
+        self._rows: Dict[Tuple[int, int], List[Tuple[float, float, float]]] = {}
+        self._boxes: Dict[Tuple[int, int], List[Box]] = {}
+
+    def _keys(self, x: float, y0: float, y1: float):
+        ix = round(x / TRACK)
+        for iy in range(math.floor(y0 / self.cell), math.floor(y1 / self.cell) + 1):
+            yield (ix, iy)
+
+    def _row_keys(self, y: float, x0: float, x1: float):
+        iy = round(y / TRACK)
+        for ix in range(math.floor(x0 / self.cell), math.floor(x1 / self.cell) + 1):
+            yield (ix, iy)
+
+    def _box_keys(self, x0: float, y0: float, x1: float, y1: float):
+        for ix in range(math.floor(x0 / self.cell), math.floor(x1 / self.cell) + 1):
+            for iy in range(math.floor(y0 / self.cell), math.floor(y1 / self.cell) + 1):
+                yield (ix, iy)
+
+    def overlaps(self, x: float, y0: float, y1: float, eps: float = 1e-6) -> bool:
+        """True if a vertical segment already runs along x within [y0, y1]."""
+        for key in self._keys(x, y0, y1):
+            for sx, sy0, sy1 in self._cells.get(key, ()):
+                if abs(sx - x) < eps and sy0 <= y1 + eps and y0 <= sy1 + eps:
+                    return True
+        return False
+
+    def overlaps_row(self, y: float, x0: float, x1: float, eps: float = 1e-6) -> bool:
+        """True if a horizontal segment already runs along y within [x0, x1]."""
+        for key in self._row_keys(y, x0, x1):
+            for sy, sx0, sx1 in self._rows.get(key, ()):
+                if abs(sy - y) < eps and sx0 <= x1 + eps and x0 <= sx1 + eps:
+                    return True
+        return False
+
+    def blocked(self, x0: float, y0: float, x1: float, y1: float, eps: float = 1e-6) -> bool:
+        """True if the (axis-aligned) segment from (x0, y0) to (x1, y1) passes through a part box."""
+        x0, x1 = min(x0, x1), max(x0, x1)
+        y0, y1 = min(y0, y1), max(y0, y1)
+        for key in self._box_keys(x0, y0, x1, y1):
+            for bx0, by0, bx1, by1 in self._boxes.get(key, ()):
+                # Strict: wires may end on or run along a box edge (pins sit there).
+                if x0 < bx1 - eps and bx0 + eps < x1 and y0 < by1 - eps and by0 + eps < y1:
+                    return True
+        return False
+
+    def add(self, x: float, y0: float, y1: float):
+        seg = (x, y0, y1)
+        for key in self._keys(x, y0, y1):
+            self._cells.setdefault(key, []).append(seg)
+
+    def add_row(self, y: float, x0: float, x1: float):
+        seg = (y, x0, x1)
+        for key in self._row_keys(y, x0, x1):
+            self._rows.setdefault(key, []).append(seg)
+
+    def add_box(self, box: Box):
+        for key in self._box_keys(*box):
+            self._boxes.setdefault(key, []).append(box)
+
+
+class Layout:
+    """
+    Placement and routing for one netlist. Components are packed into
+    roughly square columns right of the MCU (ordered by connectivity so
+    neighbours stay close). Each net gets a vertical trunk in every routing
+    channel next to one of its pins, with a horizontal stub per pin; trunks
+    in different channels are joined by one horizontal row that clears all
+    part boxes and labels.
+    """
+
+    def __init__(self, netlist: Netlist):
+        self.netlist = netlist
+        self.mcu: Optional[McuBlock] = None
+        self.parts: List[Part] = []
+        self.pins: Dict[str, XY] = {}
+        self.wires: List[Tuple[XY, XY]] = []
+        self.dots: List[XY] = []
+        self.routes: List[Tuple[List[Tuple[XY, XY]], List[XY]]] = []   # (wires, dots) of each net
+        self.channels: List[Tuple[float, float]] = []
+        self.index = SegmentIndex()
+        self._gaps: Optional[List[float]] = None
+        self._place()
+        self._route()
+
+    # --- placement ---
+
+    def _place_mcu(self, mcu: Component) -> Dict[str, float]:
+        used = self.netlist.pins_of(mcu.id)
+        model = (mcu.model or "").lower()
+        left_c, right_c = (ESP32_LEFT, ESP32_RIGHT) if "esp32" in model else (LEFT_PINS, RIGHT_PINS)
+        # Everything else sits to the right of the MCU, so all of its pins do too
+        # (power first, then I/O): no wire has to cross the MCU box.
+        names = [p for p in left_c if p in used] + [p for p in right_c if p in used]
+        known = set(names)
+        # Pins the candidate lists don't know (A0, SDA, ...) still get a stub.
+        names += sorted(p for p in used if p not in known)
+
+        h = max(8.0, 0.9 * (len(names) + 1))
+        w = 10.0
+        box = {"x0": -w / 2, "y0": -h / 2, "x1": w / 2, "y1": h / 2}
+
+        right = []
+        for i, name in enumerate(names):
+            y = box["y1"] - (i + 1) * (h / (len(names) + 1))
+            right.append((name, (box["x1"], y)))
+            self.pins[f"{mcu.id}:{name}"] = (box["x1"] + STUB, y)
+
+        self.mcu = McuBlock(mcu, box, [], right)
+        self.index.add_box((box["x0"], box["y0"], box["x1"], box["y1"] + 1.0))   # title above
+        for _, (x, y) in right:
+            self.index.add_row(y, x, x + STUB)
+        return box
+
+    def _order(self, comps: List[Component]) -> List[Component]:
+        """Breadth-first over shared nets, starting next to the MCU."""
+        nets_by_comp: Dict[str, List[int]] = {}
+        comps_by_net: Dict[int, List[str]] = {}
+        for idx, net in enumerate(self.netlist.nets()):
+            cids = list(dict.fromkeys(p.component for p in net))
+            comps_by_net[idx] = cids
+            for cid in cids:
+                nets_by_comp.setdefault(cid, []).append(idx)
+
+        by_id = {c.id: c for c in comps if c.id}
+        order: List[Component] = []
+        seen = set()
+        seeds = ([self.mcu.component.id] if self.mcu else []) + [c.id for c in comps if c.id]
+        for seed in seeds:
+            if seed in seen:
+                continue
+            seen.add(seed)
+            queue = deque([seed])
+            while queue:
+                cid = queue.popleft()
+                if cid in by_id:
+                    order.append(by_id[cid])
+                for net in nets_by_comp.get(cid, ()):
+                    for other in comps_by_net[net]:
+                        if other not in seen:
+                            seen.add(other)
+                            queue.append(other)
+        order += [c for c in comps if not c.id]
+        return order
+
+    def _height(self, comp: Component) -> float:
+        kind = comp.kind
+        if kind in TWO_TERMINAL or kind in ("battery", "voltage_source"):
+            return UNIT + 0.5
+        if kind == "gnd":
+            return 1.5
+        npins = len(self.netlist.pins_of(comp.id)) if comp.id else 0
+        return max(2.0, 0.6 * (npins + 1)) + 0.8
+
+    def _place(self):
+        top = 0.0
+        x_start = 0.0
+        mcu = self.netlist.mcu
+        if mcu is not None:
+            box = self._place_mcu(mcu)
+            top = box["y1"]
+            x_start = box["x1"] + STUB
+
+        comps = self._order([c for c in self.netlist.components if c.kind != "microcontroller"])
+        heights = [self._height(c) + GAP for c in comps]
+        # Roughly square drawing: column height ~ sqrt(total height * column pitch).
+        col_h = max(top * 2 if mcu else 0.0, math.sqrt(sum(heights) * (COL_W + CHAN_W)), max(heights, default=0.0))
+
+        columns: List[List[Tuple[Component, float, float]]] = []
+        y = top
+        for comp, h in zip(comps, heights):
+            if not columns or (y - h < top - col_h and y != top):
+                columns.append([])
+                y = top
+            columns[-1].append((comp, y, h - GAP))
+            y -= h
+
+        # Each pin's net needs a trunk in the channel left of its column (the
+        # first channel also takes every MCU net), so size channels to fit.
+        nets_of: Dict[str, set] = {}
+        for idx, net in enumerate(self.netlist.nets()):
+            for p in net:
+                nets_of.setdefault(p.component, set()).add(idx)
+        x = x_start
+        for col, members in enumerate(columns):
+            nets = set().union(*(nets_of.get(c.id, set()) for c, _, _ in members))
+            if col == 0 and mcu is not None:
+                nets |= nets_of.get(mcu.id, set())
+            # Room for the trunks plus labels and block stubs overhanging the channel.
+            width = max(CHAN_W, TRACK * (len(nets) + 1) + 1.6)
+            x += width
+            self.channels.append((x - width + TRACK, x - TRACK))
+            for comp, y, h in members:
+                # Anchor is the top-left corner of the slot; parts hang down from it.
+                self._place_part(comp, (x, y), h)
+            x += COL_W
+        if columns:
+            self.channels.append((x + TRACK, x + CHAN_W))
+
+    def _place_part(self, comp: Component, pos: XY, height: float):
+        kind = comp.kind
+        if kind in ("battery", "voltage_source"):
+            kind = "voltage_source"
+        elif kind == "camera_module":
+            kind = "camera"
+        elif kind not in TWO_TERMINAL and kind != "gnd":
+            kind = "block"
+        part = Part(comp, kind, pos, height)
+        self.parts.append(part)
+        ax, ay = pos
+        for box in self._boxes(part):
+            self.index.add_box(box)
+        if not comp.id:
+            return
+
+        # Two-terminal parts and sources are drawn vertically: first/+ terminal
+        # on top, so stubs leave to the left without crossing the part.
+        for name in sorted(self.netlist.pins_of(comp.id)):
+            ref = f"{comp.id}:{name}"
+            if kind in TWO_TERMINAL:
+                self.pins[ref] = (ax, ay) if name in FIRST_TERMINAL else (ax, ay - UNIT)
+            elif kind == "voltage_source":
+                self.pins[ref] = (ax, ay) if name in ("+", "pos", "1") else (ax, ay - UNIT)
+            elif kind == "gnd":
+                self.pins[ref] = (ax, ay)
+
+        if kind in ("camera", "block"):
+            # Box spans [ax, ax + BLOCK_W] below the title; one labelled stub per used pin on its left edge.
+            names = self._pin_order(comp.id)
+            h = height - 0.8
+            top = ay - 0.8
+            for i, name in enumerate(names):
+                y = top - (i + 1) * (h / (len(names) + 1))
+                part.pins.append((name, (ax, y)))
+                self.pins[f"{comp.id}:{name}"] = (ax - 0.6, y)
+                self.index.add_row(y, ax - 0.6, ax)
+                self.index.add_box((ax - 0.7, y - 0.05, ax, y + 0.05))   # no trunk through the stub
+
+    @staticmethod
+    def _boxes(part: Part) -> List[Box]:
+        """Areas a wire must not cross: the part body and its label, as render.py draws them."""
+        ax, ay = part.anchor
+        kind = part.kind
+        # Boxes reach just past the terminals so no other wire runs through a pin.
+        if kind == "gnd":
+            return [(ax - 0.3, ay - 0.7, ax + 0.3, ay + 0.05)]
+        if kind in TWO_TERMINAL or kind == "voltage_source":
+            half = {"resistor": 0.3, "led": 0.3, "button": 0.45}.get(kind, 0.5)
+            # Labels sit beside the middle of the element: right of an LED, left of the rest.
+            label = (ax, ay - 2.0, ax + 1.9, ay - 1.0) if kind == "led" else (ax - 1.45, ay - 2.0, ax, ay - 1.0)
+            return [(ax - half, ay - UNIT - 0.05, ax + half, ay + 0.05), label]
+        comp = part.component
+        title = (comp.model or "CAM") if kind == "camera" else (comp.kind or "blk")
+        over = max(0.0, 0.08 * len(title) + 0.1 - BLOCK_W / 2)   # a long title overhangs the box
+        return [(ax - over, ay - part.height, ax + BLOCK_W + over, ay)]
+
+    def _pin_order(self, cid: str) -> List[str]:
+        # Keep the order pins first appear in the connection list.
+        seen: Dict[str, None] = {}
+        for a, b in self.netlist.connections:
+            for p in (a, b):
+                if p.component == cid and p.name:
+                    seen.setdefault(p.name, None)
+        return list(seen)
+
+    # --- routing ---
+
+    def _route(self):
+        index = self.index
+        for net in self.netlist.nets():
+            points = list(dict.fromkeys(self.pins[p.ref] for p in net if p.ref in self.pins))
+            if len(points) < 2:
+                continue
+            # A pin's stub only reaches its nearest channel without crossing a
+            # column, so a net gets one trunk per channel its pins sit next to.
+            groups: Dict[int, List[XY]] = {}
+            for pt in points:
+                groups.setdefault(self._home(pt[0]), []).append(pt)
+            row = self._row(points, groups, index) if len(groups) > 1 else None
+
+            wires: List[Tuple[XY, XY]] = []
+            dots: List[XY] = []
+            trunks: List[Tuple[float, float, float]] = []
+            for ch, pts in sorted(groups.items()):
+                ys = [p[1] for p in pts] + ([row] if row is not None else [])
+                y0, y1 = min(ys), max(ys)
+                if len(pts) == 1 and y0 == y1:
+                    x = pts[0][0]      # the pin is on the row already
+                else:
+                    x = self._track(sum(p[0] for p in pts) / len(pts), y0, y1, index, ch)
+                    index.add(x, y0, y1)
+                if y1 > y0:
+                    wires.append(((x, y0), (x, y1)))
+                for px, py in pts:
+                    if px != x:
+                        wires.append(((px, py), (x, py)))
+                        index.add_row(py, min(px, x), max(px, x))
+                    dots.append((px, py))
+                    if len(points) > 2:
+                        dots.append((x, py))
+                trunks.append((x, y0, y1))
+            if row is not None:
+                xa = min(t[0] for t in trunks)
+                xb = max(t[0] for t in trunks)
+                wires.append(((xa, row), (xb, row)))
+                index.add_row(row, xa, xb)
+                # Junctions only: a trunk that just turns into the row's end is a corner.
+                dots += [(x, row) for x, y0, y1 in trunks if xa < x < xb or y0 < row < y1]
+            self.routes.append((wires, dots))
+            self.wires += wires
+            self.dots += dots
+
+    def _home(self, x: float) -> int:
+        """Index of the channel nearest x (-1 when there are none)."""
+        if not self.channels:
+            return -1
+        return min(range(len(self.channels)),
+                   key=lambda i: max(self.channels[i][0] - x, x - self.channels[i][1], 0.0))
+
+    def _row(self, points: List[XY], groups: Dict[int, List[XY]], index: SegmentIndex) -> float:
+        """y of a horizontal row joining the net's channels that crosses no part and no other row."""
+        chans = [self.channels[i] for i in groups if i >= 0] or [(min(p[0] for p in points),) * 2]
+        xa = min(c[0] for c in chans)
+        xb = max(c[1] for c in chans)
+        mean_y = sum(p[1] for p in points) / len(points)
+        # Pin rows (the row extends a stub) and the gaps between stacked parts,
+        # nearest first; above everything is always clear. Only the nearest few
+        # are tried, so big drawings don't test every gap for every net.
+        if self._gaps is None:
+            self._gaps = list(dict.fromkeys(round(part.anchor[1] + GAP / 2, 3) for part in self.parts))
+        candidates = list(dict.fromkeys([p[1] for p in points] + self._gaps))
+        candidates.sort(key=lambda y: abs(y - mean_y))
+        for y in candidates[:ROW_TRIES]:
+            if not index.blocked(xa, y, xb, y) and not index.overlaps_row(y, xa, xb):
+                return y
+        top = max([part.anchor[1] for part in self.parts] + [p[1] for p in points])
+        if self.mcu:
+            top = max(top, self.mcu.box["y1"] + 1.0)
+        y = round(top + GAP / 2, 3)
+        while index.overlaps_row(y, xa, xb):
+            y = round(y + TRACK, 3)
+        return y
+
+    def _track(self, mean_x: float, y0: float, y1: float, index: SegmentIndex, home: int = -1) -> float:
+        """Free trunk position in channel `home` (or the one nearest mean_x), spilling to neighbours."""
+        if not self.channels:
+            return mean_x
+        order = sorted(self.channels, key=lambda c: abs((c[0] + c[1]) / 2 - mean_x))
+        if home >= 0:
+            order.remove(self.channels[home])
+            order.insert(0, self.channels[home])
+        for lo, hi in order[:4]:
+            n = max(1, int((hi - lo) / TRACK + 1e-6) + 1)
+            centre = min(max(mean_x, lo), hi)
+            start = round((centre - lo) / TRACK)
+            for k in range(n):
+                for i in (start + k, start - k) if k else (start,):
+                    if 0 <= i < n:
+                        x = round(lo + i * TRACK, 3)
+                        if not index.overlaps(x, y0, y1) and not index.blocked(x, y0, x, y1):
+                            return x
+        # Every nearby track is taken: share the closest one rather than search forever.
+        lo, hi = order[0]
+        return round(min(max(mean_x, lo), hi), 3)
+
+    def bbox(self) -> Tuple[float, float, float, float]:
+        xs: List[float] = []
+        ys: List[float] = []
+        if self.mcu:
+            b = self.mcu.box
+            xs += [b["x0"] - STUB, b["x1"] + STUB]
+            ys += [b["y0"], b["y1"]]
+        for part in self.parts:
+            xs += [part.anchor[0], part.anchor[0] + BLOCK_W]
+            ys += [part.anchor[1] - part.height, part.anchor[1]]
+        for (ax, ay), (bx, by) in self.wires:
+            xs += [ax, bx]
+            ys += [ay, by]
+        if not xs:
+            return (0.0, 0.0, 0.0, 0.0)
+        return (min(xs), min(ys), max(xs), max(ys))
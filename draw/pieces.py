@@ -0,0 +1,139 @@
+import os
+from typing import Any, Callable, Dict, Hashable, List, Tuple
+from xml.etree import ElementTree as ET
+
+import schemdraw
+import schemdraw.elements as elm
+from schemdraw.backends.svg import Figure as SvgFigure
+from schemdraw.backends.svgunits import PT_PER_IN
+from schemdraw.transform import Transform
+from schemdraw.types import BBox
+from schemdraw.util import Point
+
+from utils.cache import MemoryCache
+
+# Reusable sub-drawings. The MCU block and every part are drawn once per
+# distinct look (model, label, size, pin names and offsets) with their anchor
+# at the origin; later diagrams place the cached piece instead of building
+# its elements again. A piece keeps its segments and bounding box, and for
+# SVG also the finished <path>/<text> elements, which are wrapped in a
+# translated <g> per placement, so only wires, dots and new parts are drawn.
+
+RENDER_PIECE_ITEMS = int(os.getenv("RENDER_PIECE_ITEMS", "512"))
+
+# SvgFigure internals the SVG reuse relies on (schemdraw 0.23, see
+# requirements.txt). If a schemdraw release renames any of them, pieces are
+# drawn segment by segment instead, which is slower but still correct.
+_SVG_FIELDS = ("svgelements", "clips", "svgdefs", "gradients", "_need_xlink")
+
+XY = Tuple[float, float]
+
+
+class Piece:
+    """One sub-drawing in local coordinates."""
+
+    __slots__ = ("segments", "bbox", "_svg")
+
+    def __init__(self, drawing: schemdraw.Drawing):
+        self.segments = drawing.get_segments()
+        boxes = [s.get_bbox() for s in self.segments]
+        self.bbox = BBox(min(b.xmin for b in boxes), min(b.ymin for b in boxes),
+                         max(b.xmax for b in boxes), max(b.ymax for b in boxes))
+        self._svg: Dict[float, List[Tuple[int, List[ET.Element]]]] = {}   # scale -> [(zorder, elements)]
+
+    def svg(self, scale: float, style: Dict[str, Any]):
+        """SVG elements of the piece at the origin, grouped by zorder; None if it can't be reused."""
+        if scale not in self._svg:
+            fig = SvgFigure(self.bbox, inches_per_unit=scale / PT_PER_IN)
+            if not all(hasattr(fig, name) for name in _SVG_FIELDS):
+                self._svg[scale] = None   # unknown schemdraw internals
+                return None
+            origin = Transform(0, (0, 0))
+            for s in self.segments:
+                s.draw(fig, origin, **style)
+            if fig.clips or fig.svgdefs or fig.gradients or fig._need_xlink:
+                self._svg[scale] = None   # ids and defs belong to one document
+            else:
+                groups: Dict[int, List[ET.Element]] = {}
+                for zorder, e in fig.svgelements:
+                    groups.setdefault(zorder, []).append(e)
+                self._svg[scale] = sorted(groups.items())
+        return self._svg[scale]
+
+
+class Placed(elm.Element):
+    """A cached Piece moved to `xy`; implements what Drawing needs from an Element."""
+
+    def __init__(self, piece: Piece, xy: XY):
+        super().__init__()
+        self.piece = piece
+        self.xy = Point(xy)
+        self._drawing_params: Dict[str, Any] = {}
+
+    def _place(self, dwgxy, dwgtheta, **dwgparams):
+        # Kept here too, so drawing defaults still apply if Element stops
+        # exposing `_dwgparams` through `params`.
+        self._drawing_params = dict(dwgparams)
+        shared = getattr(self, "_dwgparams", None)
+        if isinstance(shared, dict):
+            shared.clear()
+            shared.update(dwgparams)
+        self.transform = Transform(0, self.xy)
+        return Point(dwgxy), dwgtheta     # pieces don't move the drawing's cursor
+
+    def get_bbox(self, transform=False, includetext=True):
+        b = self.piece.bbox
+        if not transform:
+            return b
+        x, y = self.xy
+        return BBox(b.xmin + x, b.ymin + y, b.xmax + x, b.ymax + y)
+
+    def _draw(self, fig):
+        params = {**self._drawing_params, **self.params}
+        if isinstance(fig, SvgFigure):
+            groups = self.piece.svg(fig.scale, params)
+            if groups is not None:
+                x, y = self.xy
+                attrs = {"transform": f"translate({x * fig.scale:.6g},{-y * fig.scale + 0.0:.6g})"} if x or y else {}
+                for zorder, elements in groups:
+                    g = ET.Element("g", attrs)
+                    g.extend(elements)
+                    fig.svgelements.append((zorder, g))
+                return
+        for s in self.piece.segments:
+            s.draw(fig, self.transform, **params)
+
+
+class PieceCache:
+    """LRU of Pieces by key; builds a missing one in a scratch drawing."""
+
+    def __init__(self, max_items: int = RENDER_PIECE_ITEMS):
+        self.enabled = max_items > 0
+        self._pieces = MemoryCache(max_items=max(1, max_items), ttl=float("inf"))
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, build: Callable[[schemdraw.Drawing], None], **config) -> Piece:
+        piece = self._pieces.get(repr(key)) if self.enabled else None
+        if piece is not None:
+            self.hits += 1
+            return piece
+        self.misses += 1
+        # Its own `with` block, so schemdraw's drawing stack doesn't hand these
+        # elements to the diagram being composed.
+        with schemdraw.Drawing(show=False) as sub:
+            sub.config(**config)
+            build(sub)
+        piece = Piece(sub)
+        if self.enabled:
+            self._pieces.set(repr(key), piece)
+        return piece
+
+    def place(self, key: Hashable, build: Callable[[schemdraw.Drawing], None], xy: XY, **config) -> Placed:
+        return Placed(self.get(key, build, **config), xy)
+
+    def clear(self):
+        self._pieces.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"items": len(self._pieces), "hits": self.hits, "misses": self.misses}
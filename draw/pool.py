@@ -0,0 +1,222 @@
+import os, time, queue, threading, multiprocessing
+from typing import Optional
+
+# Tiny netlist rendered once per worker so fonts, backends and schemdraw
+# element classes are loaded before the first real job arrives.
+_WARMUP_NETLIST = {
+    "components": [{"id": "V1", "type": "voltage_source", "value": "5V"}, {"id": "R1", "type": "resistor"}],
+    "connections": [["V1:+", "R1:1"]],
+}
+
+
+class RenderTimeout(Exception):
+    pass
+
+
+class RenderWorkerDied(Exception):
+    def __init__(self, message: str, elapsed: float = 0.0):
+        super().__init__(message)
+        self.elapsed = elapsed     # seconds the job ran before its worker died
+
+
+def _worker_main(conn, warm_formats):
+    # Runs in the child: pay the matplotlib/schemdraw import once, then serve jobs.
+    from draw.render import render_netlist
+    for fmt in warm_formats:
+        try:
+            render_netlist(_WARMUP_NETLIST, fmt)
+        except Exception:
+            pass
+    conn.send(("ready", None))
+    while True:
+        try:
+            job = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            return
+        if job is None:
+            return
+        netlist, fmt = job
+        try:
+            conn.send(("ok", render_netlist(netlist, fmt)))
+        except Exception as e:
+            conn.send(("err", f"{type(e).__name__}: {e}"))
+
+
+class _Worker:
+    def __init__(self, ctx, warm_formats):
+        self.conn, child_conn = ctx.Pipe()
+        self.proc = ctx.Process(target=_worker_main, args=(child_conn, warm_formats), daemon=True)
+        self.proc.start()
+        child_conn.close()
+        self.jobs = 0
+
+    def kill(self):
+        try:
+            self.conn.close()
+        finally:
+            if self.proc.is_alive():
+                self.proc.kill()
+            self.proc.join(timeout=1)
+
+
+class RenderPool:
+    """
+    Pre-started render processes that import matplotlib/schemdraw once.
+    render() is blocking (call it from a thread). It waits up to
+    `queue_timeout` for an idle worker; `timeout` only starts once the job
+    is sent to it. A job that crashes its worker or exceeds `timeout` gets
+    the worker killed and replaced, and a job whose worker died is retried
+    once on another worker within what is left of `timeout`. Workers that
+    fail to start are replaced too, with backoff. Workers are also recycled
+    after `max_jobs` jobs to cap memory growth.
+    """
+
+    def __init__(self, size: int, timeout: float = 20.0, max_jobs: int = 500,
+                 warm_formats=("png", "svg"), ready_timeout: float = 120.0, queue_timeout: float = 60.0):
+        self.size = size
+        self.timeout = timeout
+        self.queue_timeout = queue_timeout
+        self.max_jobs = max_jobs
+        self.warm_formats = tuple(warm_formats)
+        self.ready_timeout = ready_timeout
+        method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        self._ctx = multiprocessing.get_context(method)
+        self._idle: "queue.Queue[_Worker]" = queue.Queue()
+        self._closed = False
+        self.recycled = 0
+        self.start_failures = 0      # consecutive; drives the respawn backoff
+        self.retries = 0
+
+    def start(self):
+        for _ in range(self.size):
+            self._spawn()
+
+    def _spawn(self):
+        if self._closed:
+            return
+        worker = _Worker(self._ctx, self.warm_formats)
+        threading.Thread(target=self._await_ready, args=(worker,), daemon=True).start()
+
+    def _await_ready(self, worker: _Worker):
+        try:
+            if worker.conn.poll(self.ready_timeout) and worker.conn.recv()[0] == "ready":
+                self.start_failures = 0
+                self._idle.put(worker)
+                return
+        except (EOFError, OSError):
+            pass
+        worker.kill()
+        self.start_failures += 1
+        delay = min(30.0, 0.5 * 2 ** (self.start_failures - 1))
+        print(f"⚠️ Render worker failed to start, retrying in {delay:.1f}s")
+        time.sleep(delay)   # this is the worker's own watcher thread
+        self._spawn()
+
+    def _recycle(self, worker: _Worker):
+        self.recycled += 1
+        worker.kill()
+        self._spawn()
+
+    def _take(self, abandoned: Optional[threading.Event] = None) -> _Worker:
+        deadline = time.monotonic() + self.queue_timeout
+        while True:
+            if abandoned is not None and abandoned.is_set():
+                raise RenderTimeout("render abandoned while waiting for a worker")
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise RenderTimeout(f"no render worker free within {self.queue_timeout:.1f}s")
+            try:
+                # Short waits, so a caller that gave up is noticed promptly.
+                worker = self._idle.get(timeout=min(remaining, 0.25))
+            except queue.Empty:
+                continue
+            if abandoned is not None and abandoned.is_set():
+                self._idle.put(worker)   # nobody wants this render any more
+                raise RenderTimeout("render abandoned while waiting for a worker")
+            if worker.proc.is_alive():
+                return worker
+            self._recycle(worker)   # died while idle (OOM killer, ...)
+
+    def _render_once(self, netlist: dict, fmt: str, budget: float,
+                     abandoned: Optional[threading.Event] = None) -> bytes:
+        worker = self._take(abandoned)
+        sent = time.monotonic()
+        try:
+            worker.conn.send((netlist, fmt))
+            if not worker.conn.poll(budget):
+                self._recycle(worker)
+                raise RenderTimeout(f"render exceeded {self.timeout:.1f}s")
+            status, payload = worker.conn.recv()
+        except (EOFError, OSError, BrokenPipeError) as e:
+            self._recycle(worker)
+            raise RenderWorkerDied(str(e) or "render worker exited", time.monotonic() - sent) from e
+
+        worker.jobs += 1
+        if worker.jobs >= self.max_jobs:
+            self._recycle(worker)
+        else:
+            self._idle.put(worker)
+        if status != "ok":
+            raise RuntimeError(payload)
+        return payload
+
+    def render(self, netlist: dict, fmt: str = "png", abandoned: Optional[threading.Event] = None) -> bytes:
+        """
+        Rendered image bytes. Set `abandoned` when the caller stops waiting:
+        a job still waiting for a worker then gives up instead of rendering.
+        """
+        try:
+            return self._render_once(netlist, fmt, self.timeout, abandoned)
+        except RenderWorkerDied as e:
+            budget = self.timeout - e.elapsed
+            if budget <= 0:
+                raise RenderTimeout(f"render exceeded {self.timeout:.1f}s") from e
+            self.retries += 1
+            print("⚠️ Render worker died, retrying on another worker:", e)
+            return self._render_once(netlist, fmt, budget, abandoned)
+
+    def stats(self) -> dict:
+        return {"size": self.size, "idle": self._idle.qsize(), "recycled": self.recycled,
+                "retries": self.retries, "start_failures": self.start_failures}
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                worker.conn.send(None)
+            except Exception:
+                pass
+            worker.kill()
+
+
+_pool: Optional[RenderPool] = None
+
+
+def start_render_pool() -> Optional[RenderPool]:
+    """Start the shared pool if RENDER_POOL_SIZE > 0 (0 renders in-process threads)."""
+    global _pool
+    size = int(os.getenv("RENDER_POOL_SIZE", "0"))
+    if size > 0 and _pool is None:
+        _pool = RenderPool(
+            size,
+            timeout=float(os.getenv("RENDER_TIMEOUT_S", "20")),
+            max_jobs=int(os.getenv("RENDER_WORKER_MAX_JOBS", "500")),
+            queue_timeout=float(os.getenv("RENDER_QUEUE_TIMEOUT_S", "60")),
+        )
+        _pool.start()
+    return _pool
+
+
+def get_render_pool() -> Optional[RenderPool]:
+    return _pool
+
+
+def stop_render_pool():
+    global _pool
+    if _pool is not None:
+        _pool.close()
+        _pool = None
@@ -1,11 +1,44 @@
+import os, sys, threading
 from pathlib import Path
-from typing import Dict, Tuple, Optional
-import matplotlib
-matplotlib.use("Agg")  # ✅ Disable GUI popups from matplotlib
+from typing import Any, Dict, Tuple, Optional
 
 import schemdraw
 import schemdraw.elements as elm
 
+from netlist.model import Netlist
+from draw.layout import Layout, McuBlock, Part, UNIT, STUB, BLOCK_W
+from draw.pieces import PieceCache
+from utils.cache import MemoryCache
+
+# schemdraw keeps the "current drawing" in a module-global stack, so two
+# drawings built at once in different threads corrupt each other. Rendering
+# in-process is serialized; use draw.pool for parallel rendering.
+_render_lock = threading.Lock()
+
+# Rendered images by canonical netlist digest and format: identical netlists
+# (templates, retries, re-renders of an unchanged design) skip drawing.
+RENDER_MEMO_ITEMS = int(os.getenv("RENDER_MEMO_ITEMS", "64"))
+RENDER_MEMO_TTL = float(os.getenv("RENDER_MEMO_TTL_S", "3600"))
+_memo = MemoryCache(max_items=max(1, RENDER_MEMO_ITEMS), ttl=RENDER_MEMO_TTL)
+_pieces = PieceCache()
+_plt = None
+
+
+def _pyplot():
+    """pyplot, with schemdraw's matplotlib backend attached (see draw/__init__); loaded on the first PNG."""
+    global _plt
+    if _plt is None:
+        import matplotlib
+        matplotlib.use("Agg")  # ✅ Disable GUI popups from matplotlib
+        import matplotlib.pyplot as plt
+        from schemdraw.backends.mpl import Figure
+        for name in ("schemdraw.schemdraw", "schemdraw.elements.elements"):
+            module = sys.modules.get(name)
+            if module is not None and getattr(module, "mplFigure", Figure) is None:
+                module.mplFigure = Figure
+        _plt = plt
+    return _plt
+
 
 def _draw_rect(d: schemdraw.Drawing, center: Tuple[float, float], w: float, h: float, title: Optional[str] = None):
     cx, cy = center
@@ -20,143 +53,151 @@ def _draw_rect(d: schemdraw.Drawing, center: Tuple[float, float], w: float, h: f
     return {"x0": x0, "y0": y0, "x1": x1, "y1": y1}
 
 
-def _pin_label(d: schemdraw.Drawing, xy, text, dx, dy):
+def _pin_label(d: schemdraw.Drawing, xy, text, dx, dy, halign=None):
     d.add(elm.Dot(open=True).at(xy))
-    d.add(elm.Label().at((xy[0] + dx, xy[1] + dy)).label(text))
-
-
-def draw_from_netlist(netlist: dict, out_path: Path) -> Path:
+    d.add(elm.Label().at((xy[0] + dx, xy[1] + dy)).label(text, halign=halign))
+
+
+def _draw_part(d: schemdraw.Drawing, part: Part):
+    """Draw one part with its anchor at the origin; see _part_key."""
+    comp = part.component
+    pos = (0.0, 0.0)
+    if part.kind == "resistor":
+        d.add(elm.Resistor().at(pos).down().label(comp.value or ""))
+    elif part.kind == "led":
+        d.add(elm.LED().at(pos).down().label("LED"))
+    elif part.kind == "button":
+        d.add(elm.Switch().at(pos).down().label("Button"))
+    elif part.kind == "voltage_source":
+        # Drawn upwards so "+" ends up on top, where the layout puts the + pin.
+        d.add(elm.SourceV().at((pos[0], pos[1] - UNIT)).up().label(comp.value or "V"))
+    elif part.kind == "gnd":
+        d.add(elm.Ground().at(pos))
+    else:
+        title = (comp.model or "CAM") if part.kind == "camera" else (comp.kind or "blk")
+        h = part.height - 0.8
+        _draw_rect(d, (pos[0] + BLOCK_W / 2, pos[1] - 0.8 - h / 2), BLOCK_W, h)
+        d.add(elm.Label().at((pos[0] + BLOCK_W / 2, pos[1] - 0.4)).label(title))
+        for name, (x, y) in _local_pins(part.pins, part.anchor):
+            d.add(elm.Line().at((x, y)).to((x - 0.6, y)))
+            d.add(elm.Label().at((x + 0.15, y)).label(name, halign="left", fontsize=9))
+
+
+def _draw_net(d: schemdraw.Drawing, wires, dots):
+    """Draw one net's trunks, rows, stubs and dots, in diagram coordinates."""
+    for p1, p2 in wires:
+        d.add(elm.Line().at(p1).to(p2))
+    for xy in dict.fromkeys(dots):
+        d.add(elm.Dot().at(xy))
+
+
+def _draw_mcu(d: schemdraw.Drawing, m: McuBlock):
+    """Draw the MCU block with its box centre at the origin; see _mcu_key."""
+    b = m.box
+    centre = _centre(b)
+    _draw_rect(d, (0.0, 0.0), b["x1"] - b["x0"], b["y1"] - b["y0"], title=m.component.model or "")
+    for pname, (x, y) in _local_pins(m.left, centre):
+        d.add(elm.Line().at((x, y)).to((x - STUB, y)))
+        _pin_label(d, (x, y), pname, 0.3, 0, halign="left")
+    for pname, (x, y) in _local_pins(m.right, centre):
+        d.add(elm.Line().at((x, y)).to((x + STUB, y)))
+        _pin_label(d, (x, y), pname, -0.3, 0, halign="right")
+
+
+def _centre(box: Dict[str, float]) -> Tuple[float, float]:
+    return ((box["x0"] + box["x1"]) / 2, (box["y0"] + box["y1"]) / 2)
+
+
+def _local_pins(pins, origin):
+    ox, oy = origin
+    return tuple((name, (round(x - ox, 6), round(y - oy, 6))) for name, (x, y) in pins)
+
+
+# Everything a piece's drawing depends on, so equal keys mean equal pictures.
+def _part_key(part: Part) -> tuple:
+    comp = part.component
+    return ("part", part.kind, comp.kind, comp.model, comp.value, round(part.height, 6),
+            _local_pins(part.pins, part.anchor))
+
+
+def _mcu_key(m: McuBlock) -> tuple:
+    b = m.box
+    centre = _centre(b)
+    return ("mcu", m.component.model, round(b["x1"] - b["x0"], 6), round(b["y1"] - b["y0"], 6),
+            _local_pins(m.left, centre), _local_pins(m.right, centre))
+
+
+def _compose(d: schemdraw.Drawing, netlist: Netlist):
+    d.config(unit=UNIT)
+    layout = Layout(netlist)
+    something = False
+
+    # --- MCU block with only used pins ---
+    if layout.mcu:
+        m = layout.mcu
+        d.add(_pieces.place(_mcu_key(m), lambda sub: _draw_mcu(sub, m), _centre(m.box), unit=UNIT))
+        something = True
+
+    # --- Other components, packed in columns (cached pieces, moved into place) ---
+    for part in layout.parts:
+        d.add(_pieces.place(_part_key(part), lambda sub, p=part: _draw_part(sub, p), part.anchor, unit=UNIT))
+        something = True
+
+    # --- One piece per net (trunks, rows, stubs); a net routed exactly as before reuses it ---
+    for wires, dots in layout.routes:
+        d.add(_pieces.place(("net", tuple(wires), tuple(dots)), lambda sub, w=wires, p=dots: _draw_net(sub, w, p),
+                            (0.0, 0.0), unit=UNIT))
+        something = True
+
+    if not something:
+        d.add(elm.Resistor().label("R"))
+
+
+def render_netlist(netlist, fmt: str = "png") -> bytes:
+    """
+    Render the netlist to image bytes in memory (no temp files).
+    "svg" uses schemdraw's own SVG backend and never builds a matplotlib
+    figure; "png" rasterizes through matplotlib's Agg backend. Results are
+    memoized by Netlist.digest(), and diagrams are assembled from cached
+    sub-drawings (draw.pieces), so a one-component change only draws that
+    part and the nets whose routing moved.
+    """
+    fmt = fmt.lower()
+    netlist = Netlist.coerce(netlist)
+    key = f"{netlist.digest()}.{fmt}"
+    if RENDER_MEMO_ITEMS > 0:
+        cached = _memo.get(key)
+        if cached is not None:
+            return cached
+
+    canvas = "svg" if fmt == "svg" else "matplotlib"
+    with _render_lock:
+        plt = _pyplot() if canvas == "matplotlib" else None
+        # ✅ show=False prevents schemdraw from opening preview window
+        with schemdraw.Drawing(canvas=canvas, show=False) as d:
+            _compose(d, netlist)
+        try:
+            data = d.get_imagedata(fmt)
+        finally:
+            # pyplot keeps every figure alive until closed; long-lived workers leak without this.
+            fig = getattr(getattr(d, "fig", None), "fig", None)
+            if plt is not None and fig is not None:
+                plt.close(fig)
+    if RENDER_MEMO_ITEMS > 0:
+        _memo.set(key, data)
+    return data
+
+
+def render_cache_stats() -> Dict[str, Any]:
+    return {"memo_items": len(_memo), "pieces": _pieces.stats()}
+
+
+def clear_render_caches():
+    _memo.clear()
+    _pieces.clear()
+
+
+def draw_from_netlist(netlist, out_path: Path) -> Path:
     out_path.parent.mkdir(parents=True, exist_ok=True)
-    placements: Dict[str, dict] = {}
-
-    # ✅ show=False prevents schemdraw from opening preview window
-    with schemdraw.Drawing(file=str(out_path), show=False) as d:
-        d.config(unit=3)
-        something = False
-
-        # --- MCU block with only used pins ---
-        mcu = next((c for c in netlist.get("components", []) if c.get("type") == "microcontroller"), None)
-        used_pins = set()
-        for a, b in netlist.get("connections", []):
-            if ":" in a:
-                used_pins.add(a.split(":", 1)[1])
-            if ":" in b:
-                used_pins.add(b.split(":", 1)[1])
-
-        if mcu:
-            model = (mcu.get("model") or "")
-            box = _draw_rect(d, (0.0, 0.0), 10.0, 8.0, title=model)
-            placements[mcu["id"]] = {"type": "mcu", "box": box, "pins": {}}
-            something = True
-
-            left_candidates = ["GND", "3.3V", "5V", "RESET"]
-            right_candidates = ["D0", "D1", "D2", "D3", "D4", "D5", "D6", "D7", "D8", "D9", "D10", "D11", "D12", "D13"]
-
-            if "esp32" in model.lower():
-                left_candidates = ["GND", "5V"]
-                right_candidates = [
-                    "CAM_PWDN", "CAM_SIOD", "CAM_SIOC", "CAM_XCLK",
-                    "CAM_D0", "CAM_D1", "CAM_D2", "CAM_D3",
-                    "CAM_D4", "CAM_D5", "CAM_D6", "CAM_D7"
-                ]
-
-            left_pins = [p for p in left_candidates if p in used_pins]
-            right_pins = [p for p in right_candidates if p in used_pins]
-
-            total_left = max(1, len(left_pins))
-            for i, pname in enumerate(left_pins):
-                y = box["y1"] - (i + 1) * ((box["y1"] - box["y0"]) / (total_left + 1))
-                x = box["x0"]
-                d.add(elm.Line().at((x, y)).to((x - 1.2, y)))
-                _pin_label(d, (x, y), pname, -1.4, 0)
-                placements[mcu["id"]]["pins"][pname] = (x - 1.2, y)
-
-            total_right = max(1, len(right_pins))
-            for i, pname in enumerate(right_pins):
-                y = box["y1"] - (i + 1) * ((box["y1"] - box["y0"]) / (total_right + 1))
-                x = box["x1"]
-                d.add(elm.Line().at((x, y)).to((x + 1.2, y)))
-                _pin_label(d, (x, y), pname, 1.4, 0)
-                placements[mcu["id"]]["pins"][pname] = (x + 1.2, y)
-
-        # --- Place other components ---
-        grid_x, grid_y, step_y = 14.0, 8.0, 3.0
-        next_row = 0
-
-        def place(comp):
-            nonlocal next_row, something
-            ctype = (comp.get("type") or "").lower()
-            cid = comp.get("id") or f"C{next_row+1}"
-            pos = (grid_x, grid_y - next_row * step_y)
-            next_row += 1
-
-            if ctype == "resistor":
-                d.add(elm.Resistor().at(pos).right().label(comp.get("value", "")))
-                placements[cid] = {"type": "resistor", "anchor": pos}; something = True
-            elif ctype == "led":
-                d.add(elm.LED().at(pos).right().label("LED"))
-                placements[cid] = {"type": "led", "anchor": pos}; something = True
-            elif ctype == "button":
-                d.add(elm.Switch().at(pos).right().label("Button"))
-                placements[cid] = {"type": "button", "anchor": pos}; something = True
-            elif ctype in ("battery", "voltage_source"):
-                d.add(elm.SourceV().at(pos).down().label(comp.get("value", "V")))
-                placements[cid] = {"type": "voltage_source", "anchor": pos}; something = True
-            elif ctype == "camera_module":
-                bx, by = pos; w, h = 3.0, 2.0
-                d.add(elm.Line().at((bx - w/2, by - h/2)).to((bx + w/2, by - h/2)))
-                d.add(elm.Line().at((bx + w/2, by - h/2)).to((bx + w/2, by + h/2)))
-                d.add(elm.Line().at((bx + w/2, by + h/2)).to((bx - w/2, by + h/2)))
-                d.add(elm.Line().at((bx - w/2, by + h/2)).to((bx - w/2, by - h/2)))
-                d.add(elm.Label().at((bx, by + h/2 + 0.3)).label(comp.get("model", "CAM")))
-                placements[cid] = {"type": "camera", "anchor": pos}; something = True
-            elif ctype == "gnd":
-                d.add(elm.Ground().at(pos))
-                placements[cid] = {"type": "gnd", "anchor": pos}; something = True
-            else:
-                bx, by = pos; w, h = 3.0, 2.0
-                d.add(elm.Line().at((bx - w/2, by - h/2)).to((bx + w/2, by - h/2)))
-                d.add(elm.Line().at((bx + w/2, by - h/2)).to((bx + w/2, by + h/2)))
-                d.add(elm.Line().at((bx + w/2, by + h/2)).to((bx - w/2, by + h/2)))
-                d.add(elm.Line().at((bx - w/2, by + h/2)).to((bx - w/2, by - h/2)))
-                d.add(elm.Label().at((bx, by + h/2 + 0.4)).label(ctype or "blk"))
-                placements[cid] = {"type": "block", "anchor": pos}; something = True
-
-        for c in netlist.get("components", []):
-            if (c.get("type") or "").lower() == "microcontroller":
-                continue
-            place(c)
-
-        def pin_xy(ref):
-            if ":" not in ref:
-                return None
-            cid, pin = ref.split(":", 1)
-            pd = placements.get(cid)
-            if not pd:
-                return None
-            t = pd.get("type")
-            if t == "mcu":
-                return pd["pins"].get(pin)
-            ax, ay = pd.get("anchor", (0.0, 0.0))
-            if t in ("resistor", "led", "button"):
-                return (ax, ay) if pin in ("1", "+", "in", "a") else (ax + 2.0, ay)
-            if t == "voltage_source":
-                return (ax, ay) if pin in ("+", "pos", "1") else (ax, ay - 2.0)
-            if t == "camera":
-                return (ax - 0.6, ay)
-            if t == "gnd":
-                return (ax, ay)
-            return (ax, ay)
-
-        for a, b in netlist.get("connections", []):
-            p1, p2 = pin_xy(a), pin_xy(b)
-            if p1 and p2:
-                d.add(elm.Line().at(p1).tox(p2[0]))
-                d.add(elm.Line().at((p2[0], p1[1])).toy(p2[1]))
-                d.add(elm.Dot().at(p2))
-                something = True
-
-        if not something:
-            d.add(elm.Resistor().label("R"))
-
+    out_path.write_bytes(render_netlist(netlist, out_path.suffix.lstrip(".") or "png"))
     return out_path
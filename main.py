@@ -1,26 +1,34 @@
-import os, uuid
-from pathlib import Path
-from typing import Optional
-from datetime import timedelta
+import time
+_IMPORT_STARTED = time.perf_counter()   # cold-start clock, see pipeline.warmup
 
-from fastapi import FastAPI
+import json, asyncio
+from typing import Optional, Literal, List
+
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse, Response, PlainTextResponse
 from pydantic import BaseModel
 
-from google.cloud import storage   # ✅ GCS client
-
-from netlist.llm import call_gemini_for_netlist, call_gemini_for_explanation, call_gemini_for_arduino
-from netlist.rules import rule_based_netlist
-from draw.render import draw_from_netlist
-
-# Optional .env
+# Optional .env (loaded before pipeline modules read their settings)
 try:
     from dotenv import load_dotenv
     load_dotenv()
 except Exception:
     pass
 
+from pipeline.generate import generate_coalesced, generate_events, single_flight, render_cache_stats, RenderFailed
+from pipeline.executors import shutdown_executors
+from pipeline.batch import generate_batch, BATCH_MAX_ITEMS
+from utils.cache import result_cache
+from utils.similar import prompt_index
+from utils.metrics import REGISTRY, TimingMiddleware
+from netlist.client import configure_client, get_client
+from blobstore.backends import get_backend, CONTENT_TYPES
+from draw.pool import start_render_pool, stop_render_pool, get_render_pool
+from pipeline.warmup import startup, warm_up, WARMUP_ENABLED
+
+startup.mark_imported(_IMPORT_STARTED)
+
 app = FastAPI(title="Text-to-Circuit API", version="1.0.0")
 
 # CORS (allow local frontend dev)
@@ -30,73 +38,129 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
+# Per-stage Server-Timing header, request histograms and slow-request logs.
+app.add_middleware(TimingMiddleware)
 
 class GenRequest(BaseModel):
     query: str
     force_fallback: Optional[bool] = None
+    one_shot: Optional[bool] = None   # single combined LLM call (default: ONE_SHOT_DEFAULT env)
+    fast_path: Optional[bool] = None  # answer locally when the rules cover the prompt (default: FAST_PATH_DEFAULT env)
+    image_format: Literal["png", "svg", "both"] = "png"   # "both": image_url is SVG, png_url is PNG
+
+class BatchRequest(BaseModel):
+    queries: List[str]
+    force_fallback: Optional[bool] = None
+    one_shot: Optional[bool] = None
+    fast_path: Optional[bool] = None
+    image_format: Literal["png", "svg", "both"] = "png"
 
 
 @app.get("/", response_class=HTMLResponse)
 async def home():
-    return "<h3>Text-to-Circuit API</h3><p>POST /generate with JSON { query, force_fallback? }</p>"
+    return (
+        "<h3>Text-to-Circuit API</h3><p>POST /generate with JSON { query, force_fallback?, one_shot?, fast_path?, image_format? }</p>"
+        "<p>POST /generate/stream streams stages as SSE (Accept: text/event-stream) or NDJSON</p>"
+        "<p>POST /generate/batch with JSON { queries: [...], force_fallback?, one_shot?, fast_path?, image_format? }</p>"
+    )
 
 @app.get("/health")
 async def health():
-    return {"ok": True, "gemini": bool(os.getenv("GEMINI_API_KEY"))}
-
-def upload_to_gcs(local_file: Path, bucket_name: str) -> str:
-    storage_client = storage.Client()
-    bucket = storage_client.bucket(bucket_name)
-
-    # Unique file path inside folder
-    blob_name = f"circuit_images/{uuid.uuid4().hex}.png"
-    blob = bucket.blob(blob_name)
-
-    # Upload file
-    blob.upload_from_filename(str(local_file))
-
-    # Return public URL (works because bucket is public)
-    return f"https://storage.googleapis.com/{bucket_name}/{blob_name}"
+    pool = get_render_pool()
+    return {
+        "ok": True,
+        "gemini": get_client().available(),
+        "llm": get_client().stats(),   # per model: breaker state, p50/p95, budget, hedges
+        "cache": result_cache.stats(),
+        "similar": prompt_index.stats(),
+        "coalesce": single_flight.stats(),
+        "render_pool": pool.stats() if pool else None,
+        "render_cache": render_cache_stats(),   # memoized images and cached part drawings
+    }
+
+@app.get("/ready")
+async def ready():
+    # Readiness/startup probe: 503 until warm-up has finished.
+    return JSONResponse(startup.stats(), status_code=200 if startup.ready else 503)
+
+@app.get("/metrics")
+async def metrics():
+    # Prometheus text exposition format.
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/images/{name}")
+async def image(name: str):
+    # Serves images for the local/memory storage backends (content-addressed, so cache forever).
+    data = get_backend().get(name)
+    if data is None:
+        return JSONResponse({"error": "Not found"}, status_code=404)
+    ext = name.rsplit(".", 1)[-1]
+    return Response(data, media_type=CONTENT_TYPES.get(ext, "application/octet-stream"),
+                    headers={"Cache-Control": "public, max-age=31536000, immutable"})
+
+@app.on_event("startup")
+async def _startup():
+    # Configure the shared Gemini client once instead of on every call.
+    configure_client()
+    # Warm render processes (RENDER_POOL_SIZE > 0); they import matplotlib/schemdraw once.
+    start_render_pool()
+    # Heavy imports, font cache and clients load in the background; /ready reports when done.
+    if WARMUP_ENABLED:
+        app.state.warmup = asyncio.create_task(warm_up())
+    else:
+        startup.mark_ready()
+
+@app.on_event("shutdown")
+async def _shutdown():
+    task = getattr(app.state, "warmup", None)
+    if task is not None and not task.done():
+        task.cancel()
+    stop_render_pool()
+    prompt_index.save()
+    shutdown_executors()
 
 
 @app.post("/generate")
 async def generate(req: GenRequest):
-    # Step 1: Generate netlist
-    netlist = None
-    if not req.force_fallback:
-        netlist = call_gemini_for_netlist(req.query)
-    if not netlist:
-        netlist = rule_based_netlist(req.query)
-
-    # Step 2: Generate explanation & Arduino code
-    explanation = call_gemini_for_explanation(req.query, netlist) or "Explanation unavailable."
-    arduino_code = call_gemini_for_arduino(req.query, netlist) or "// Arduino code unavailable."
-
-    # Step 3: Draw image locally
-    out_dir = Path(__file__).resolve().parent / "_out"
-    out_dir.mkdir(parents=True, exist_ok=True)
-    out_file = out_dir / f"circuit_{uuid.uuid4().hex}.png"
-
     try:
-        draw_from_netlist(netlist, out_file)
-    except Exception as e:
-        print("⚠️ Draw failed:", e)
+        # Identical requests already in flight share one computation.
+        result = await generate_coalesced(req.query, req.force_fallback, req.one_shot, req.image_format,
+                                          req.fast_path)
+    except RenderFailed:
         return JSONResponse({"error": "Failed to render image"}, status_code=500)
-
-    # Step 4: Upload to GCS and get signed URL
-    bucket_name = os.getenv("GCS_BUCKET", "circuit-image-storage")  # set in .env
-    try:
-        image_url = upload_to_gcs(out_file, bucket_name)
-    except Exception as e:
-        print("⚠️ GCS upload failed:", e)
-        image_url = ""
-        
-    print(f"Image uploaded to: {image_url}")
-
-    # Step 5: Return only what frontend needs
-    return JSONResponse({
-        "image_url": image_url,
-        "explanation": explanation,
-        "arduino_code": arduino_code
-    })
\ No newline at end of file
+    finally:
+        startup.mark_first_generate()
+
+    # Return only what frontend needs
+    return JSONResponse(result)
+
+
+@app.post("/generate/stream")
+async def generate_stream(req: GenRequest, request: Request):
+    """
+    Emit each stage as soon as it is ready. Server-sent events when the client
+    accepts text/event-stream, NDJSON ({"event", "data"} per line) otherwise.
+    """
+    sse = "text/event-stream" in request.headers.get("accept", "")
+
+    async def body():
+        async for ev in generate_events(req.query, req.force_fallback, req.image_format, req.fast_path):
+            payload = json.dumps(ev["data"], ensure_ascii=False)
+            if sse:
+                yield f"event: {ev['event']}\ndata: {payload}\n\n"
+            else:
+                yield json.dumps(ev, ensure_ascii=False) + "\n"
+
+    media_type = "text/event-stream" if sse else "application/x-ndjson"
+    return StreamingResponse(body(), media_type=media_type, headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.post("/generate/batch")
+async def generate_batch_endpoint(req: BatchRequest):
+    if len(req.queries) > BATCH_MAX_ITEMS:
+        return JSONResponse({"error": f"At most {BATCH_MAX_ITEMS} queries per batch"}, status_code=413)
+    results = await generate_batch(req.queries, req.force_fallback, req.one_shot, req.image_format,
+                                   fast_path=req.fast_path)
+    return JSONResponse({"results": results})
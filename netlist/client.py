@@ -0,0 +1,401 @@
+import os, time, asyncio, threading, contextlib, importlib.util
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+# google.generativeai takes about a second to import (grpc, protobuf), so it
+# is only located here and imported when the client is first used or warmed.
+try:
+    _GEMINI_IMPORTED = importlib.util.find_spec("google.generativeai") is not None
+except Exception:
+    _GEMINI_IMPORTED = False
+genai = None
+
+from utils.metrics import LLM_SECONDS, LLM_FAILURES, LLM_HEDGES
+from netlist.resilience import ModelGuard, CircuitOpen, QueueTimeout, LLM_QUEUE_TIMEOUT
+
+
+class TokenBucket:
+    """
+    Async token bucket: `rate` tokens per second, up to `burst` stored.
+    acquire() waits for a token instead of letting the provider reject us.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self) -> bool:
+        self._refill()
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        return False
+
+    def ready(self) -> bool:
+        self._refill()
+        return self._tokens >= 1
+
+    async def acquire(self):
+        while True:
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class GeminiBackend:
+    """Real backend: genai is configured once and model handles are reused."""
+
+    def __init__(self, api_key: Optional[str]):
+        self.api_key = api_key
+        self._models: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+        self._configured = False
+
+    def available(self) -> bool:
+        return bool(_GEMINI_IMPORTED and self.api_key)
+
+    def _genai(self):
+        global genai
+        with self._lock:
+            if genai is None:
+                import google.generativeai as genai
+            if not self._configured:
+                genai.configure(api_key=self.api_key)
+                self._configured = True
+        return genai
+
+    def model(self, name: str):
+        m = self._models.get(name)
+        if m is None:
+            m = self._models[name] = self._genai().GenerativeModel(name)
+        return m
+
+    def warm(self, *model_names: str):
+        """Import and configure genai and create the model handles ahead of the first request."""
+        if self.available():
+            for name in model_names:
+                self.model(name)
+
+
+class _FakeResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class _FakeModel:
+    def __init__(self, backend: "FakeBackend", name: str):
+        self.backend = backend
+        self.name = name
+
+    async def generate_content_async(self, parts, stream: bool = False, **kwargs):
+        self.backend.calls += 1
+        latency = self.backend.latency
+        if callable(latency):
+            latency = latency(self.name, parts)
+        if latency:
+            await asyncio.sleep(latency)
+        text = self.backend.responder(self.name, parts)
+        if stream:
+            return self._chunks(text)
+        return _FakeResponse(text)
+
+    async def _chunks(self, text: str):
+        size = self.backend.chunk_size
+        for i in range(0, len(text), size):
+            await asyncio.sleep(0)
+            yield _FakeResponse(text[i:i + size])
+
+
+class FakeBackend:
+    """
+    Offline stand-in for benchmarks and local runs. `responder(model_name, parts)`
+    returns the reply text; `latency` simulates provider round-trip time
+    (seconds, or a `latency(model_name, parts)` function for jitter).
+    """
+
+    def __init__(self, responder: Optional[Callable[[str, List[str]], str]] = None, latency: Any = 0.0,
+                 chunk_size: int = 32):
+        self.responder = responder or (lambda name, parts: "")
+        self.latency = latency
+        self.chunk_size = chunk_size
+        self.calls = 0
+
+    def available(self) -> bool:
+        return True
+
+    def model(self, name: str):
+        return _FakeModel(self, name)
+
+    def warm(self, *model_names: str):
+        pass
+
+
+class LLMClient:
+    """
+    Long-lived LLM client shared by all requests. Limits in-flight calls with a
+    semaphore and optionally paces them with a token bucket (LLM_RATE_PER_S);
+    each model gets a ModelGuard (latency budget, hedging, circuit breaker).
+    """
+
+    def __init__(self, backend, max_concurrency: int = 8, rate_per_s: float = 0.0, burst: int = 1):
+        self.backend = backend
+        self.max_concurrency = max_concurrency
+        self.rate_per_s = rate_per_s
+        self.burst = burst
+        self._loop = None
+        self._sem: Optional[asyncio.Semaphore] = None
+        self._bucket: Optional[TokenBucket] = None
+        self._guards: Dict[str, ModelGuard] = {}
+
+    def available(self) -> bool:
+        return self.backend.available()
+
+    def warm(self, *model_names: str):
+        """Blocking; see GeminiBackend.warm."""
+        warm = getattr(self.backend, "warm", None)
+        if warm is not None:
+            warm(*model_names)
+
+    def _primitives(self):
+        # asyncio primitives are tied to one loop; rebuild them if a new loop
+        # (e.g. a CLI asyncio.run or a test client) starts using the client.
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop = loop
+            self._sem = asyncio.Semaphore(self.max_concurrency)
+            self._bucket = TokenBucket(self.rate_per_s, self.burst) if self.rate_per_s > 0 else None
+        return self._sem, self._bucket
+
+    def guard(self, model_name: str) -> ModelGuard:
+        g = self._guards.get(model_name)
+        if g is None:
+            g = self._guards[model_name] = ModelGuard(model_name)
+        return g
+
+    def degraded(self, *model_names: str) -> bool:
+        """True while the breaker of any of these models is open."""
+        return any(self.guard(name).breaker.degraded() for name in model_names)
+
+    def stats(self) -> Dict[str, Any]:
+        return {name: g.stats() for name, g in self._guards.items()}
+
+    def _slot_free(self) -> bool:
+        sem, bucket = self._primitives()
+        return not sem.locked() and (bucket is None or bucket.ready())
+
+    @contextlib.asynccontextmanager
+    async def _slot(self, model_name: str, wait: bool = True):
+        """
+        Hold one of our concurrency slots (and a rate token) for a call.
+        Raises QueueTimeout after LLM_QUEUE_TIMEOUT, or at once when `wait`
+        is False and none is free.
+        """
+        sem, bucket = self._primitives()
+        deadline = time.monotonic() + LLM_QUEUE_TIMEOUT
+        if not wait and sem.locked():
+            raise QueueTimeout(f"{model_name}: no free slot")
+        try:
+            await asyncio.wait_for(sem.acquire(), LLM_QUEUE_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise QueueTimeout(f"{model_name}: no free slot after {LLM_QUEUE_TIMEOUT:g}s") from None
+        try:
+            if bucket is not None and not bucket.try_acquire():
+                remaining = deadline - time.monotonic()
+                if not wait or remaining <= 0:
+                    raise QueueTimeout(f"{model_name}: rate limited")
+                try:
+                    await asyncio.wait_for(bucket.acquire(), remaining)
+                except asyncio.TimeoutError:
+                    raise QueueTimeout(f"{model_name}: rate limited for {LLM_QUEUE_TIMEOUT:g}s") from None
+            yield
+        finally:
+            sem.release()
+
+    async def _attempt(self, model_name: str, parts: List[str], guard: ModelGuard, budget: float,
+                       sent: Optional[asyncio.Future] = None, wait: bool = True) -> str:
+        """
+        One call. `budget` counts from when it is sent, not while it waits
+        for a slot; `sent` is resolved at that moment.
+        """
+        model = self.backend.model(model_name)
+        start = time.perf_counter()
+        try:
+            async with self._slot(model_name, wait):
+                if sent is not None and not sent.done():
+                    sent.set_result(None)
+                # Provider latency only: waiting for our own slot doesn't count.
+                sent_at = time.perf_counter()
+                if hasattr(model, "generate_content_async"):
+                    call = model.generate_content_async(parts)
+                else:
+                    call = asyncio.to_thread(model.generate_content, parts)
+                resp = await asyncio.wait_for(call, budget)
+                guard.latency.add(time.perf_counter() - sent_at)
+            return (resp.text or "").strip()
+        except QueueTimeout:
+            if wait:
+                LLM_FAILURES.inc(model=model_name, reason="queue_timeout")
+            raise
+        except asyncio.TimeoutError:
+            LLM_FAILURES.inc(model=model_name, reason="timeout")
+            raise
+        except Exception:
+            LLM_FAILURES.inc(model=model_name, reason="error")
+            raise
+        finally:
+            LLM_SECONDS.observe(time.perf_counter() - start, model=model_name)
+
+    async def _hedged(self, model_name: str, parts: List[str], guard: ModelGuard, sent: asyncio.Future) -> str:
+        """
+        One attempt, plus a duplicate if the first is still running the
+        model's p95 after it was sent and one of our slots is free; the first
+        successful answer wins, the other is cancelled. Both share one budget
+        that starts when the first attempt is sent (`sent` is resolved then).
+        """
+        delay = guard.hedge_after()
+        budget = guard.budget()
+        first = asyncio.ensure_future(self._attempt(model_name, parts, guard, budget, sent))
+        tasks = [first]
+        try:
+            if delay is not None:
+                # The hedge clock starts once the first call leaves our queue.
+                await asyncio.wait([first, sent], return_when=asyncio.FIRST_COMPLETED)
+                done = {first} if first.done() else (await asyncio.wait(tasks, timeout=delay))[0]
+                if not done:
+                    if self._slot_free():
+                        guard.hedges += 1
+                        LLM_HEDGES.inc(model=model_name, outcome="fired")
+                        tasks.append(asyncio.ensure_future(
+                            self._attempt(model_name, parts, guard, max(0.0, budget - delay), wait=False)))
+                    else:
+                        # Every slot is busy: a duplicate would only queue behind them.
+                        LLM_HEDGES.inc(model=model_name, outcome="skipped")
+            pending = set(tasks)
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for t in done:
+                    if t.exception() is None:
+                        if t is not first:
+                            guard.hedge_wins += 1
+                            LLM_HEDGES.inc(model=model_name, outcome="won")
+                        return t.result()
+                    if t is first or error is None:
+                        error = t.exception()
+            raise error
+        finally:
+            sent.cancel()
+            for t in tasks:
+                t.cancel()
+
+    async def generate(self, model_name: str, parts: List[str]) -> str:
+        """
+        Completion text. Bounded by the model's latency budget from when the
+        call is sent and hedged (see ModelGuard); raises CircuitOpen without
+        calling while the model's breaker is open, and QueueTimeout if no
+        local slot frees up (which doesn't count against the breaker). Being
+        cancelled after the call was sent counts as a failure.
+        """
+        guard = self.guard(model_name)
+        if not guard.breaker.allow():
+            LLM_FAILURES.inc(model=model_name, reason="circuit_open")
+            raise CircuitOpen(f"{model_name} circuit breaker is open")
+        sent = asyncio.get_running_loop().create_future()
+        try:
+            text = await self._hedged(model_name, parts, guard, sent)
+        except QueueTimeout:
+            guard.breaker.release()
+            raise
+        except asyncio.CancelledError:
+            # The caller gave up first (e.g. a stage timeout shorter than our
+            # budget). If the model had the call, that is as much a failure as
+            # our own timeout; otherwise it never got a chance.
+            if sent.done() and not sent.cancelled():
+                LLM_FAILURES.inc(model=model_name, reason="cancelled")
+                guard.breaker.failure()
+            else:
+                guard.breaker.release()
+            raise
+        except Exception:
+            guard.breaker.failure()
+            raise
+        guard.breaker.success()
+        return text
+
+    async def stream(self, model_name: str, parts: List[str]) -> AsyncIterator[str]:
+        """
+        Yield text chunks as the model produces them (one chunk if the backend
+        cannot stream). Shares the model's breaker; not hedged, since chunks
+        already went out to the client. The caller bounds the total time.
+        """
+        guard = self.guard(model_name)
+        if not guard.breaker.allow():
+            LLM_FAILURES.inc(model=model_name, reason="circuit_open")
+            raise CircuitOpen(f"{model_name} circuit breaker is open")
+        model = self.backend.model(model_name)
+        start = time.perf_counter()
+        sent = False
+        try:
+            async with self._slot(model_name):
+                sent = True
+                if not hasattr(model, "generate_content_async"):
+                    resp = await asyncio.to_thread(model.generate_content, parts)
+                    if resp.text:
+                        yield resp.text
+                else:
+                    resp = await model.generate_content_async(parts, stream=True)
+                    async for chunk in resp:
+                        try:
+                            text = chunk.text
+                        except ValueError:
+                            # Chunk without text parts (e.g. safety metadata only).
+                            continue
+                        if text:
+                            yield text
+        except QueueTimeout:
+            LLM_FAILURES.inc(model=model_name, reason="queue_timeout")
+            guard.breaker.release()
+            raise
+        except asyncio.CancelledError:
+            if sent:
+                LLM_FAILURES.inc(model=model_name, reason="cancelled")
+                guard.breaker.failure()
+            else:
+                guard.breaker.release()
+            raise
+        except Exception:
+            LLM_FAILURES.inc(model=model_name, reason="error")
+            guard.breaker.failure()
+            raise
+        finally:
+            LLM_SECONDS.observe(time.perf_counter() - start, model=model_name)
+        guard.breaker.success()
+
+
+_client: Optional[LLMClient] = None
+
+
+def configure_client(backend=None) -> LLMClient:
+    """Build the shared client. Called once at startup; pass a backend to inject a fake."""
+    global _client
+    if backend is None:
+        backend = GeminiBackend(os.getenv("GEMINI_API_KEY"))
+    _client = LLMClient(
+        backend,
+        max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "8")),
+        rate_per_s=float(os.getenv("LLM_RATE_PER_S", "0")),
+        burst=int(os.getenv("LLM_BURST", "4")),
+    )
+    return _client
+
+
+def get_client() -> LLMClient:
+    return _client or configure_client()
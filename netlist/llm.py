@@ -1,14 +1,11 @@
-import os, json
-from typing import Optional, Dict, Any
-from utils.json_extract import extract_json_block
-
-try:
-    import google.generativeai as genai
-    _GEMINI_IMPORTED = True
-except Exception:
-    genai = None
-    _GEMINI_IMPORTED = False
+import json
+from typing import Optional, Dict, Any, AsyncIterator, List
+from utils.json_extract import extract_json
+from netlist.client import get_client
+from utils.metrics import JSON_FAILURES
 
+NETLIST_MODEL = "gemini-2.5-flash"
+TEXT_MODEL = "gemini-1.5-flash"
 
 NETLIST_JSON_EXAMPLE = {
     "components": [
@@ -27,74 +24,177 @@ NETLIST_JSON_EXAMPLE = {
 }
 
 
-def call_gemini_for_netlist(prompt_text: str) -> Optional[Dict[str, Any]]:
-    api_key = os.getenv("GEMINI_API_KEY")
-    if not (_GEMINI_IMPORTED and api_key):
+# Serialized once; it is part of every netlist prompt.
+_NETLIST_EXAMPLE_JSON = json.dumps(NETLIST_JSON_EXAMPLE)
+
+_NETLIST_SYS_PROMPT = (
+    "You are a netlist generator. Return ONLY JSON with keys 'components' and 'connections', "
+    "and a short 'explanation'. Each component: {id, type, value?, model?}. For microcontrollers include "
+    "model exactly (e.g., 'ESP32-CAM' or 'Arduino Uno'). Connections are pairs like "
+    "['U1:5V','V1:+'] or ['U1:D13','R1:1']. The 'explanation' should be step-by-step (2-10 lines). "
+    "No extra prose outside JSON."
+)
+
+
+def gemini_available() -> bool:
+    return get_client().available()
+
+
+async def call_gemini_for_netlist(prompt_text: str) -> Optional[Dict[str, Any]]:
+    client = get_client()
+    if not client.available():
         return None
     try:
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel("gemini-2.5-flash")
-        sys_prompt = (
-            "You are a netlist generator. Return ONLY JSON with keys 'components' and 'connections', "
-            "and a short 'explanation'. Each component: {id, type, value?, model?}. For microcontrollers include "
-            "model exactly (e.g., 'ESP32-CAM' or 'Arduino Uno'). Connections are pairs like "
-            "['U1:5V','V1:+'] or ['U1:D13','R1:1']. The 'explanation' should be step-by-step (2-10 lines). "
-            "No extra prose outside JSON."
-        )
-        user_text = f"User request: {prompt_text}\n\nSchema example: {json.dumps(NETLIST_JSON_EXAMPLE)}"
-        resp = model.generate_content([sys_prompt, user_text])
-        raw = (resp.text or "").strip()
-        jtxt = extract_json_block(raw)
-        if not jtxt:
-            return None
-        data = json.loads(jtxt)
-        if isinstance(data, dict) and "components" in data:
-            return data
-    except Exception:
+        user_text = f"User request: {prompt_text}\n\nSchema example: {_NETLIST_EXAMPLE_JSON}"
+        raw = await client.generate(NETLIST_MODEL, [_NETLIST_SYS_PROMPT, user_text])
+        data = extract_json(raw, lambda obj: _usable_netlist(obj) is not None)
+    except Exception as e:
+        print("⚠️ Gemini netlist call failed:", e or type(e).__name__)
+        return None
+    if data is None:
+        JSON_FAILURES.inc(stage="netlist")
         return None
-    return None
+    netlist = _usable_netlist(data)
+    if "explanation" in data:
+        netlist["explanation"] = data["explanation"]
+    return netlist
+
+
+def _explanation_prompt(netlist: Dict, query: str) -> List[str]:
+    sys_prompt = (
+        f"You are an electronics instructor. Explain the given circuit netlist and {query} step-by-step. "
+        "Write in clear, numbered steps (max 10). Avoid JSON, only natural language."
+    )
+    return [sys_prompt, f"Netlist: {json.dumps(netlist)}"]
 
 
-def call_gemini_for_explanation(netlist: Dict, query:str) -> str:
+def _arduino_prompt(netlist: Dict, query: str) -> List[str]:
+    sys_prompt = (
+        f"You are an Arduino code generator. Write a complete sketch (C++ for Arduino IDE) based on the netlist and {query}. "
+        "Handle Arduino Uno, ESP32-CAM, sensors, actuators, LEDs, buttons, etc. "
+        "Return ONLY valid Arduino C++ code, no markdown formatting."
+    )
+    return [sys_prompt, f"Netlist: {json.dumps(netlist)}"]
+
+
+async def call_gemini_for_explanation(netlist: Dict, query:str) -> str:
     """
     Ask Gemini to generate a human-readable explanation from the given netlist.
     """
-    api_key = os.getenv("GEMINI_API_KEY")
-    if not (_GEMINI_IMPORTED and api_key):
+    client = get_client()
+    if not client.available():
         return "Explanation unavailable (Gemini API not configured)."
 
     try:
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel("gemini-1.5-flash")
-        sys_prompt = (
-            f"You are an electronics instructor. Explain the given circuit netlist and {query} step-by-step. "
-            "Write in clear, numbered steps (max 10). Avoid JSON, only natural language."
-        )
-        user_text = f"Netlist: {json.dumps(netlist)}"
-        resp = model.generate_content([sys_prompt, user_text])
-        return (resp.text or "Explanation unavailable.").strip()
+        return (await client.generate(TEXT_MODEL, _explanation_prompt(netlist, query))) or "Explanation unavailable."
     except Exception as e:
+        print("⚠️ Gemini explanation call failed:", e or type(e).__name__)
         return f"Explanation generation failed: {e}"
 
 
-def call_gemini_for_arduino(netlist: Dict,query:str) -> str:
+async def call_gemini_for_arduino(netlist: Dict,query:str) -> str:
     """
     Ask Gemini to generate an Arduino IDE compatible sketch from the netlist.
     """
-    api_key = os.getenv("GEMINI_API_KEY")
-    if not (_GEMINI_IMPORTED and api_key):
+    client = get_client()
+    if not client.available():
         return "// Arduino code unavailable (Gemini API not configured)."
 
     try:
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel("gemini-1.5-flash")
-        sys_prompt = (
-            f"You are an Arduino code generator. Write a complete sketch (C++ for Arduino IDE) based on the netlist and {query}. "
-            "Handle Arduino Uno, ESP32-CAM, sensors, actuators, LEDs, buttons, etc. "
-            "Return ONLY valid Arduino C++ code, no markdown formatting."
-        )
-        user_text = f"Netlist: {json.dumps(netlist)}"
-        resp = model.generate_content([sys_prompt, user_text])
-        return (resp.text or "// Code unavailable.").strip()
+        return (await client.generate(TEXT_MODEL, _arduino_prompt(netlist, query))) or "// Code unavailable."
     except Exception as e:
+        print("⚠️ Gemini Arduino call failed:", e or type(e).__name__)
         return f"// Arduino code generation failed: {e}"
+
+
+
+async def stream_gemini_for_explanation(netlist: Dict, query: str) -> AsyncIterator[str]:
+    """
+    Streaming variant of call_gemini_for_explanation: yields text chunks as
+    Gemini produces them. Yields nothing when Gemini is not configured;
+    errors propagate so the caller can fall back.
+    """
+    client = get_client()
+    if not client.available():
+        return
+    async for chunk in client.stream(TEXT_MODEL, _explanation_prompt(netlist, query)):
+        yield chunk
+
+
+async def stream_gemini_for_arduino(netlist: Dict, query: str) -> AsyncIterator[str]:
+    """Streaming variant of call_gemini_for_arduino."""
+    client = get_client()
+    if not client.available():
+        return
+    async for chunk in client.stream(TEXT_MODEL, _arduino_prompt(netlist, query)):
+        yield chunk
+
+
+_ONE_SHOT_SYS_PROMPT = (
+    "You are a circuit assistant. Return ONLY one JSON object with keys 'components', 'connections', "
+    "'explanation' and 'arduino_code'. Each component: {id, type, value?, model?}. For microcontrollers include "
+    "model exactly (e.g., 'ESP32-CAM' or 'Arduino Uno'). Connections are pairs like "
+    "['U1:5V','V1:+'] or ['U1:D13','R1:1']. 'explanation' is a step-by-step guide as numbered lines (max 10). "
+    "'arduino_code' is a complete Arduino IDE sketch as a single string with setup() and loop(), no markdown. "
+    "No extra prose outside JSON."
+)
+
+
+def _usable_netlist(data: Any) -> Optional[Dict[str, Any]]:
+    """
+    {"components", "connections"} keeping only well-formed entries, or None
+    when no component survives. A reply cut off mid-list still yields the
+    parts that made it through.
+    """
+    if not isinstance(data, dict) or not isinstance(data.get("components"), list):
+        return None
+    comps = [c for c in data["components"]
+             if isinstance(c, dict) and isinstance(c.get("id"), str) and c["id"]
+             and isinstance(c.get("type"), str) and c["type"]]
+    if not comps:
+        return None
+    conns = data.get("connections")
+    conns = [list(pair) for pair in conns
+             if isinstance(pair, list) and len(pair) == 2 and all(isinstance(p, str) for p in pair)] \
+        if isinstance(conns, list) else []
+    return {"components": comps, "connections": conns}
+
+
+_ONE_SHOT_KEYS = {"components", "explanation", "arduino_code"}
+
+
+def _valid_text(value: Any) -> bool:
+    return isinstance(value, str) and bool(value.strip())
+
+
+def _valid_sketch(value: Any) -> bool:
+    return _valid_text(value) and "setup" in value and "loop" in value
+
+
+async def call_gemini_one_shot(prompt_text: str) -> Dict[str, Any]:
+    """
+    Ask for netlist, explanation and sketch in a single round trip.
+    Returns {"netlist", "explanation", "arduino_code"}; any part that is
+    missing or fails validation is None so the caller can fall back per stage.
+    """
+    result: Dict[str, Any] = {"netlist": None, "explanation": None, "arduino_code": None}
+    client = get_client()
+    if not client.available():
+        return result
+    try:
+        user_text = f"User request: {prompt_text}\n\nSchema example: {_NETLIST_EXAMPLE_JSON}"
+        raw = await client.generate(NETLIST_MODEL, [_ONE_SHOT_SYS_PROMPT, user_text])
+        data = extract_json(raw, lambda obj: isinstance(obj, dict) and bool(_ONE_SHOT_KEYS & obj.keys()))
+    except Exception as e:
+        print("⚠️ Gemini one-shot call failed:", e or type(e).__name__)
+        return result
+    if data is None:
+        JSON_FAILURES.inc(stage="one_shot")
+        return result
+
+    result["netlist"] = _usable_netlist(data)
+    if _valid_text(data.get("explanation")):
+        result["explanation"] = data["explanation"].strip()
+    if _valid_sketch(data.get("arduino_code")):
+        result["arduino_code"] = data["arduino_code"].strip()
+    return result
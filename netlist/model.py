@@ -0,0 +1,201 @@
+import sys, json, hashlib
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+
+class NetlistError(ValueError):
+    pass
+
+
+class Pin:
+    """One "CID:PIN" reference, split once. `ref` is interned so equal refs share one string."""
+
+    __slots__ = ("ref", "component", "name")
+
+    def __init__(self, ref: str):
+        self.ref = sys.intern(ref)
+        if ":" in ref:
+            cid, name = ref.split(":", 1)
+        else:
+            cid, name = ref, ""
+        self.component = sys.intern(cid)
+        self.name = sys.intern(name)
+
+    def __repr__(self):
+        return f"Pin({self.ref!r})"
+
+
+class Component:
+    __slots__ = ("id", "type", "kind", "value", "model", "extra")
+
+    def __init__(self, id: Optional[str], type: str, value: Optional[str] = None,
+                 model: Optional[str] = None, extra: Optional[Dict[str, Any]] = None):
+        self.id = sys.intern(id) if id else id
+        self.type = type
+        self.kind = (type or "").lower()
+        self.value = value
+        self.model = model
+        self.extra = extra
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Component":
+        extra = {k: v for k, v in data.items() if k not in ("id", "type", "value", "model")}
+        cid = data.get("id")
+        return cls(
+            str(cid) if cid not in (None, "") else None,
+            str(data.get("type") or ""),
+            data.get("value"),
+            data.get("model"),
+            extra or None,
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {}
+        if self.id is not None:
+            out["id"] = self.id
+        out["type"] = self.type
+        if self.value is not None:
+            out["value"] = self.value
+        if self.model is not None:
+            out["model"] = self.model
+        if self.extra:
+            out.update(self.extra)
+        return out
+
+    def __repr__(self):
+        return f"Component({self.id!r}, {self.type!r})"
+
+
+class Netlist:
+    """
+    Parsed netlist shared by every stage. Indexes are built once here:
+    components by id, connections by pin ref, pins used per component and
+    electrical nets (union-find over connections). to_dict() returns the
+    same JSON shape the API has always used.
+    """
+
+    __slots__ = ("components", "connections", "explanation", "by_id", "mcu",
+                 "_pins", "_by_pin", "_pins_by_component", "_nets", "_digest")
+
+    def __init__(self, components: List[Component], connections: List[Tuple[Pin, Pin]],
+                 explanation: Optional[str] = None):
+        self.components = components
+        self.connections = connections
+        self.explanation = explanation
+        self.by_id: Dict[str, Component] = {c.id: c for c in components if c.id}
+        self.mcu = next((c for c in components if c.kind == "microcontroller"), None)
+        self._pins: Dict[str, Pin] = {}
+        self._by_pin: Dict[str, List[Pin]] = {}
+        self._pins_by_component: Dict[str, Set[str]] = {}
+        for a, b in connections:
+            for p, other in ((a, b), (b, a)):
+                self._pins[p.ref] = p
+                self._by_pin.setdefault(p.ref, []).append(other)
+                if p.name:
+                    self._pins_by_component.setdefault(p.component, set()).add(p.name)
+        self._nets: Optional[Dict[str, int]] = None
+        self._digest: Optional[str] = None
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Netlist":
+        """
+        Validate and index a netlist dict. Raises NetlistError if the overall
+        shape is wrong; individual malformed connection entries are dropped.
+        """
+        if not isinstance(data, dict):
+            raise NetlistError("netlist must be an object")
+        comps = data.get("components", [])
+        conns = data.get("connections", [])
+        if not isinstance(comps, list) or not isinstance(conns, list):
+            raise NetlistError("'components' and 'connections' must be lists")
+
+        components = [Component.from_dict(c) for c in comps if isinstance(c, dict)]
+        interned: Dict[str, Pin] = {}
+
+        def pin(ref: str) -> Pin:
+            p = interned.get(ref)
+            if p is None:
+                p = interned[ref] = Pin(ref)
+            return p
+
+        connections = [
+            (pin(pair[0]), pin(pair[1]))
+            for pair in conns
+            if isinstance(pair, (list, tuple)) and len(pair) == 2
+            and isinstance(pair[0], str) and isinstance(pair[1], str)
+        ]
+        explanation = data.get("explanation")
+        return cls(components, connections, explanation if isinstance(explanation, str) else None)
+
+    @classmethod
+    def coerce(cls, netlist) -> "Netlist":
+        return netlist if isinstance(netlist, Netlist) else cls.from_dict(netlist)
+
+    def to_dict(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {
+            "components": [c.to_dict() for c in self.components],
+            "connections": [[a.ref, b.ref] for a, b in self.connections],
+        }
+        if self.explanation is not None:
+            out["explanation"] = self.explanation
+        return out
+
+    # --- lookups ---
+
+    def component(self, cid: str) -> Optional[Component]:
+        return self.by_id.get(cid)
+
+    def pin(self, ref: str) -> Optional[Pin]:
+        return self._pins.get(ref)
+
+    def pins_of(self, cid: str) -> Set[str]:
+        """Pin names of `cid` that appear in at least one connection."""
+        return self._pins_by_component.get(cid, set())
+
+    def is_connected(self, ref: str) -> bool:
+        return ref in self._by_pin
+
+    def neighbors(self, ref: str) -> List[Pin]:
+        return self._by_pin.get(ref, [])
+
+    def _build_nets(self) -> Dict[str, int]:
+        parent: Dict[str, str] = {}
+
+        def find(x: str) -> str:
+            parent.setdefault(x, x)
+            while parent[x] != x:
+                parent[x] = parent[parent[x]]
+                x = parent[x]
+            return x
+
+        for a, b in self.connections:
+            ra, rb = find(a.ref), find(b.ref)
+            if ra != rb:
+                parent[ra] = rb
+        roots: Dict[str, int] = {}
+        return {ref: roots.setdefault(find(ref), len(roots)) for ref in parent}
+
+    def nets(self) -> List[List[Pin]]:
+        """Electrically connected pin groups, in order of first appearance."""
+        if self._nets is None:
+            self._nets = self._build_nets()
+        groups: List[List[Pin]] = [[] for _ in range(len(set(self._nets.values())))]
+        for ref, idx in self._nets.items():
+            groups[idx].append(self._pins[ref])
+        return groups
+
+    def net_of(self, ref: str) -> Optional[int]:
+        if self._nets is None:
+            self._nets = self._build_nets()
+        return self._nets.get(ref)
+
+    def digest(self) -> str:
+        """
+        Canonical sha256 of components and connections. Connection order and
+        pin order inside a pair don't change the circuit, so both are sorted.
+        """
+        if self._digest is None:
+            comps = sorted(json.dumps(c.to_dict(), sort_keys=True, ensure_ascii=False) for c in self.components)
+            conns = sorted(sorted((a.ref, b.ref)) for a, b in self.connections)
+            blob = json.dumps({"components": comps, "connections": conns}, separators=(",", ":"), ensure_ascii=False)
+            self._digest = hashlib.sha256(blob.encode("utf-8")).hexdigest()
+        return self._digest
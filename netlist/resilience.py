@@ -0,0 +1,153 @@
+import os, time, asyncio, threading
+from collections import deque
+from typing import Any, Dict, Optional
+
+from utils.metrics import LLM_BREAKER_STATE
+
+# Per-model guards for Gemini calls: a rolling latency window that sets the
+# call budget and the hedge delay, and a circuit breaker that stops calling a
+# model which keeps failing so requests go straight to the local fallbacks.
+
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT_S", "30"))              # hard cap per call
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT_S", "30"))  # waiting for our own slot
+LLM_MIN_TIMEOUT = float(os.getenv("LLM_MIN_TIMEOUT_S", "5"))
+LLM_TIMEOUT_FACTOR = float(os.getenv("LLM_TIMEOUT_P95_FACTOR", "4"))
+LLM_HEDGE = os.getenv("LLM_HEDGE", "1").lower() in ("1", "true", "yes")
+LLM_HEDGE_MIN = float(os.getenv("LLM_HEDGE_MIN_S", "0.5"))
+LLM_LATENCY_WINDOW = int(os.getenv("LLM_LATENCY_WINDOW", "200"))
+LLM_MIN_SAMPLES = int(os.getenv("LLM_MIN_SAMPLES", "20"))
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN_S", "30"))
+
+_STATE_VALUES = {"closed": 0, "half_open": 1, "open": 2}
+
+
+class CircuitOpen(Exception):
+    """Raised instead of calling a model whose breaker is open."""
+
+
+class QueueTimeout(asyncio.TimeoutError):
+    """No local concurrency slot or rate token in time; the model itself was never called."""
+
+
+class LatencyWindow:
+    """Last `size` successful call durations (seconds) of one model."""
+
+    def __init__(self, size: int = LLM_LATENCY_WINDOW, min_samples: int = LLM_MIN_SAMPLES):
+        self.min_samples = min_samples
+        self._values: "deque[float]" = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float):
+        with self._lock:
+            self._values.append(seconds)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Nearest-rank quantile, or None until min_samples calls were seen."""
+        with self._lock:
+            if len(self._values) < self.min_samples:
+                return None
+            ordered = sorted(self._values)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Breaker:
+    """
+    Opens after `failures` consecutive failures. After `cooldown` seconds one
+    trial call is let through (half-open): success closes the breaker, a
+    failure opens it for another cooldown.
+    """
+
+    def __init__(self, model: str, failures: int = LLM_BREAKER_FAILURES, cooldown: float = LLM_BREAKER_COOLDOWN):
+        self.model = model
+        self.failures = failures
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.consecutive = 0
+        self.opened_at = 0.0
+        self.opened = 0                       # times it has opened
+        self._lock = threading.Lock()
+        LLM_BREAKER_STATE.set(0, model=model)
+
+    def _set(self, state: str):
+        self.state = state
+        LLM_BREAKER_STATE.set(_STATE_VALUES[state], model=self.model)
+
+    def degraded(self) -> bool:
+        """Open or half-open with the cooldown running: calls would be refused."""
+        return self.state != "closed" and time.monotonic() - self.opened_at < self.cooldown
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            now = time.monotonic()
+            if now - self.opened_at < self.cooldown:
+                return False
+            # One trial per cooldown; restarting the clock keeps the others out.
+            self.opened_at = now
+            self._set("half_open")
+            return True
+
+    def release(self):
+        """The allowed call never reached the model: a half-open trial may run again."""
+        with self._lock:
+            if self.state == "half_open":
+                self.opened_at = time.monotonic() - self.cooldown
+
+    def success(self):
+        with self._lock:
+            self.consecutive = 0
+            if self.state != "closed":
+                print(f"⚠️ Gemini {self.model} recovered, closing circuit breaker")
+                self._set("closed")
+
+    def failure(self):
+        with self._lock:
+            self.consecutive += 1
+            if self.state == "half_open" or (self.state == "closed" and self.consecutive >= self.failures):
+                if self.state == "closed":
+                    print(f"⚠️ Gemini {self.model} failed {self.consecutive} times in a row, opening circuit breaker")
+                self.opened_at = time.monotonic()
+                self.opened += 1
+                self._set("open")
+
+
+class ModelGuard:
+    """Latency window + breaker for one model, and the budgets derived from them."""
+
+    def __init__(self, model: str):
+        self.model = model
+        self.latency = LatencyWindow()
+        self.breaker = Breaker(model)
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def budget(self) -> float:
+        """Seconds a sent call may take: a multiple of the observed p95, within [min, cap]."""
+        p95 = self.latency.quantile(0.95)
+        if p95 is None:
+            return LLM_TIMEOUT
+        return min(LLM_TIMEOUT, max(LLM_MIN_TIMEOUT, p95 * LLM_TIMEOUT_FACTOR))
+
+    def hedge_after(self) -> Optional[float]:
+        """Seconds after sending after which a duplicate call is fired, or None (no hedging yet)."""
+        if not LLM_HEDGE:
+            return None
+        p95 = self.latency.quantile(0.95)
+        return None if p95 is None else max(LLM_HEDGE_MIN, p95)
+
+    def stats(self) -> Dict[str, Any]:
+        p50, p95 = self.latency.quantile(0.5), self.latency.quantile(0.95)
+        hedge = self.hedge_after()
+        return {
+            "breaker": self.breaker.state,
+            "consecutive_failures": self.breaker.consecutive,
+            "opened": self.breaker.opened,
+            "p50_s": None if p50 is None else round(p50, 3),
+            "p95_s": None if p95 is None else round(p95, 3),
+            "budget_s": round(self.budget(), 3),
+            "hedge_after_s": None if hedge is None else round(hedge, 3),
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+        }
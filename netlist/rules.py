@@ -1,57 +1,355 @@
+import json
+import os
 import re
-from typing import Dict, Any
-
-def rule_based_netlist(query: str) -> Dict[str, Any]:
-    t = (query or "").lower()
-    components = []
-    connections = []
-
-    # ESP32-CAM detection
-    is_esp32cam = bool(re.search(r"\besp32[\s-]?cam\b|\besp32\b", t))
-    if is_esp32cam:
-        components += [
-            {"id": "U1", "type": "microcontroller", "model": "ESP32-CAM"},
-            {"id": "CAM1", "type": "camera_module", "model": "OV2640"},
-            {"id": "V1", "type": "voltage_source", "value": "5V"},
-            {"id": "GND", "type": "gnd"},
-        ]
-        connections += [["V1:+","U1:5V"],["V1:-","U1:GND"],["V1:+","CAM1:5V"],["CAM1:GND","U1:GND"]]
-        for p in ["PWDN","SIOD","SIOC","XCLK","D0","D1","D2","D3","D4","D5","D6","D7"]:
-            connections.append([f"U1:CAM_{p}", f"CAM1:{p}"])
-        explanation = (
-            "Use ESP32-CAM (U1) powered by a stable 5V supply. "
-            "Connect OV2640 (CAM1) camera pins (SIOD/SIOC/XCLK/D0..D7) to ESP32 camera pins. "
-            "Tie grounds together. Flash camera streaming firmware and view the stream in a browser."
-        )
-        return {"components": components, "connections": connections, "explanation": explanation}
-
-    # Generic Arduino/LED/Button detection
-    volt = 5
-    m = re.search(r"(\d+(?:\.\d+)?)\s*v", t)
-    if m:
-        try: volt = float(m.group(1))
-        except Exception: volt = 5
-    components.append({"id":"V1","type":"voltage_source","value":f"{volt:g}V"})
-
-    if "arduino" in t:
-        components.append({"id":"U1","type":"microcontroller","model":"Arduino Uno"})
-        connections += [["V1:+","U1:5V"],["V1:-","U1:GND"]]
-
-    if "led" in t:
-        components.append({"id":"D1","type":"led"})
-        # use 220Ω default
-        components.append({"id":"R1","type":"resistor","value":"220Ω"})
-        if "d13" in t:
-            connections += [["U1:D13","R1:1"],["R1:2","D1:+"],["D1:-","U1:GND"]]
+from typing import Any, Dict, List, Optional, Tuple
+
+# Offline fallback: boards, parts and their wiring templates live in
+# rules.json. They are compiled once at import into a token trie, so a query
+# is matched in a single left-to-right pass whose cost depends on the query
+# length, not on how many rules there are.
+
+RULES_PATH = os.getenv("RULES_PATH", os.path.join(os.path.dirname(__file__), "rules.json"))
+
+_TOKEN_RE = re.compile(
+    r"(?P<volt>(?<![a-z0-9.])\d+(?:\.\d+)?)\s*v(?:olts?)?\b"
+    r"|(?P<pin>\b(?:d|gpio|gp|a)\d{1,2}\b|\bpin\s*\d{1,2}\b)"
+    r"|(?P<word>[a-z0-9]+(?:\.\d+)?)"
+)
+_PIN_RE = re.compile(r"(d|gpio|gp|a|pin)\s*(\d+)")
+_COUNTS = {"two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7, "eight": 8}
+MAX_COUNT = 8
+_END = ""   # trie key marking "a keyword ends here"
+_GPIO_KINDS = ("digital", "analog", "pwm")
+
+
+def _tokens(text: str) -> List[Tuple[str, str]]:
+    """(kind, text) per token; kind is "volt", "pin" or "word"."""
+    return [(m.lastgroup, m.group(0)) for m in _TOKEN_RE.finditer(text.lower())]
+
+
+def _plural(tok: str) -> str:
+    return tok + ("es" if tok.endswith(("s", "x", "ch", "sh")) else "s")
+
+
+class Rules:
+    """Compiled form of rules.json: keyword trie plus board/part tables."""
+
+    def __init__(self, data: Dict[str, Any]):
+        power = data.get("power") or {}
+        self.power_id: str = power.get("id", "V1")
+        self.default_volts: float = float(power.get("default_volts", 5))
+        self.explanation: str = data.get("fallback_explanation", "")
+        self.filler: set = set(data.get("filler_words", []))
+        self.boards: Dict[str, Dict[str, Any]] = {}
+        self.parts: Dict[str, Dict[str, Any]] = {}
+        self.part_order: Dict[str, int] = {}
+        self.trie: Dict[str, Any] = {}
+
+        for board in data.get("boards", []):
+            self.boards[board["name"]] = board
+            self._add_keywords(("board", board["name"]), board.get("keywords", []), plural=False)
+        for i, part in enumerate(data.get("parts", [])):
+            self.parts[part["name"]] = part
+            self.part_order[part["name"]] = i
+            self._add_keywords(("part", part["name"]), part.get("keywords", []), plural=True)
+
+    def _add_keywords(self, target: Tuple[str, str], keywords: List[str], plural: bool):
+        for kw in keywords:
+            toks = [t for _, t in _tokens(kw)]
+            if not toks:
+                continue
+            variants = [toks]
+            if plural:
+                variants.append(toks[:-1] + [_plural(toks[-1])])
+            for seq in variants:
+                node = self.trie
+                for tok in seq:
+                    node = node.setdefault(tok, {})
+                if _END in node and node[_END] != target:
+                    print(f"⚠️ Rule keyword '{kw}' is claimed by both {node[_END][1]} and {target[1]}")
+                node.setdefault(_END, target)
+
+    def longest(self, toks: List[str], i: int) -> Tuple[Optional[Tuple[str, str]], int]:
+        """Longest keyword starting at toks[i]: (target, tokens consumed)."""
+        node, found, n = self.trie, None, 0
+        for j in range(i, len(toks)):
+            node = node.get(toks[j])
+            if node is None:
+                break
+            if _END in node:
+                found, n = node[_END], j - i + 1
+        return found, n
+
+
+def load_rules(path: str = RULES_PATH) -> Rules:
+    with open(path, "r", encoding="utf-8") as f:
+        return Rules(json.load(f))
+
+
+RULES = load_rules()
+
+
+class RuleMatch:
+    """Everything one pass over a query found."""
+
+    __slots__ = ("board", "parts", "pins", "attached", "volts", "tokens", "matched", "filler")
+
+    def __init__(self):
+        self.board: Optional[Dict[str, Any]] = None
+        self.parts: Dict[str, int] = {}              # part name -> count, first-seen order
+        self.pins: List[str] = []                    # raw pin mentions, e.g. "d13", "pin 4"
+        self.attached: Dict[str, List[str]] = {}     # part name -> pin mentions next to it
+        self.volts: Optional[float] = None
+        self.tokens = 0
+        self.matched = 0                             # tokens consumed by keywords, pins, volts, counts
+        self.filler = 0                              # tokens that carry no circuit meaning
+
+    @property
+    def coverage(self) -> float:
+        """
+        Share of the meaningful tokens the rules understood, 0..1. 1.0 means
+        nothing in the query was left unexplained; 0.0 when no board or part
+        was recognized at all.
+        """
+        if self.board is None and not self.parts:
+            return 0.0
+        content = self.tokens - self.filler
+        return min(1.0, self.matched / content) if content > 0 else 1.0
+
+
+def match_rules(query: str, rules: Optional[Rules] = None) -> RuleMatch:
+    rules = rules or RULES
+    tokens = _tokens(query or "")
+    kinds = [k for k, _ in tokens]
+    toks = [t for _, t in tokens]
+    res = RuleMatch()
+    res.tokens = len(toks)
+    exclusive = None
+    last_part: Optional[str] = None
+    pending: List[str] = []
+    unknown: List[str] = []
+
+    i = 0
+    while i < len(toks):
+        target, n = rules.longest(toks, i)
+        if target is not None:
+            kind, name = target
+            res.matched += n
+            if kind == "board":
+                board = rules.boards[name]
+                if board.get("exclusive") and exclusive is None:
+                    exclusive = board
+                if res.board is None:
+                    res.board = board
+            else:
+                prev = toks[i - 1] if i else ""
+                count = int(prev) if prev.isdigit() else _COUNTS.get(prev, 1)
+                if i and (prev.isdigit() or prev in _COUNTS) and kinds[i - 1] == "word":
+                    res.matched += 1
+                res.parts[name] = max(res.parts.get(name, 0), min(max(count, 1), MAX_COUNT))
+                last_part = name
+                if pending:
+                    res.attached.setdefault(name, []).extend(pending)
+                    pending = []
+            i += n
+            continue
+
+        tok = toks[i]
+        if kinds[i] == "volt":
+            res.matched += 1
+            if res.volts is None:
+                res.volts = float(re.match(r"[\d.]+", tok).group(0))
+        elif kinds[i] == "pin":
+            res.matched += 1
+            res.pins.append(tok)
+            if last_part:
+                res.attached.setdefault(last_part, []).append(tok)
+            else:
+                pending.append(tok)
+        elif tok in rules.filler or tok.isdigit():
+            # A bare number means nothing without a unit or pin prefix.
+            res.filler += 1
         else:
-            connections += [["V1:+","R1:1"],["R1:2","D1:+"],["D1:-","V1:-"]]
+            unknown.append(tok)
+        i += 1
 
-    if re.search(r"\b(button|switch)\b", t):
-        components.append({"id":"S1","type":"button"})
-        if "d2" in t:
-            connections += [["S1:1","U1:D2"],["S1:2","U1:GND"]]
+    if exclusive is not None:
+        res.board = exclusive
+    if res.board is not None and res.board.get("covers"):
+        # Words the board's template already answers ("esp32 cam stream").
+        res.matched += sum(tok in res.board["covers"] for tok in unknown)
+    return res
+
+
+def _board_pin(board: Dict[str, Any], mention: str) -> str:
+    m = _PIN_RE.match(mention)
+    if not m:
+        return mention.upper()
+    prefix, n = m.group(1), int(m.group(2))
+    if prefix == "a":
+        return f"A{n}"
+    return board.get("pin_format", "D{n}").format(n=n)
+
+
+def _has_pin_slot(pair: List[str]) -> bool:
+    return any("{PIN" in p or "{SDA}" in p or "{SCL}" in p for p in pair)
+
+
+class _Builder:
+    def __init__(self, rules: Rules, res: RuleMatch):
+        self.rules = rules
+        self.res = res
+        self.components: List[Dict[str, Any]] = []
+        self.connections: List[List[str]] = []
+        self.counters: Dict[str, int] = {}
+        self.used: set = set()
+
+    def new_id(self, prefix: str) -> str:
+        n = self.counters.get(prefix, 0) + 1
+        self.counters[prefix] = n
+        return f"{prefix}{n}"
+
+    def take(self, pin: str) -> bool:
+        if pin in self.used:
+            return False
+        self.used.add(pin)
+        return True
+
+    def wire(self, template: List[List[str]], ctx: Dict[str, str], skip_pins: bool = False):
+        for pair in template:
+            if skip_pins and _has_pin_slot(pair):
+                continue
+            self.connections.append([p.format_map(ctx) for p in pair])
+
+
+def _assign_pins(b: _Builder, board: Dict[str, Any], instances: List[Tuple]):
+    """
+    Give each part instance its signal pins, in three rounds: a preferred pin
+    the query names (LED on D13), then pins mentioned next to the part, then
+    the board's next free pin of the right kind for parts that allow it.
+    """
+    mentioned = {_board_pin(board, p) for p in b.res.pins}
+    for part, need, _, pins in instances:
+        for pin in part.get("prefer", []):
+            if len(pins) < need and pin in mentioned and b.take(pin):
+                pins.append(pin)
+    for part, need, _, pins in instances:
+        for mention in b.res.attached.get(part["name"], []):
+            pin = _board_pin(board, mention)
+            if len(pins) < need and b.take(pin):
+                pins.append(pin)
+    for part, need, _, pins in instances:
+        if len(pins) >= need or not part.get("auto_pin"):
+            continue
+        for pin in board.get(part.get("pin")) or board.get("digital", []):
+            if len(pins) >= need:
+                break
+            if b.take(pin):
+                pins.append(pin)
+
+
+def rule_based_netlist(query: str, match: Optional[RuleMatch] = None) -> Dict[str, Any]:
+    """Netlist for query from the rules; pass `match` to reuse a match_rules result."""
+    rules = RULES
+    res = match if match is not None else match_rules(query, rules)
+    board = res.board
+
+    if board is not None and board.get("exclusive"):
+        return {
+            "components": [dict(c) for c in board["components"]],
+            "connections": [list(c) for c in board["connections"]],
+            "explanation": board.get("explanation", rules.explanation),
+        }
+
+    b = _Builder(rules, res)
+    power = rules.power_id
+    b.counters[power.rstrip("0123456789")] = 1
+    volts = res.volts if res.volts is not None else rules.default_volts
+    b.components.append({"id": power, "type": "voltage_source", "value": f"{volts:g}V"})
+
+    mcu = None
+    if board is not None:
+        mcu = b.new_id("U")
+        b.components.append({"id": mcu, "type": "microcontroller", "model": board.get("model", board["name"])})
+        b.connections += [[f"{power}:+", f"{mcu}:{board.get('supply_pin', '5V')}"],
+                          [f"{power}:-", f"{mcu}:{board.get('gnd_pin', 'GND')}"]]
+
+    # Parts are emitted in rule-file order so output is stable across phrasings.
+    names = sorted(res.parts, key=rules.part_order.__getitem__)
+    instances = []
+    for name in names:
+        part = rules.parts[name]
+        need = int(part.get("pins", 1)) if part.get("pin") in _GPIO_KINDS else 0
+        for _ in range(res.parts[name]):
+            refs = {}
+            for comp in part.get("components", []):
+                cid = b.new_id(comp["ref"])
+                refs[comp["ref"]] = cid
+                b.components.append({"id": cid, **{k: v for k, v in comp.items() if k != "ref"}})
+            instances.append((part, need, refs, []))
+
+    if board is not None:
+        _assign_pins(b, board, instances)
+
+    notes = []
+    steps = []
+    for part, need, refs, pins in instances:
+        ctx = dict(refs, V=power)
+        if board is not None:
+            ctx.update(MCU=mcu, VCC=board.get("power_pin", "5V"), GND=board.get("gnd_pin", "GND"),
+                       **board.get("i2c", {}))
+            ctx.update({f"PIN{i}": p for i, p in enumerate(pins)})
+            if pins:
+                ctx["PIN"] = pins[0]
         else:
-            connections += [["S1:1","V1:+"],["S1:2","V1:-"]]
+            ctx.update(MCU=power, VCC="+", GND="-")
+
+        kind = part.get("pin")
+        wired = board is not None and (
+            (need and len(pins) >= need) or (kind == "i2c" and "SDA" in ctx) or not kind
+        )
+        first = len(b.connections)
+        if wired:
+            b.wire(part.get("mcu", []), ctx)
+        elif part.get("standalone"):
+            b.wire(part["standalone"], ctx)
+        else:
+            # No signal pin to give it: at least power the part.
+            b.wire(part.get("mcu", []), ctx, skip_pins=True)
+        steps.append((wired, _describe(b, refs), b.connections[first:]))
+        if part.get("note") and part["note"] not in notes:
+            notes.append(part["note"])
+
+    explanation = _explain(board, mcu, power, volts, steps, notes, rules)
+    return {"components": b.components, "connections": b.connections, "explanation": explanation}
+
+
+def _describe(b: _Builder, refs: Dict[str, str]) -> str:
+    """"LED D1 + Resistor R1 (220Ω)" for the components of one part instance."""
+    comps = {c["id"]: c for c in b.components}
+    out = []
+    for cid in refs.values():
+        c = comps[cid]
+        kind = c["type"].replace("_", " ")
+        name = c.get("model") or (kind.upper() if len(kind) <= 3 else kind.capitalize())
+        out.append(f"{name} {cid}" + (f" ({c['value']})" if c.get("value") else ""))
+    return " + ".join(out)
+
 
-    explanation = "Fallback: wire power/ground and components as shown in the diagram. Follow the connections list."
-    return {"components": components, "connections": connections, "explanation": explanation}
+def _explain(board: Optional[Dict[str, Any]], mcu: Optional[str], power: str, volts: float,
+             steps: List[Tuple[bool, str, List[List[str]]]], notes: List[str], rules: Rules) -> str:
+    """
+    Step-by-step wiring from the connections just built. Only when every part
+    is wired to a board pin; otherwise the generic fallback text (plus notes),
+    since the diagram leaves some signal unconnected.
+    """
+    if board is None or not all(wired for wired, _, _ in steps):
+        return " ".join([rules.explanation] + notes)
+    lines = [f"Step-by-step wiring for the {board.get('model', board['name'])} ({mcu}):",
+             f"1) Power {mcu} from the {volts:g}V supply {power}: {power}:+ to {mcu}:{board.get('supply_pin', '5V')},"
+             f" {power}:- to {mcu}:{board.get('gnd_pin', 'GND')}."]
+    for _, what, wires in steps:
+        lines.append(f"{len(lines)}) {what}: " + ", ".join(f"{a} to {z}" for a, z in wires) + ".")
+    lines.append(f"{len(lines)}) Keep every ground common with {mcu}:{board.get('gnd_pin', 'GND')}.")
+    lines += notes
+    return "\n".join(lines)
@@ -0,0 +1,112 @@
+import os, sys, json, time, asyncio, argparse
+from typing import Any, Dict, List, Optional
+
+from pipeline.generate import generate_coalesced, RenderFailed
+from utils.cache import normalize_query
+
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "500"))
+
+
+async def generate_batch(queries: List[str], force_fallback: Optional[bool] = None,
+                         one_shot: Optional[bool] = None, image_format: str = "png",
+                         concurrency: int = BATCH_CONCURRENCY,
+                         fast_path: Optional[bool] = None) -> List[Dict[str, Any]]:
+    """
+    Run many prompts through generate_coalesced. Prompts that normalize to the
+    same text are computed once; at most `concurrency` run at a time. Results
+    come back in input order, each with status "ok" or "error".
+    """
+    sem = asyncio.Semaphore(max(1, concurrency))
+
+    async def run_one(query: str) -> Dict[str, Any]:
+        async with sem:
+            try:
+                result = await generate_coalesced(query, force_fallback, one_shot, image_format, fast_path)
+                return {"status": "ok", **result}
+            except RenderFailed:
+                return {"status": "error", "error": "Failed to render image"}
+            except Exception as e:
+                return {"status": "error", "error": f"{type(e).__name__}: {e}"}
+
+    unique: Dict[str, "asyncio.Task[Dict[str, Any]]"] = {}
+    for q in queries:
+        key = normalize_query(q)
+        if key not in unique:
+            unique[key] = asyncio.create_task(run_one(q))
+    try:
+        await asyncio.gather(*unique.values())
+    except BaseException:
+        for t in unique.values():
+            t.cancel()
+        raise
+
+    return [
+        {"index": i, "query": q, **unique[normalize_query(q)].result()}
+        for i, q in enumerate(queries)
+    ]
+
+
+def _read_jsonl(path: str, field: str) -> List[Dict[str, Any]]:
+    rows = []
+    with open(path, encoding="utf-8") if path != "-" else sys.stdin as fh:
+        for line in fh:
+            line = line.strip()
+            if not line:
+                continue
+            row = json.loads(line)
+            if isinstance(row, str):
+                row = {field: row}
+            rows.append(row)
+    return rows
+
+
+async def _run_cli(args) -> int:
+    from netlist.client import configure_client
+    from draw.pool import start_render_pool, stop_render_pool
+
+    rows = _read_jsonl(args.input, args.field)
+    queries = [str(r.get(args.field) or "") for r in rows]
+    configure_client()
+    start_render_pool()
+    t0 = time.perf_counter()
+    try:
+        results = await generate_batch(queries, args.force_fallback or None, args.one_shot or None,
+                                       args.image_format, args.concurrency,
+                                       False if args.no_fast_path else None)
+    finally:
+        stop_render_pool()
+    elapsed = time.perf_counter() - t0
+
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        for row, res in zip(rows, results):
+            # Keep caller ids (e.g. request_id) next to each result.
+            extra = {k: v for k, v in row.items() if k != args.field}
+            out.write(json.dumps({**extra, **res}, ensure_ascii=False) + "\n")
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    failed = sum(r["status"] != "ok" for r in results)
+    print(f"{len(results)} prompts ({len(set(map(normalize_query, queries)))} unique) in {elapsed:.2f}s, "
+          f"{failed} failed", file=sys.stderr)
+    return 1 if failed else 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    p = argparse.ArgumentParser(description="Generate circuits for every prompt in a JSONL file.")
+    p.add_argument("input", help="JSONL file (one object per line), or - for stdin")
+    p.add_argument("-o", "--output", help="write JSONL results here instead of stdout")
+    p.add_argument("--field", default="query", help="key holding the prompt (default: query)")
+    p.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY)
+    p.add_argument("--force-fallback", action="store_true", help="skip Gemini, use the rule-based netlist")
+    p.add_argument("--one-shot", action="store_true", help="single combined LLM call per prompt")
+    p.add_argument("--no-fast-path", action="store_true", help="always ask Gemini, even for prompts the rules cover")
+    p.add_argument("--image-format", choices=["png", "svg", "both"], default="png")
+    args = p.parse_args(argv)
+    return asyncio.run(_run_cli(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,178 @@
+import os, asyncio
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, Type
+
+try:
+    import fcntl
+except ImportError:   # not POSIX: coalescing stays per process
+    fcntl = None
+
+from pipeline.executors import io_executor, run_blocking
+from utils.cache import SqliteCache
+from utils.metrics import COALESCED
+
+# Single-flight: identical requests that arrive while one is being computed
+# wait for it and share its result instead of repeating the LLM calls,
+# render and upload. Within a process the waiters share one task. Across
+# uvicorn workers (COALESCE_DIR set) the leader holds a byte-range lock on a
+# shared lock file and leaves its result in a small SQLite store, where the
+# other workers pick it up once the lock is released.
+
+COALESCE_ENABLED = os.getenv("COALESCE_ENABLED", "1").lower() in ("1", "true", "yes")
+COALESCE_WAIT = float(os.getenv("COALESCE_WAIT_S", "60"))           # longest a follower waits
+COALESCE_DIR = os.getenv("COALESCE_DIR")                            # e.g. /tmp/circuit-coalesce
+COALESCE_RESULT_TTL = float(os.getenv("COALESCE_RESULT_TTL_S", "10"))
+COALESCE_POLL = float(os.getenv("COALESCE_POLL_S", "0.05"))
+
+
+class _Flight:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: "asyncio.Task[Any]"):
+        self.task = task
+        self.waiters = 0
+
+
+class SharedFlights:
+    """
+    Cross-process half: one lock file plus a result store in `directory`.
+    Results (and errors of the `shared_errors` types) stay readable for
+    `result_ttl` seconds after the leader finishes.
+    """
+
+    def __init__(self, directory: str, result_ttl: float = COALESCE_RESULT_TTL,
+                 max_wait: float = COALESCE_WAIT, poll: float = COALESCE_POLL,
+                 shared_errors: Tuple[Type[BaseException], ...] = ()):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_wait = max_wait
+        self.poll = poll
+        self.errors: Dict[str, Type[BaseException]] = {e.__name__: e for e in shared_errors}
+        # POSIX record locks belong to the process and are all dropped when any
+        # descriptor of the file is closed, so keep one descriptor open for good.
+        self._fd = os.open(os.path.join(directory, "flights.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+        self.store = SqliteCache(os.path.join(directory, "flights.sqlite3"), max_bytes=8 * 1024 * 1024,
+                                 ttl=result_ttl)
+
+    @staticmethod
+    def _offset(key: str) -> int:
+        return int(key[:12], 16)
+
+    def _try_lock(self, offset: int) -> bool:
+        try:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB, 1, offset)
+            return True
+        except OSError:
+            return False
+
+    def _unlock(self, offset: int):
+        fcntl.lockf(self._fd, fcntl.LOCK_UN, 1, offset)
+
+    def _unpack(self, stored: Dict[str, Any]) -> Any:
+        if "error" in stored:
+            name, message = stored["error"]
+            raise self.errors[name](message)
+        return stored["value"]
+
+    async def run(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        loop = asyncio.get_running_loop()
+        offset = self._offset(key)
+        deadline = loop.time() + self.max_wait
+        waited = False
+        while not self._try_lock(offset):
+            if loop.time() >= deadline:
+                COALESCED.inc(role="timeout")
+                return await fn()
+            waited = True
+            await asyncio.sleep(self.poll)
+        try:
+            stored = await run_blocking(io_executor, self.store.get, key)
+            # A stored error only answers requests that were waiting on that attempt.
+            if stored is not None and ("value" in stored or waited):
+                COALESCED.inc(role="shared")
+                return self._unpack(stored)
+            if waited:
+                # The other worker gave up without a result; do the work here.
+                COALESCED.inc(role="retry")
+            try:
+                value = await fn()
+            except tuple(self.errors.values()) as e:
+                await run_blocking(io_executor, self.store.set, key, {"error": [type(e).__name__, str(e)]})
+                raise
+            await run_blocking(io_executor, self.store.set, key, {"value": value})
+            return value
+        finally:
+            self._unlock(offset)
+
+
+class SingleFlight:
+    """
+    Runs at most one computation per key at a time. Concurrent callers with
+    the same key get the leader's result or exception; a follower that has
+    waited `max_wait` seconds computes on its own instead. The computation is
+    cancelled only when every caller waiting on it has gone away.
+    """
+
+    def __init__(self, max_wait: float = COALESCE_WAIT, shared: Optional[SharedFlights] = None,
+                 enabled: bool = True):
+        self.max_wait = max_wait
+        self.shared = shared
+        self.enabled = enabled
+        self._flights: Dict[str, _Flight] = {}
+
+    async def _lead(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        if self.shared is None:
+            return await fn()
+        return await self.shared.run(key, fn)
+
+    def _drop(self, key: str, flight: _Flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    async def run(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        if not self.enabled:
+            return await fn()
+        flight = self._flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _Flight(asyncio.ensure_future(self._lead(key, fn)))
+            flight.task.add_done_callback(lambda _t, f=flight: self._drop(key, f))
+            self._flights[key] = flight
+        COALESCED.inc(role="leader" if leader else "follower")
+
+        flight.waiters += 1
+        try:
+            if leader:
+                return await asyncio.shield(flight.task)
+            return await asyncio.wait_for(asyncio.shield(flight.task), self.max_wait)
+        except asyncio.TimeoutError:
+            if flight.task.done():
+                raise   # the computation itself timed out
+            COALESCED.inc(role="timeout")
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                # Everyone waiting on it left (e.g. clients disconnected).
+                self._drop(key, flight)
+                flight.task.cancel()
+        return await fn()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "in_flight": len(self._flights),
+            "waiting": sum(f.waiters for f in self._flights.values()),
+            "shared_dir": self.shared.directory if self.shared else None,
+        }
+
+
+def build_single_flight(shared_errors: Tuple[Type[BaseException], ...] = ()) -> SingleFlight:
+    shared = None
+    if COALESCE_ENABLED and COALESCE_DIR:
+        if fcntl is None:
+            print("⚠️ COALESCE_DIR needs fcntl; coalescing stays per process")
+        else:
+            try:
+                shared = SharedFlights(COALESCE_DIR, shared_errors=shared_errors)
+            except Exception as e:
+                print("⚠️ Cross-process coalescing disabled:", e)
+    return SingleFlight(COALESCE_WAIT, shared, enabled=COALESCE_ENABLED)
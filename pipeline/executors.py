@@ -0,0 +1,49 @@
+import os, asyncio, functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+# Bounded pools so a burst of requests cannot spawn unbounded threads.
+# LLM/network calls are I/O bound. Rendering gets a single thread: schemdraw
+# keeps the drawing being built in module-global state, so two renders in
+# one process must never overlap (draw.pool renders in parallel instead).
+IO_WORKERS = int(os.getenv("IO_WORKERS", "16"))
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", "1"))
+
+io_executor = ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix="io")
+render_executor = ThreadPoolExecutor(max_workers=RENDER_WORKERS, thread_name_prefix="render")
+
+
+async def run_blocking(executor: ThreadPoolExecutor, fn: Callable[..., Any], *args,
+                       timeout: Optional[float] = None, queue_timeout: Optional[float] = None,
+                       **kwargs) -> Any:
+    """
+    Run a blocking callable on the given executor without stalling the event loop.
+    `timeout` counts from when the callable starts running, so time spent
+    queued behind other jobs is not blamed on this one; `queue_timeout`
+    bounds that wait separately. Either raises asyncio.TimeoutError. A
+    running worker thread cannot be interrupted; the caller just stops waiting.
+    """
+    loop = asyncio.get_running_loop()
+    started = loop.create_future()
+
+    def call():
+        loop.call_soon_threadsafe(_mark_started, started)
+        return fn(*args, **kwargs)
+
+    fut = loop.run_in_executor(executor, call)
+    try:
+        await asyncio.wait_for(asyncio.shield(started), queue_timeout)
+    except BaseException:
+        fut.cancel()   # still queued: drop it
+        raise
+    return await asyncio.wait_for(fut, timeout)
+
+
+def _mark_started(started: "asyncio.Future[None]"):
+    if not started.done():
+        started.set_result(None)
+
+
+def shutdown_executors():
+    io_executor.shutdown(wait=False, cancel_futures=True)
+    render_executor.shutdown(wait=False, cancel_futures=True)
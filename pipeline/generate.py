@@ -0,0 +1,455 @@
+import os, sys, asyncio, functools, threading
+from typing import Optional, Dict, Any, AsyncIterator, Callable
+
+from netlist.llm import (
+    call_gemini_for_netlist, call_gemini_for_explanation, call_gemini_for_arduino,
+    call_gemini_one_shot, gemini_available,
+    stream_gemini_for_explanation, stream_gemini_for_arduino, NETLIST_MODEL, TEXT_MODEL,
+)
+from netlist.client import get_client
+from netlist.rules import rule_based_netlist, match_rules
+from netlist.model import Netlist, NetlistError
+from draw.pool import get_render_pool
+from blobstore.backends import store_image
+from utils.explanation import build_explanation, explanation_supported
+from utils.arduino_codegen import to_arduino_sketch, sketch_supported
+from pipeline.executors import io_executor, render_executor, run_blocking
+from utils.cache import result_cache, normalize_query, netlist_hash, make_key
+from utils.similar import prompt_index
+from utils.metrics import span, FALLBACKS, LLM_FAILURES, FAST_PATH, RULE_COVERAGE
+from pipeline.coalesce import build_single_flight
+
+# Per-stage budgets (seconds). A stage that overruns is abandoned and the
+# request carries on with that stage's fallback value.
+NETLIST_TIMEOUT = float(os.getenv("NETLIST_TIMEOUT_S", "30"))
+EXPLANATION_TIMEOUT = float(os.getenv("EXPLANATION_TIMEOUT_S", "30"))
+ARDUINO_TIMEOUT = float(os.getenv("ARDUINO_TIMEOUT_S", "30"))
+RENDER_TIMEOUT = float(os.getenv("RENDER_TIMEOUT_S", "20"))            # once the render has started
+RENDER_QUEUE_TIMEOUT = float(os.getenv("RENDER_QUEUE_TIMEOUT_S", "60"))  # waiting for the render thread
+UPLOAD_TIMEOUT = float(os.getenv("UPLOAD_TIMEOUT_S", "20"))
+ONE_SHOT_TIMEOUT = float(os.getenv("ONE_SHOT_TIMEOUT_S", "45"))
+
+# Default for requests that don't say whether to use the single combined LLM call.
+ONE_SHOT_DEFAULT = os.getenv("ONE_SHOT_DEFAULT", "0").lower() in ("1", "true", "yes")
+
+# Fast path: a prompt the rule engine covers at least this well (see
+# RuleMatch.coverage), and whose parts the local sketch and explanation
+# generators both handle, is answered without any LLM call.
+FAST_PATH_DEFAULT = os.getenv("FAST_PATH_DEFAULT", "1").lower() in ("1", "true", "yes")
+FAST_PATH_THRESHOLD = float(os.getenv("FAST_PATH_THRESHOLD", "0.9"))
+
+
+class RenderFailed(Exception):
+    pass
+
+
+def render_netlist(netlist, fmt: str = "png") -> bytes:
+    # Deferred: schemdraw, and for the first PNG matplotlib (see draw/__init__),
+    # cost up to a second to import, which pipeline.warmup pays in the
+    # background (or the first render does).
+    from draw.render import render_netlist as render
+    return render(netlist, fmt)
+
+
+def render_cache_stats() -> Optional[Dict[str, Any]]:
+    """In-process memo and piece-cache stats; None until the renderer is loaded here."""
+    # The warm-up thread may still be importing it: the module is in
+    # sys.modules before its functions are defined.
+    stats = getattr(sys.modules.get("draw.render"), "render_cache_stats", None)
+    return stats() if stats is not None else None
+
+
+def _llm_text_ok(text: Optional[str], failure_prefix: str) -> bool:
+    # Only cache real model output, never "not configured"/"failed" placeholders.
+    return bool(text) and gemini_available() and not text.startswith(failure_prefix)
+
+
+def _parse_netlist(data: Optional[Dict[str, Any]]) -> Optional[Netlist]:
+    if not data:
+        return None
+    try:
+        netlist = Netlist.from_dict(data)
+    except NetlistError as e:
+        print("⚠️ Invalid netlist from LLM:", e)
+        return None
+    return netlist if netlist.components else None
+
+
+def local_netlist(query: str, fast_path: Optional[bool] = None) -> Optional[Netlist]:
+    """
+    Rule-based netlist when the fast path is on and the rules cover the
+    query, or whenever Gemini's circuit breaker is open; None means the
+    query needs the LLM.
+    """
+    if get_client().degraded(NETLIST_MODEL, TEXT_MODEL):
+        # Gemini keeps failing: answer locally instead of queueing behind it.
+        FAST_PATH.inc(outcome="degraded")
+        return Netlist.from_dict(rule_based_netlist(query))
+    if fast_path is None:
+        fast_path = FAST_PATH_DEFAULT
+    if not fast_path:
+        return None
+    with span("fast_path"):
+        match = match_rules(query)
+        RULE_COVERAGE.observe(match.coverage)
+        if match.coverage < FAST_PATH_THRESHOLD:
+            FAST_PATH.inc(outcome="llm")
+            return None
+        netlist = Netlist.from_dict(rule_based_netlist(query, match))
+        # Full coverage only means the rules built the netlist; the local
+        # sketch and explanation must also handle every part in it, and a
+        # fixed board template (ESP32-CAM) drops any extra parts asked for.
+        exclusive = match.board is not None and match.board.get("exclusive")
+        if (exclusive and match.parts) or not (sketch_supported(netlist) and explanation_supported(netlist)):
+            FAST_PATH.inc(outcome="unsupported")
+            return None
+        FAST_PATH.inc(outcome="local")
+        return netlist
+
+
+async def build_netlist(query: str, force_fallback: Optional[bool] = None) -> Netlist:
+    """
+    LLM netlist (cached per model + normalized query, or reused from a
+    near-duplicate prompt), else the rule-based one. Parsed once here.
+    """
+    data = None
+    if not force_fallback:
+        key = make_key(NETLIST_MODEL, normalize_query(query))
+        data = result_cache.get("netlist", key)
+        if data is None:
+            # Same circuit asked in different words: reuse that netlist.
+            with span("similar"):
+                data = await run_blocking(io_executor, prompt_index.lookup, query)
+            if data is not None:
+                result_cache.set("netlist", key, data)
+        if data is None:
+            with span("netlist"):
+                try:
+                    data = await asyncio.wait_for(call_gemini_for_netlist(query), NETLIST_TIMEOUT)
+                except asyncio.TimeoutError:
+                    print("⚠️ Netlist generation timed out, using rule-based fallback")
+                    LLM_FAILURES.inc(model=NETLIST_MODEL, reason="timeout")
+                    data = None
+            if data:
+                result_cache.set("netlist", key, data)
+                await run_blocking(io_executor, prompt_index.add, query, data)
+    netlist = _parse_netlist(data)
+    if netlist is None:
+        FALLBACKS.inc(stage="netlist")
+        with span("netlist_fallback"):
+            netlist = Netlist.from_dict(rule_based_netlist(query))
+    return netlist
+
+
+async def build_explanation_text(query: str, netlist: Netlist) -> str:
+    key = make_key(TEXT_MODEL, netlist_hash(netlist), normalize_query(query))
+    cached = result_cache.get("explanation", key)
+    if cached is not None:
+        return cached
+    with span("explanation"):
+        try:
+            text = await asyncio.wait_for(call_gemini_for_explanation(netlist.to_dict(), query), EXPLANATION_TIMEOUT)
+        except asyncio.TimeoutError:
+            LLM_FAILURES.inc(model=TEXT_MODEL, reason="timeout")
+            text = None
+    if _llm_text_ok(text, "Explanation generation failed"):
+        result_cache.set("explanation", key, text)
+        return text
+    FALLBACKS.inc(stage="explanation")
+    return build_explanation(netlist)
+
+
+async def build_arduino_code(query: str, netlist: Netlist) -> str:
+    key = make_key(TEXT_MODEL, netlist_hash(netlist), normalize_query(query))
+    cached = result_cache.get("arduino", key)
+    if cached is not None:
+        return cached
+    with span("arduino"):
+        try:
+            code = await asyncio.wait_for(call_gemini_for_arduino(netlist.to_dict(), query), ARDUINO_TIMEOUT)
+        except asyncio.TimeoutError:
+            LLM_FAILURES.inc(model=TEXT_MODEL, reason="timeout")
+            code = None
+    if _llm_text_ok(code, "// Arduino code generation failed"):
+        result_cache.set("arduino", key, code)
+        return code
+    FALLBACKS.inc(stage="arduino")
+    return to_arduino_sketch(netlist)
+
+
+# Which formats to render for each requested image_format. The first one is
+# returned as "image_url", any others as "<fmt>_url".
+IMAGE_FORMATS = {"png": ("png",), "svg": ("svg",), "both": ("svg", "png")}
+
+
+def image_fields(image_format: str) -> Dict[str, str]:
+    fmts = IMAGE_FORMATS.get(image_format, IMAGE_FORMATS["png"])
+    return {fmt: ("image_url" if i == 0 else f"{fmt}_url") for i, fmt in enumerate(fmts)}
+
+
+async def render_and_upload(netlist: Netlist, fmt: str = "png") -> str:
+    """
+    Draw the netlist and upload the image. Raises RenderFailed if drawing
+    fails; an upload failure only yields an empty URL. Identical netlists
+    reuse the previously uploaded image.
+    """
+    key = f"{netlist_hash(netlist)}.{fmt}"
+    cached = result_cache.get("image", key)
+    if cached is not None:
+        return cached
+
+    try:
+        # Out-of-process when the render pool is running, so drawing doesn't hold our GIL.
+        # In-process renders share the one render thread; either way only the drawing
+        # time counts against RENDER_TIMEOUT, and the wait for a worker or the thread
+        # against RENDER_QUEUE_TIMEOUT.
+        pool = get_render_pool()
+        with span(f"render_{fmt}"):
+            if pool is not None:
+                data = await _pool_render(pool, netlist, fmt)
+            else:
+                data = await run_blocking(render_executor, render_netlist, netlist, fmt, timeout=RENDER_TIMEOUT,
+                                          queue_timeout=RENDER_QUEUE_TIMEOUT)
+    except Exception as e:
+        print("⚠️ Draw failed:", e)
+        raise RenderFailed(str(e)) from e
+
+    try:
+        with span(f"upload_{fmt}"):
+            image_url = await run_blocking(io_executor, store_image, data, fmt, timeout=UPLOAD_TIMEOUT)
+    except Exception as e:
+        print("⚠️ Image upload failed:", e)
+        image_url = ""
+
+    if not image_url.startswith("data:"):
+        print(f"Image uploaded to: {image_url}")
+    if image_url:
+        result_cache.set("image", key, image_url)
+    return image_url
+
+
+async def _pool_render(pool, netlist: Netlist, fmt: str) -> bytes:
+    # pool.render only waits on a pipe, so it runs on the I/O threads. The pool
+    # bounds both phases itself (see RenderPool); if this request is cancelled
+    # first, a job still waiting for a worker gives its turn away.
+    abandoned = threading.Event()
+    try:
+        return await asyncio.get_running_loop().run_in_executor(
+            io_executor, functools.partial(pool.render, netlist, fmt, abandoned=abandoned))
+    finally:
+        abandoned.set()
+
+
+async def build_one_shot(query: str) -> Dict[str, Any]:
+    """
+    Netlist, explanation and sketch from one LLM round trip. Each part that
+    is missing or invalid falls back on its own: rule_based_netlist,
+    build_explanation or to_arduino_sketch.
+    """
+    key = make_key("one_shot", NETLIST_MODEL, normalize_query(query))
+    parts = result_cache.get("one_shot", key)
+    if parts is None:
+        with span("one_shot"):
+            try:
+                parts = await asyncio.wait_for(call_gemini_one_shot(query), ONE_SHOT_TIMEOUT)
+            except asyncio.TimeoutError:
+                print("⚠️ One-shot generation timed out, using local fallbacks")
+                LLM_FAILURES.inc(model=NETLIST_MODEL, reason="timeout")
+                parts = {"netlist": None, "explanation": None, "arduino_code": None}
+        if all(parts.values()):
+            result_cache.set("one_shot", key, parts)
+
+    netlist = _parse_netlist(parts["netlist"])
+    if netlist is None:
+        FALLBACKS.inc(stage="netlist")
+        netlist = Netlist.from_dict(rule_based_netlist(query))
+    for field, stage in (("explanation", "explanation"), ("arduino_code", "arduino")):
+        if not parts[field]:
+            FALLBACKS.inc(stage=stage)
+    return {
+        "netlist": netlist,
+        "explanation": parts["explanation"] or build_explanation(netlist),
+        "arduino_code": parts["arduino_code"] or to_arduino_sketch(netlist),
+    }
+
+
+async def _done(value: Any) -> Any:
+    return value
+
+
+async def render_images(netlist: Netlist, image_format: str = "png") -> Dict[str, str]:
+    """Render and upload every format needed for image_format; returns response fields."""
+    fields = image_fields(image_format)
+    urls = await asyncio.gather(*(render_and_upload(netlist, fmt) for fmt in fields))
+    return dict(zip(fields.values(), urls))
+
+
+async def generate_pipeline(query: str, force_fallback: Optional[bool] = None,
+                            one_shot: Optional[bool] = None, image_format: str = "png",
+                            fast_path: Optional[bool] = None) -> Dict[str, Any]:
+    """
+    Netlist first, then explanation, Arduino code and render+upload all in
+    parallel. Latency is roughly netlist time plus the slowest remaining stage.
+    In one-shot mode a single LLM call supplies all three texts and only the
+    render+upload remains. On the fast path (see local_netlist) all three
+    come from local code.
+    """
+    if one_shot is None:
+        one_shot = ONE_SHOT_DEFAULT
+
+    netlist = None if force_fallback else local_netlist(query, fast_path)
+    if netlist is not None:
+        explanation_task = asyncio.create_task(_done(build_explanation(netlist)))
+        arduino_task = asyncio.create_task(_done(to_arduino_sketch(netlist)))
+    elif one_shot and not force_fallback:
+        parts = await build_one_shot(query)
+        netlist = parts["netlist"]
+        explanation_task = asyncio.create_task(_done(parts["explanation"]))
+        arduino_task = asyncio.create_task(_done(parts["arduino_code"]))
+    else:
+        netlist = await build_netlist(query, force_fallback)
+        explanation_task = asyncio.create_task(build_explanation_text(query, netlist))
+        arduino_task = asyncio.create_task(build_arduino_code(query, netlist))
+    image_task = asyncio.create_task(render_images(netlist, image_format))
+    tasks = (explanation_task, arduino_task, image_task)
+
+    try:
+        images = await image_task
+        explanation, arduino_code = await asyncio.gather(explanation_task, arduino_task)
+    except BaseException:
+        # Render failed or the client went away: don't leave LLM calls dangling.
+        for t in tasks:
+            t.cancel()
+        raise
+
+    return {
+        **images,
+        "explanation": explanation,
+        "arduino_code": arduino_code,
+    }
+
+
+single_flight = build_single_flight(shared_errors=(RenderFailed,))
+
+
+def request_key(query: str, force_fallback: Optional[bool] = None, one_shot: Optional[bool] = None,
+                image_format: str = "png", fast_path: Optional[bool] = None) -> str:
+    # Flags as generate_pipeline resolves them, so None and the default coalesce.
+    one_shot = ONE_SHOT_DEFAULT if one_shot is None else bool(one_shot)
+    fast_path = FAST_PATH_DEFAULT if fast_path is None else bool(fast_path)
+    return make_key("generate", normalize_query(query), repr(bool(force_fallback)), repr(one_shot),
+                    image_format, repr(fast_path))
+
+
+async def generate_coalesced(query: str, force_fallback: Optional[bool] = None,
+                             one_shot: Optional[bool] = None, image_format: str = "png",
+                             fast_path: Optional[bool] = None) -> Dict[str, Any]:
+    """
+    generate_pipeline, computed once for identical requests that are in
+    flight at the same time (see pipeline.coalesce). Callers share the
+    returned dict and must not modify it.
+    """
+    key = request_key(query, force_fallback, one_shot, image_format, fast_path)
+    return await single_flight.run(
+        key, lambda: generate_pipeline(query, force_fallback, one_shot, image_format, fast_path))
+
+
+async def _stream_text(event: str, cache_ns: str, query: str, netlist: Netlist,
+                       stream_fn: Callable[..., AsyncIterator[str]], timeout: float,
+                       fallback: str, emit: Callable[[Dict[str, Any]], None]) -> str:
+    """
+    Forward LLM chunks as `<event>_delta` events and return the full text.
+    A stream that times out, fails or yields nothing returns `fallback`
+    instead: a half-written sketch is worse than the local one. The final
+    event always carries the whole text, so clients replace the deltas.
+    """
+    key = make_key(TEXT_MODEL, netlist_hash(netlist), normalize_query(query))
+    cached = result_cache.get(cache_ns, key)
+    if cached is not None:
+        return cached
+
+    chunks = []
+
+    async def consume():
+        async for chunk in stream_fn(netlist.to_dict(), query):
+            chunks.append(chunk)
+            emit({"event": f"{event}_delta", "data": chunk})
+
+    complete = False
+    try:
+        with span(cache_ns):
+            await asyncio.wait_for(consume(), timeout)
+        complete = True
+    except asyncio.TimeoutError:
+        print(f"⚠️ {event} stream timed out")
+        LLM_FAILURES.inc(model=TEXT_MODEL, reason="timeout")
+    except Exception as e:
+        print(f"⚠️ {event} stream failed:", e)
+
+    text = "".join(chunks).strip()
+    if not (complete and text):
+        FALLBACKS.inc(stage=cache_ns)
+        return fallback
+    if gemini_available():
+        result_cache.set(cache_ns, key, text)
+    return text
+
+
+async def generate_events(query: str, force_fallback: Optional[bool] = None,
+                          image_format: str = "png", fast_path: Optional[bool] = None) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Streaming form of generate_pipeline. Yields {"event", "data"} dicts:
+    "netlist" first, then "explanation_delta"/"arduino_code_delta" chunks,
+    and "image_url" (plus "png_url" for "both"), "explanation",
+    "arduino_code" as each stage completes,
+    ending with "done" (or "error" if rendering failed).
+    Fast-path answers have no deltas.
+    """
+    netlist = None if force_fallback else local_netlist(query, fast_path)
+    local = netlist is not None
+    if not local:
+        netlist = await build_netlist(query, force_fallback)
+    yield {"event": "netlist", "data": netlist.to_dict()}
+
+    queue: "asyncio.Queue[Optional[Dict[str, Any]]]" = asyncio.Queue()
+
+    async def stage(event: str, coro):
+        try:
+            value = await coro
+            queue.put_nowait({"event": event, "data": value})
+        except RenderFailed:
+            queue.put_nowait({"event": "error", "data": "Failed to render image"})
+        finally:
+            queue.put_nowait(None)
+
+    if local:
+        tasks = [
+            asyncio.create_task(stage("explanation", _done(build_explanation(netlist)))),
+            asyncio.create_task(stage("arduino_code", _done(to_arduino_sketch(netlist)))),
+        ]
+    else:
+        tasks = [
+            asyncio.create_task(stage("explanation", _stream_text(
+                "explanation", "explanation", query, netlist, stream_gemini_for_explanation,
+                EXPLANATION_TIMEOUT, build_explanation(netlist), queue.put_nowait))),
+            asyncio.create_task(stage("arduino_code", _stream_text(
+                "arduino_code", "arduino", query, netlist, stream_gemini_for_arduino,
+                ARDUINO_TIMEOUT, to_arduino_sketch(netlist), queue.put_nowait))),
+        ]
+    tasks += [
+        asyncio.create_task(stage(field, render_and_upload(netlist, fmt)))
+        for fmt, field in image_fields(image_format).items()
+    ]
+    try:
+        pending = len(tasks)
+        while pending:
+            ev = await queue.get()
+            if ev is None:
+                pending -= 1
+                continue
+            yield ev
+    finally:
+        # Client disconnected or generator closed early: stop the remaining stages.
+        for t in tasks:
+            t.cancel()
+    yield {"event": "done", "data": None}
@@ -0,0 +1,107 @@
+import os, time, asyncio
+from typing import Any, Callable, Dict, Optional
+
+from pipeline.executors import io_executor, render_executor, run_blocking
+from pipeline.generate import render_netlist
+from netlist.client import get_client
+from netlist.llm import NETLIST_MODEL, TEXT_MODEL
+from netlist.model import Netlist
+from netlist.rules import rule_based_netlist
+from draw.pool import get_render_pool
+from blobstore.backends import get_backend
+from utils.metrics import STARTUP_SECONDS
+
+# Cold start: the heavy imports (matplotlib/schemdraw, google.generativeai,
+# google.cloud.storage) are deferred, and this warm-up pays for them in the
+# background right after startup, together with matplotlib's font cache and
+# the storage and Gemini clients. /ready turns 200 once it has finished.
+
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "1").lower() in ("1", "true", "yes")
+WARMUP_FORMATS = tuple(f for f in os.getenv("WARMUP_FORMATS", "png,svg").split(",") if f)
+WARMUP_QUERY = "Arduino Uno with an LED on D13 and a button on D2"
+
+
+class StartupState:
+    """Cold-start milestones in seconds, measured from when main.py started importing."""
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.import_s: Optional[float] = None
+        self.ready_s: Optional[float] = None
+        self.first_generate_s: Optional[float] = None
+        self.steps: Dict[str, float] = {}     # warm-up step -> ms
+        self.errors: Dict[str, str] = {}
+
+    def _mark(self, phase: str) -> float:
+        elapsed = round(time.perf_counter() - self.origin, 3)
+        STARTUP_SECONDS.set(elapsed, phase=phase)
+        return elapsed
+
+    def mark_imported(self, origin: float):
+        self.origin = origin
+        self.import_s = self._mark("import")
+
+    def mark_ready(self):
+        if self.ready_s is None:
+            self.ready_s = self._mark("warmup")
+
+    def mark_first_generate(self):
+        if self.first_generate_s is None:
+            self.first_generate_s = self._mark("first_generate")
+
+    @property
+    def ready(self) -> bool:
+        return self.ready_s is not None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "import_s": self.import_s,
+            "ready_s": self.ready_s,
+            "first_generate_s": self.first_generate_s,
+            "steps_ms": dict(self.steps),
+            "errors": dict(self.errors),
+        }
+
+
+startup = StartupState()
+
+
+async def _step(name: str, fn: Callable[..., Any], *args, executor=io_executor):
+    t = time.perf_counter()
+    try:
+        await run_blocking(executor, fn, *args)
+    except Exception as e:
+        # The service still works; the first request pays for this step instead.
+        startup.errors[name] = f"{type(e).__name__}: {e}"
+        print(f"⚠️ Warm-up step {name} failed:", e)
+    finally:
+        startup.steps[name] = round((time.perf_counter() - t) * 1000.0, 1)
+
+
+def _import_renderer():
+    import draw.render  # noqa: F401
+
+
+async def _warm_render():
+    pool = get_render_pool()
+    if pool is None:
+        await _step("render_import", _import_renderer, executor=render_executor)
+    # Through the pool this also waits for a warm worker.
+    render = pool.render if pool is not None else render_netlist
+    executor = io_executor if pool is not None else render_executor
+    sample = Netlist.from_dict(rule_based_netlist(WARMUP_QUERY))
+    for fmt in WARMUP_FORMATS:
+        await _step(f"render_{fmt}", render, sample, fmt, executor=executor)
+
+
+async def warm_up():
+    """Run every warm-up step (concurrently where they don't compete), then mark ready."""
+    try:
+        await asyncio.gather(
+            _warm_render(),
+            _step("llm_client", get_client().warm, NETLIST_MODEL, TEXT_MODEL),
+            _step("storage", get_backend),
+        )
+    finally:
+        startup.mark_ready()
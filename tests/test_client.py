@@ -0,0 +1,203 @@
+import asyncio, time
+
+import pytest
+
+from netlist import resilience
+from netlist.client import FakeBackend, LLMClient
+from netlist.resilience import Breaker, CircuitOpen, LatencyWindow, ModelGuard, LLM_BREAKER_FAILURES
+
+
+def test_hung_backend_opens_breaker_when_caller_times_out_first():
+    # A stage timeout shorter than the LLM budget cancels the call; a sent
+    # call that never answers must still count against the breaker.
+    client = LLMClient(FakeBackend(latency=100))
+
+    async def main():
+        for _ in range(LLM_BREAKER_FAILURES):
+            with pytest.raises(asyncio.TimeoutError):
+                await asyncio.wait_for(client.generate("m", ["hi"]), 0.05)
+        with pytest.raises(CircuitOpen):
+            await client.generate("m", ["hi"])
+
+    asyncio.run(main())
+    assert client.guard("m").breaker.state == "open"
+
+
+def test_cancel_while_queued_does_not_count():
+    client = LLMClient(FakeBackend(latency=100), max_concurrency=1)
+
+    async def main():
+        busy = asyncio.ensure_future(client.generate("m", ["hi"]))
+        await asyncio.sleep(0.01)
+        for _ in range(LLM_BREAKER_FAILURES):
+            with pytest.raises(asyncio.TimeoutError):
+                await asyncio.wait_for(client.generate("m", ["hi"]), 0.01)
+        busy.cancel()
+        await asyncio.gather(busy, return_exceptions=True)
+
+    asyncio.run(main())
+    assert client.guard("m").breaker.consecutive == 1   # only the call that was sent
+
+
+class Scripted:
+    """Backend whose n-th call takes delays[n] seconds; records cancelled calls."""
+
+    def __init__(self, *delays, fail=()):
+        self.delays = list(delays)
+        self.fail = set(fail)
+        self.calls = 0
+        self.cancelled = 0
+
+    def available(self):
+        return True
+
+    def model(self, name):
+        return self
+
+    async def generate_content_async(self, parts, **kwargs):
+        n = self.calls
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.delays[min(n, len(self.delays) - 1)])
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if n in self.fail:
+            raise RuntimeError(f"call {n} failed")
+        return type("Resp", (), {"text": f"answer {n}"})()
+
+
+def _primed(client: LLMClient, seconds: float) -> "ModelGuard":
+    guard = client.guard("m")
+    for _ in range(guard.latency.min_samples):
+        guard.latency.add(seconds)
+    return guard
+
+
+needs_hedge = pytest.mark.skipif(not resilience.LLM_HEDGE, reason="hedging disabled by LLM_HEDGE")
+
+
+@needs_hedge
+def test_hedge_fires_after_p95_and_first_answer_wins():
+    backend = Scripted(2.0, 0.0)
+    client = LLMClient(backend)
+    guard = _primed(client, 0.1)
+    t = time.monotonic()
+    assert asyncio.run(client.generate("m", ["hi"])) == "answer 1"
+    assert guard.hedge_after() <= time.monotonic() - t < 1.5
+    assert backend.calls == 2 and backend.cancelled == 1   # the slow first call was cancelled
+    assert (guard.hedges, guard.hedge_wins) == (1, 1)
+    assert guard.breaker.consecutive == 0
+
+
+@needs_hedge
+def test_first_call_wins_when_it_answers_before_the_hedge():
+    backend = Scripted(0.7, 5.0)
+    client = LLMClient(backend)
+    guard = _primed(client, 0.1)
+    assert asyncio.run(client.generate("m", ["hi"])) == "answer 0"
+    assert backend.calls == 2 and backend.cancelled == 1   # the hedge lost and was cancelled
+    assert (guard.hedges, guard.hedge_wins) == (1, 0)
+
+
+def test_no_hedge_before_p95_or_without_samples():
+    backend = Scripted(0.2)
+    client = LLMClient(backend)
+    assert asyncio.run(client.generate("m", ["hi"])) == "answer 0"    # no samples yet
+    _primed(client, 0.1)
+    asyncio.run(client.generate("m", ["hi"]))                         # answers before the hedge delay
+    assert backend.calls == 2 and client.guard("m").hedges == 0
+
+
+@needs_hedge
+def test_no_hedge_when_every_slot_is_busy():
+    backend = Scripted(1.0)
+    client = LLMClient(backend, max_concurrency=1)
+    guard = _primed(client, 0.1)
+    assert asyncio.run(client.generate("m", ["hi"])) == "answer 0"
+    assert backend.calls == 1 and guard.hedges == 0
+
+
+def test_hedge_error_does_not_hide_first_answer():
+    backend = Scripted(1.0, 0.0, fail={1})
+    client = LLMClient(backend)
+    _primed(client, 0.1)
+    assert asyncio.run(client.generate("m", ["hi"])) == "answer 0"
+
+
+def test_sent_call_is_bounded_by_budget(monkeypatch):
+    monkeypatch.setattr(resilience, "LLM_MIN_TIMEOUT", 0.2)
+    monkeypatch.setattr(resilience, "LLM_HEDGE", False)
+    backend = Scripted(5.0)
+    client = LLMClient(backend)
+    guard = _primed(client, 0.01)
+    assert guard.budget() == 0.2
+    t = time.monotonic()
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(client.generate("m", ["hi"]))
+    assert time.monotonic() - t < 1.0
+    assert guard.breaker.consecutive == 1
+
+
+def test_budget_is_clamped():
+    guard = ModelGuard("m")
+    assert guard.budget() == resilience.LLM_TIMEOUT        # no samples yet
+    for seconds, expected in [
+        (0.001, resilience.LLM_MIN_TIMEOUT),
+        (1000.0, resilience.LLM_TIMEOUT),
+        (1.5, min(resilience.LLM_TIMEOUT, max(resilience.LLM_MIN_TIMEOUT, 1.5 * resilience.LLM_TIMEOUT_FACTOR))),
+    ]:
+        guard.latency = LatencyWindow(min_samples=3)
+        for _ in range(3):
+            guard.latency.add(seconds)
+        assert guard.budget() == expected
+
+
+def test_breaker_open_half_open_closed():
+    breaker = Breaker("m", failures=2, cooldown=0.1)
+    breaker.failure()
+    assert breaker.state == "closed" and breaker.allow()
+    breaker.failure()
+    assert breaker.state == "open" and not breaker.allow() and breaker.degraded()
+    time.sleep(0.15)
+    assert breaker.allow() and breaker.state == "half_open"
+    assert not breaker.allow()                 # one trial per cooldown
+    breaker.success()
+    assert breaker.state == "closed" and breaker.consecutive == 0 and breaker.allow()
+
+
+def test_breaker_failed_trial_reopens():
+    breaker = Breaker("m", failures=1, cooldown=0.1)
+    breaker.failure()
+    time.sleep(0.15)
+    assert breaker.allow()
+    breaker.failure()
+    assert breaker.state == "open" and breaker.opened == 2 and not breaker.allow()
+
+
+def test_breaker_release_lets_next_trial_through():
+    breaker = Breaker("m", failures=1, cooldown=10)
+    breaker.failure()
+    breaker.opened_at -= 10
+    assert breaker.allow() and not breaker.allow()
+    breaker.release()                          # the trial never reached the model
+    assert breaker.allow() and breaker.state == "half_open"
+
+
+def test_client_breaker_recovers_through_trial_call():
+    backend = Scripted(0.0, fail={0, 1})
+    client = LLMClient(backend)
+    guard = client.guard("m")
+    guard.breaker = Breaker("m", failures=2, cooldown=0.1)
+
+    async def main():
+        for _ in range(2):
+            with pytest.raises(RuntimeError):
+                await client.generate("m", ["hi"])
+        with pytest.raises(CircuitOpen):
+            await client.generate("m", ["hi"])
+        await asyncio.sleep(0.15)
+        return await client.generate("m", ["hi"])
+
+    assert asyncio.run(main()) == "answer 2"
+    assert guard.breaker.state == "closed" and backend.calls == 3
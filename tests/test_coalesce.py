@@ -0,0 +1,186 @@
+import asyncio, hashlib, multiprocessing, time
+
+import pytest
+
+from pipeline.coalesce import SharedFlights, SingleFlight, fcntl
+from pipeline.generate import request_key
+
+
+def _key(name: str) -> str:
+    return hashlib.sha256(name.encode("utf-8")).hexdigest()
+
+
+class Calls:
+    """An async computation that counts its calls."""
+
+    def __init__(self, value="done", delay: float = 0.1, error: BaseException = None):
+        self.value = value
+        self.delay = delay
+        self.error = error
+        self.n = 0
+
+    async def __call__(self):
+        self.n += 1
+        await asyncio.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+# --- in-process ---------------------------------------------------------
+
+def test_identical_keys_share_one_call():
+    flights, fn = SingleFlight(), Calls()
+
+    async def main():
+        return await asyncio.gather(*(flights.run(_key("a"), fn) for _ in range(20)))
+
+    assert asyncio.run(main()) == ["done"] * 20
+    assert fn.n == 1
+    assert flights.stats()["in_flight"] == 0
+
+
+def test_followers_get_the_leaders_error():
+    flights, fn = SingleFlight(), Calls(error=RuntimeError("boom"))
+
+    async def main():
+        return await asyncio.gather(*(flights.run(_key("a"), fn) for _ in range(5)), return_exceptions=True)
+
+    assert all(isinstance(r, RuntimeError) for r in asyncio.run(main()))
+    assert fn.n == 1
+
+
+def test_follower_computes_itself_after_max_wait():
+    flights, slow, fast = SingleFlight(max_wait=0.1), Calls("slow", delay=0.5), Calls("fast", delay=0)
+
+    async def main():
+        leader = asyncio.ensure_future(flights.run(_key("a"), slow))
+        await asyncio.sleep(0)
+        follower = await flights.run(_key("a"), fast)
+        return await leader, follower
+
+    assert asyncio.run(main()) == ("slow", "fast")
+
+
+def test_distinct_keys_run_in_parallel():
+    flights, fn = SingleFlight(), Calls(delay=0.3)
+
+    async def main():
+        t = time.monotonic()
+        await asyncio.gather(*(flights.run(_key(str(i)), fn) for i in range(5)))
+        return time.monotonic() - t
+
+    assert asyncio.run(main()) < 0.6
+    assert fn.n == 5
+
+
+def test_request_key_normalizes_flags():
+    assert request_key("Arduino LED", force_fallback=None) == request_key("arduino led", force_fallback=False)
+    assert request_key("led", one_shot=None) == request_key("led", one_shot=False)
+    assert request_key("led", fast_path=None) == request_key("led", fast_path=True)
+    assert request_key("led", force_fallback=True) != request_key("led")
+
+
+# --- across processes ---------------------------------------------------
+
+needs_fcntl = pytest.mark.skipif(fcntl is None, reason="cross-process coalescing needs fcntl")
+
+
+def _leader(directory, key, outcome, hold, started):
+    # Another uvicorn worker: leads `key` for `hold` seconds, then stores
+    # `outcome` ("value"), a shared error ("shared") or nothing ("crash").
+    shared = SharedFlights(directory, shared_errors=(LookupError,))
+
+    async def fn():
+        started.set()
+        await asyncio.sleep(hold)
+        if outcome == "shared":
+            raise LookupError("no such part")
+        if outcome == "crash":
+            raise RuntimeError("leader failed")
+        return {"from": "leader"}
+
+    try:
+        asyncio.run(shared.run(key, fn))
+    except Exception:
+        pass
+
+
+@pytest.fixture
+def other_worker(tmp_path):
+    # Not fork: the child would inherit io_executor without its threads.
+    ctx = multiprocessing.get_context("spawn")
+    procs = []
+
+    def start(key, outcome="value", hold=0.5):
+        started = ctx.Event()
+        p = ctx.Process(target=_leader, args=(str(tmp_path), key, outcome, hold, started))
+        p.start()
+        procs.append(p)
+        assert started.wait(10)
+        return p
+
+    yield start
+    for p in procs:
+        p.join(10)
+
+
+def _flights(tmp_path, **kwargs) -> SharedFlights:
+    return SharedFlights(str(tmp_path), poll=0.01, shared_errors=(LookupError,), **kwargs)
+
+
+@needs_fcntl
+def test_follower_process_gets_leaders_result(tmp_path, other_worker):
+    other_worker(_key("a"))
+    fn = Calls("mine")
+    assert asyncio.run(_flights(tmp_path).run(_key("a"), fn)) == {"from": "leader"}
+    assert fn.n == 0
+
+
+@needs_fcntl
+def test_follower_process_gets_shared_error(tmp_path, other_worker):
+    other_worker(_key("a"), outcome="shared")
+    fn = Calls("mine")
+    with pytest.raises(LookupError, match="no such part"):
+        asyncio.run(_flights(tmp_path).run(_key("a"), fn))
+    assert fn.n == 0
+
+
+@needs_fcntl
+def test_follower_process_retries_when_leader_fails(tmp_path, other_worker):
+    other_worker(_key("a"), outcome="crash")
+    fn = Calls("mine", delay=0)
+    assert asyncio.run(_flights(tmp_path).run(_key("a"), fn)) == "mine"
+    assert fn.n == 1
+
+
+@needs_fcntl
+def test_follower_process_stops_waiting_after_max_wait(tmp_path, other_worker):
+    other_worker(_key("a"), hold=2.0)
+    fn = Calls("mine", delay=0)
+    t = time.monotonic()
+    assert asyncio.run(_flights(tmp_path, max_wait=0.2).run(_key("a"), fn)) == "mine"
+    assert time.monotonic() - t < 1.5
+
+
+@needs_fcntl
+def test_distinct_keys_do_not_block_across_processes(tmp_path, other_worker):
+    other_worker(_key("a"), hold=2.0)
+    fn = Calls("mine", delay=0)
+    t = time.monotonic()
+    assert asyncio.run(_flights(tmp_path).run(_key("b"), fn)) == "mine"
+    assert time.monotonic() - t < 1.0
+
+
+@needs_fcntl
+def test_stored_result_expires_after_ttl(tmp_path):
+    flights, fn = _flights(tmp_path, result_ttl=0.2), Calls(delay=0)
+
+    async def main():
+        await flights.run(_key("a"), fn)
+        await flights.run(_key("a"), fn)     # still stored: shared
+        await asyncio.sleep(0.3)
+        await flights.run(_key("a"), fn)     # expired: computed again
+
+    asyncio.run(main())
+    assert fn.n == 2
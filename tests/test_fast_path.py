@@ -0,0 +1,48 @@
+import pytest
+
+from netlist.rules import rule_based_netlist
+from pipeline.generate import local_netlist
+from utils.arduino_codegen import to_arduino_sketch
+from utils.explanation import build_explanation, explanation_supported
+
+
+@pytest.mark.parametrize("query", [
+    "blink an LED on D13 with arduino",
+    "arduino uno with led on d13 and button on d2",
+    "arduino nano with an led on d13",
+    "esp32 cam",
+    "esp32 cam stream",
+    "stream video from an esp32 camera over wifi",
+])
+def test_covered_prompts_stay_local(query):
+    netlist = local_netlist(query, fast_path=True)
+    assert netlist is not None
+    assert "TODO" not in to_arduino_sketch(netlist)
+    assert not build_explanation(netlist).startswith("Fallback")
+
+
+@pytest.mark.parametrize("query", [
+    "arduino uno with dht22 and servo on pin 9",   # no local sketch for these parts
+    "esp32 with relay",
+    "arduino uno with led",                        # LED not on a pin: nothing to blink
+    "esp32 cam with relay",                        # the template has no relay
+    "arduino uno with a led and a flux capacitor",  # rules don't cover it
+])
+def test_other_prompts_go_to_llm(query):
+    assert local_netlist(query, fast_path=True) is None
+
+
+def test_fast_path_off():
+    assert local_netlist("blink an LED on D13 with arduino", fast_path=False) is None
+
+
+def test_rule_explanation_follows_the_wiring():
+    text = rule_based_netlist("arduino nano with led on d13 and button on d2")["explanation"]
+    assert "Arduino Nano (U1)" in text
+    assert "U1:D13 to R1:1" in text and "S1:1 to U1:D2" in text
+    assert explanation_supported({"components": [], "connections": [], "explanation": text})
+
+
+def test_unwired_parts_keep_generic_explanation():
+    data = rule_based_netlist("arduino uno with led")
+    assert not explanation_supported(data)
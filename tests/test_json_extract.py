@@ -0,0 +1,104 @@
+import json
+
+import pytest
+
+from utils.json_extract import extract_json, extract_json_block, repair_json
+
+
+@pytest.mark.parametrize("raw, expected", [
+    # comments
+    ('{\n // note\n "a": 1, /* x */ "b": 2\n}', {"a": 1, "b": 2}),
+    # trailing commas
+    ('{"a": [1, 2,], "b": 2,}', {"a": [1, 2], "b": 2}),
+    # missing commas, after every kind of value
+    ('{"a": 1, "b": 2 "c": 3}', {"a": 1, "b": 2, "c": 3}),
+    ('{"a": 2"c": 3}', {"a": 2, "c": 3}),
+    ('{"a": 1\n "b": 2}', {"a": 1, "b": 2}),
+    ('{"a": "v" "b": 1}', {"a": "v", "b": 1}),
+    ('{"a": true "b": null "c": -1.5e3}', {"a": True, "b": None, "c": -1500.0}),
+    ('{"a": [1, 2] "b": {"x": 1} "c": "s"}', {"a": [1, 2], "b": {"x": 1}, "c": "s"}),
+    ('[{"a": 1} {"b": 2}]', [{"a": 1}, {"b": 2}]),
+    # numbers JSON doesn't allow
+    ('{"a": 01}', {"a": 1}),
+    ('{"a": 007.5, "b": +5}', {"a": 7.5, "b": 5}),
+    # single and curly quotes
+    ("{'a': 'it\\'s', 'b': 'v' 'c': 1}", {"a": "it's", "b": "v", "c": 1}),
+    ('{“a”: “b”}', {"a": "b"}),
+    # unquoted keys and words
+    ('{id: "U1", type: microcontroller, model: Arduino Uno}',
+     {"id": "U1", "type": "microcontroller", "model": "Arduino Uno"}),
+    # Python / JS literals
+    ("{'a': True, 'b': None, 'c': NaN, 'd': undefined}", {"a": True, "b": None, "c": None, "d": None}),
+    # raw newlines and stray quotes inside strings
+    ('{"code": "void setup() {\n}\n"}', {"code": "void setup() {\n}\n"}),
+    ('{"a": "Use a "pull-up" resistor", "b": 1}', {"a": 'Use a "pull-up" resistor', "b": 1}),
+    # mismatched closers
+    ('{"a": [1, 2}', {"a": [1, 2]}),
+    # truncation: open string, dangling key / colon, open brackets
+    ('{"a": "hello wor', {"a": "hello wor"}),
+    ('{"a": 1, "b"', {"a": 1}),
+    ('{"a": 1, "b":', {"a": 1}),
+    ('{"components": [{"id": "U1", "type": "led"}, {"id": "R1", "ty',
+     {"components": [{"id": "U1", "type": "led"}, {"id": "R1"}]}),
+])
+def test_repair_json(raw, expected):
+    assert json.loads(repair_json(raw)) == expected
+
+
+@pytest.mark.parametrize("raw", [
+    '{"a": 1, "b": [true, null], "c": "x, \\"y\\""}',
+    '{"nested": {"list": [1, 2.5, -3e2], "empty": {}}}',
+])
+def test_repair_json_keeps_valid_json(raw):
+    assert json.loads(repair_json(raw)) == json.loads(raw)
+
+
+def test_repair_json_leading_zero_stays_an_integer():
+    assert repair_json('{"a": 01, "b": -007}') == '{"a":1,"b":-7}'
+
+
+def test_extract_json_from_prose_and_fences():
+    assert extract_json('Sure {note} here: {"label": "use {braces}", "n": 2} done') == \
+        {"label": "use {braces}", "n": 2}
+    assert extract_json('Here:\n```json\n{"a": "x}y"}\n```\n{"b": 1}') == {"a": "x}y"}
+    assert extract_json("no json at all") is None
+
+
+def test_extract_json_prefers_valid_over_repaired():
+    assert extract_json('{"a": 1,} and then {"a": 2}') == {"a": 2}
+    assert extract_json('{"a": 1,}') == {"a": 1}
+
+
+def test_extract_json_validator():
+    text = '{"x": 1} {"components": [], "connections": []}'
+    assert extract_json(text, lambda obj: "components" in obj) == {"components": [], "connections": []}
+    assert extract_json(text, lambda obj: False) is None
+
+
+def test_extract_json_finds_object_inside_broken_outer():
+    assert extract_json('{"oops": {"components": [1]} trailing garbage :') == {"oops": {"components": [1]}}
+
+
+@pytest.mark.parametrize("raw", [
+    '{"a": ' * 1000,
+    '{"a": ' * 1000 + "1" + "}" * 1000,
+    "[" * 5000 + '{"ok": 1}',
+], ids=["truncated", "closed", "arrays"])
+def test_extract_json_deep_nesting_does_not_raise(raw):
+    extract_json(raw)
+    extract_json_block(raw)
+
+
+@pytest.mark.parametrize("raw, expected", [
+    ('{"a": 1  ', {"a": 1}),
+    ('{"a": true\t', {"a": True}),
+    ('```json\n{"m": "x", "n": 2 ```', {"m": "x", "n": 2}),
+])
+def test_extract_json_truncated_after_scalar(raw, expected):
+    assert extract_json(raw) == expected
+    assert extract_json_block(raw) is not None
+
+
+def test_extract_json_block():
+    assert extract_json_block('reply: {"a": "é"}') == '{"a": "é"}'
+    assert extract_json_block("nothing") is None
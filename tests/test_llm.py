@@ -0,0 +1,30 @@
+import asyncio
+
+import pytest
+
+from netlist import client as llm_client
+from netlist.llm import call_gemini_for_netlist, call_gemini_one_shot
+
+
+@pytest.fixture
+def reply():
+    """Serve every LLM call from a fake backend that answers with `reply.text`."""
+    previous = llm_client._client
+    state = type("Reply", (), {"text": ""})()
+    llm_client.configure_client(llm_client.FakeBackend(lambda name, parts: state.text))
+    yield state
+    llm_client._client = previous
+
+
+def test_deeply_nested_reply_falls_back(reply):
+    reply.text = '{"a": ' * 1000
+    assert asyncio.run(call_gemini_for_netlist("arduino led")) is None
+    assert asyncio.run(call_gemini_one_shot("arduino led")) == \
+        {"netlist": None, "explanation": None, "arduino_code": None}
+
+
+def test_repaired_reply_is_used(reply):
+    reply.text = ('Here you go: {components: [{id: "U1", type: "microcontroller", model: "Arduino Uno"},'
+                  ' {"id": "D1" "type": "led"}], connections: [["U1:D13", "D1:+"],]}')
+    netlist = asyncio.run(call_gemini_for_netlist("arduino led"))
+    assert [c["id"] for c in netlist["components"]] == ["U1", "D1"]
@@ -0,0 +1,74 @@
+import pytest
+
+from utils.similar import PromptIndex, prompt_tokens
+
+NETLIST = {"components": [{"id": "U1", "type": "microcontroller", "model": "Arduino Uno"}], "connections": []}
+
+
+@pytest.fixture
+def index():
+    idx = PromptIndex(max_items=16, dim=512)
+    idx.add("Blink an LED on D13 with an Arduino Uno", NETLIST)
+    return idx
+
+
+def _similarity(idx: PromptIndex, query: str) -> float:
+    tokens = prompt_tokens(query)
+    return float(idx._vectors[0] @ idx._weigh(idx._tf(tokens)))
+
+
+def test_prompt_tokens_are_canonical():
+    assert prompt_tokens("LED blink with Arduino Uno on pin 13") == ["led", "blink", "arduino", "uno", "d13"]
+    assert prompt_tokens("two LEDs at 5 volts") == ["two", "led", "5v"]
+
+
+@pytest.mark.parametrize("query", [
+    "blink an led on d13 with an arduino uno",    # case only
+    "LED blink with Arduino Uno on pin 13",        # reordered, pin spelled out
+    "Blinking LED on D13 with Arduino Uno",        # inflection
+])
+def test_near_duplicate_reuses_netlist(index, query):
+    assert index.lookup(query) is NETLIST
+    assert index.hits == 1
+
+
+@pytest.mark.parametrize("query", [
+    "Blink an LED on D12 with an Arduino Uno",            # other pin
+    "Blink an LED on D13 with an Arduino Nano",           # other board
+    "Blink an LED and a buzzer on D13 with Arduino Uno",  # extra part
+    "Blink two LEDs on D13 with an Arduino Uno",          # other part count
+])
+def test_hard_key_mismatch_misses(index, query):
+    # Close enough in wording to pass the threshold; only the hard key differs.
+    index.threshold = 0.5
+    assert _similarity(index, query) > index.threshold
+    assert index.lookup(query) is None
+    assert index.misses == 1
+
+
+def test_unrelated_prompt_misses(index):
+    assert index.lookup("ESP32 with OLED SSD1306 display over I2C") is None
+
+
+def test_threshold_boundary(index):
+    query = "arduino uno blink led d13 now"
+    sim = _similarity(index, query)
+    assert 0.5 < sim < 1.0
+    index.threshold = sim - 1e-4
+    assert index.lookup(query) is NETLIST
+    index.threshold = sim + 1e-4
+    assert index.lookup(query) is None
+
+
+def test_threshold_above_one_disables(index):
+    index.threshold = 1.01
+    assert index.lookup("Blink an LED on D13 with an Arduino Uno") is None
+
+
+def test_index_survives_restart(tmp_path):
+    path = str(tmp_path / "prompts.json")
+    idx = PromptIndex(max_items=16, dim=512, path=path, model="m")
+    idx.add("Blink an LED on D13 with an Arduino Uno", NETLIST)
+    idx.save()
+    assert PromptIndex(max_items=16, dim=512, path=path, model="m").lookup("arduino uno blink led d13") == NETLIST
+    assert PromptIndex(max_items=16, dim=512, path=path, model="other").lookup("arduino uno blink led d13") is None
@@ -1,21 +1,24 @@
-from typing import Dict
+from typing import Dict, Set, Union
 
-def to_arduino_sketch(netlist: Dict) -> str:
+from netlist.model import Netlist
+
+_POWER_PINS = {"5V", "3.3V", "VIN", "GND"}
+_SUPPLY_KINDS = {"voltage_source", "battery", "gnd"}
+# Same pinout where it matters here: LED on D13, button on D2.
+_AVR_BOARDS = ("arduino uno", "arduino nano")
+
+
+def to_arduino_sketch(netlist: Union[Dict, Netlist]) -> str:
     """
     Very simple Arduino sketch generator:
-    - If Arduino Uno + LED via D13, blink.
+    - If Arduino Uno/Nano + LED via D13, blink.
     - If button on D2, read and mirror to LED D13.
     - For ESP32-CAM, emit a stub with comment to use CameraWebServer example.
     Otherwise, produce a comment-only skeleton.
     """
-    comps = netlist.get("components", [])
-    conns = netlist.get("connections", [])
-
-    model = ""
-    for c in comps:
-        if c.get("type") == "microcontroller":
-            model = (c.get("model") or "").lower()
-            break
+    netlist = Netlist.coerce(netlist)
+    mcu = netlist.mcu
+    model = (mcu.model or "").lower() if mcu else ""
 
     if "esp32-cam" in model:
         return (
@@ -29,24 +32,24 @@ def to_arduino_sketch(netlist: Dict) -> str:
             "}\n"
         )
 
-    if "arduino uno" in model:
-        use_led_d13 = any(a=="U1:D13" or b=="U1:D13" for a,b in conns)
-        button_d2  = any(a=="U1:D2"  or b=="U1:D2"  for a,b in conns)
+    if any(board in model for board in _AVR_BOARDS):
+        use_led_d13 = netlist.is_connected(f"{mcu.id}:D13")
+        button_d2  = netlist.is_connected(f"{mcu.id}:D2")
 
         if use_led_d13 and not button_d2:
             return (
-                "// Arduino Uno: Blink LED on D13\n"
+                f"// {mcu.model}: Blink LED on D13\n"
                 "void setup(){ pinMode(13, OUTPUT); }\n"
                 "void loop(){ digitalWrite(13, HIGH); delay(500); digitalWrite(13, LOW); delay(500); }\n"
             )
         if use_led_d13 and button_d2:
             return (
-                "// Arduino Uno: Button on D2 controls LED on D13\n"
+                f"// {mcu.model}: Button on D2 controls LED on D13\n"
                 "void setup(){ pinMode(2, INPUT_PULLUP); pinMode(13, OUTPUT); }\n"
                 "void loop(){ int p=digitalRead(2); digitalWrite(13, p==LOW ? HIGH : LOW); }\n"
             )
         return (
-            "// Arduino Uno skeleton generated from netlist\n"
+            f"// {mcu.model} skeleton generated from netlist\n"
             "void setup(){ /* TODO: set pinModes based on connections */ }\n"
             "void loop(){ /* TODO */ }\n"
         )
@@ -56,3 +59,34 @@ def to_arduino_sketch(netlist: Dict) -> str:
         "void setup(){ }\n"
         "void loop(){ }\n"
     )
+
+
+def sketch_supported(netlist: Union[Dict, Netlist]) -> bool:
+    """
+    True when to_arduino_sketch writes a sketch that drives every part of the
+    netlist: an ESP32-CAM with its camera, or an Arduino Uno/Nano with an
+    LED on D13 and optionally a button on D2. Anything else gets a TODO skeleton.
+    """
+    netlist = Netlist.coerce(netlist)
+    mcu = netlist.mcu
+    model = (mcu.model or "").lower() if mcu else ""
+    kinds = {c.kind for c in netlist.components if c is not mcu}
+    if "esp32-cam" in model:
+        return kinds <= _SUPPLY_KINDS | {"camera_module"}
+    if not any(board in model for board in _AVR_BOARDS) or not kinds <= _SUPPLY_KINDS | {"resistor", "led", "button"}:
+        return False
+    io = netlist.pins_of(mcu.id) - _POWER_PINS
+    if io == {"D13"}:
+        return bool(_net_kinds(netlist, f"{mcu.id}:D13") & {"led", "resistor"})
+    if io == {"D13", "D2"}:
+        return (bool(_net_kinds(netlist, f"{mcu.id}:D13") & {"led", "resistor"})
+                and "button" in _net_kinds(netlist, f"{mcu.id}:D2"))
+    return False
+
+
+def _net_kinds(netlist: Netlist, ref: str) -> Set[str]:
+    idx = netlist.net_of(ref)
+    if idx is None:
+        return set()
+    return {netlist.component(p.component).kind for p in netlist.nets()[idx]
+            if netlist.component(p.component) is not None}
@@ -0,0 +1,179 @@
+import os, re, json, time, sqlite3, hashlib, threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from netlist.model import Netlist
+
+
+def normalize_query(query: str) -> str:
+    """Lowercase, collapse whitespace and drop surrounding punctuation."""
+    t = (query or "").lower()
+    t = re.sub(r"\s+", " ", t).strip()
+    return t.strip(" .!?,;:")
+
+
+def netlist_hash(netlist) -> str:
+    """Canonical hash of a netlist (dict or Netlist); see Netlist.digest."""
+    return Netlist.coerce(netlist).digest()
+
+
+def make_key(*parts: str) -> str:
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+class MemoryCache:
+    """Thread-safe LRU with per-entry TTL."""
+
+    def __init__(self, max_items: int = 1024, ttl: float = 3600.0):
+        self.max_items = max_items
+        self.ttl = ttl
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_items:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SqliteCache:
+    """
+    On-disk tier. Values are stored as JSON; when the total payload exceeds
+    max_bytes the least recently used rows are evicted.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 64 * 1024 * 1024, ttl: float = 7 * 24 * 3600.0):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL,"
+            " expires REAL NOT NULL, atime REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS cache_atime ON cache(atime)")
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT value, expires FROM cache WHERE key=?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] < now:
+                self._db.execute("DELETE FROM cache WHERE key=?", (key,))
+                return None
+            self._db.execute("UPDATE cache SET atime=? WHERE key=?", (now, key))
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Any):
+        payload = json.dumps(value, ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO cache(key, value, size, expires, atime) VALUES (?,?,?,?,?)",
+                (key, payload, len(payload), now + self.ttl, now),
+            )
+            self._evict()
+
+    def _evict(self):
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        self._db.execute("DELETE FROM cache WHERE expires < ?", (time.time(),))
+        rows = self._db.execute("SELECT key, size FROM cache ORDER BY atime ASC").fetchall()
+        total = sum(size for _, size in rows)
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            self._db.execute("DELETE FROM cache WHERE key=?", (key,))
+            total -= size
+
+
+class ResultCache:
+    """In-process tier in front of an optional disk tier, with hit/miss counters per namespace."""
+
+    def __init__(self, memory: MemoryCache, disk: Optional[SqliteCache] = None):
+        self.memory = memory
+        self.disk = disk
+        self._stats: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def _count(self, ns: str, field: str):
+        with self._lock:
+            s = self._stats.setdefault(ns, {"hits": 0, "misses": 0})
+            s[field] += 1
+
+    def get(self, ns: str, key: str) -> Optional[Any]:
+        full = f"{ns}:{key}"
+        value = self.memory.get(full)
+        if value is None and self.disk is not None:
+            try:
+                value = self.disk.get(full)
+            except Exception as e:
+                print("⚠️ Cache read failed:", e)
+                value = None
+            if value is not None:
+                self.memory.set(full, value)
+        self._count(ns, "hits" if value is not None else "misses")
+        return value
+
+    def set(self, ns: str, key: str, value: Any):
+        full = f"{ns}:{key}"
+        self.memory.set(full, value)
+        if self.disk is not None:
+            try:
+                self.disk.set(full, value)
+            except Exception as e:
+                print("⚠️ Cache write failed:", e)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out = {ns: dict(s) for ns, s in self._stats.items()}
+        return {"entries": len(self.memory), "disk": bool(self.disk), "stages": out}
+
+
+def _build_cache() -> ResultCache:
+    memory = MemoryCache(
+        max_items=int(os.getenv("CACHE_MAX_ITEMS", "1024")),
+        ttl=float(os.getenv("CACHE_TTL_S", "3600")),
+    )
+    disk = None
+    db_path = os.getenv("CACHE_DB_PATH")  # e.g. /tmp/circuit-cache.sqlite3
+    if db_path:
+        try:
+            disk = SqliteCache(
+                db_path,
+                max_bytes=int(float(os.getenv("CACHE_DB_MAX_MB", "64")) * 1024 * 1024),
+                ttl=float(os.getenv("CACHE_DB_TTL_S", str(7 * 24 * 3600))),
+            )
+        except Exception as e:
+            print("⚠️ Disk cache disabled:", e)
+    return ResultCache(memory, disk)
+
+
+result_cache = _build_cache()
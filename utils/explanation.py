@@ -1,4 +1,10 @@
-def build_explanation(netlist: dict) -> str:
+from typing import Dict, Union
+
+from netlist.model import Netlist
+from netlist.rules import RULES
+
+
+def build_explanation(netlist: Union[Dict, Netlist]) -> str:
     """
     Build an explanation of the circuit.
     Priority:
@@ -6,14 +12,16 @@ def build_explanation(netlist: dict) -> str:
       2. If ESP32-related, return specific ESP32 connection guidance.
       3. Otherwise, return a generic fallback explanation.
     """
+    netlist = Netlist.coerce(netlist)
+
     # Case 1: Use explanation from LLM if available
-    if isinstance(netlist, dict) and netlist.get("explanation"):
-        return netlist["explanation"]
+    if netlist.explanation:
+        return netlist.explanation
 
     # Case 2: Special rule for ESP32
     is_esp32 = any(
-        "esp32" in (c.get("model", "").lower()) 
-        for c in netlist.get("components", [])
+        "esp32" in (c.model or "").lower()
+        for c in netlist.components
     )
     if is_esp32:
         return (
@@ -31,3 +39,16 @@ def build_explanation(netlist: dict) -> str:
         "This circuit connects power, ground, and components as shown in the diagram. "
         "Follow the wiring in the schematic to ensure correct connections between the modules."
     )
+
+
+def explanation_supported(netlist: Union[Dict, Netlist]) -> bool:
+    """
+    True when build_explanation has circuit-specific text for the netlist:
+    its own explanation (other than the rule engine's generic fallback) or
+    the ESP32-CAM guide. The generic fallback text doesn't count.
+    """
+    netlist = Netlist.coerce(netlist)
+    if netlist.explanation:
+        return not netlist.explanation.startswith(RULES.explanation)
+    mcu = netlist.mcu
+    return mcu is not None and "esp32-cam" in (mcu.model or "").lower()
@@ -1,30 +1,321 @@
+import re
 import json
-from typing import Optional
+from typing import Any, Callable, Iterator, List, Optional, Tuple
 
-def extract_json_block(text: str) -> Optional[str]:
-    text = (text or "").strip()
-    if text.startswith("```"):
-        parts = text.split("```")
-        if len(parts) >= 3:
-            text = parts[1]
+# LLM replies wrap JSON in prose and code fences, get cut off mid-object and
+# make small syntax slips. Candidates are found in one string-aware pass and
+# parsed with raw_decode; anything that does not parse as-is goes through
+# repair_json once. Work is linear in the reply length.
+
+_decoder = json.JSONDecoder()
+
+_FENCE_RE = re.compile(r"```[ \t]*(?:json[c5]?|javascript|js)?[ \t]*\r?\n?(.*?)(?:```|\Z)", re.S | re.I)
+_STRUCT_RE = re.compile(r'[{}\[\]"]')
+_STRING_TAIL_RE = re.compile(r'(?:[^"\\]|\\.)*"', re.S)
+_NUMBER_RE = re.compile(r"-?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][+-]?\d+)?")
+_INT_RE = re.compile(r"[+-]?\d+")
+_SCALAR_RE = re.compile(r"[+-]?(?:\d+(?:\.\d*)?|\.\d+)(?:[eE][+-]?\d+)?|-?[A-Za-z]+")
+_LITERALS = {"true": "true", "false": "false", "null": "null", "none": "null",
+             "nan": "null", "infinity": "null", "-infinity": "null", "undefined": "null"}
+_ESCAPES = set('"\\/bfnrtu')
+_OPEN_QUOTES = {'"': '"', "'": "'", "“": "”", "‘": "’"}
+_CTRL = {"\n": "\\n", "\r": "\\r", "\t": "\\t"}
+
+MAX_NESTED_RETRIES = 8
+
+
+def _span(s: str, start: int) -> Tuple[int, bool]:
+    """
+    End of the bracketed value opening at s[start] (index after its closer)
+    and whether it closed; strings are skipped so braces inside them don't count.
+    """
+    depth = 0
+    pos = start
+    while True:
+        m = _STRUCT_RE.search(s, pos)
+        if m is None:
+            return len(s), False
+        c = m.group(0)
+        pos = m.end()
+        if c == '"':
+            tail = _STRING_TAIL_RE.match(s, pos)
+            if tail is None:
+                return len(s), False
+            pos = tail.end()
+        elif c in "{[":
+            depth += 1
+        else:
+            depth -= 1
+            if depth == 0:
+                return pos, True
+
+
+def _ends_string(s: str, k: int) -> bool:
+    n = len(s)
+    while k < n and s[k] in " \t\r":
+        k += 1
+    if k < n and s[k] in _OPEN_QUOTES:
+        # The next member's key ('"v" "b": 1'): the comma between them is missing.
+        close = s.find(_OPEN_QUOTES[s[k]], k + 1)
+        if close > k + 1:
+            k = close + 1
+            while k < n and s[k] in " \t\r":
+                k += 1
+            return k < n and s[k] == ":"
+    return k >= n or s[k] in ",:}]\n"
+
+
+class _Frame:
+    __slots__ = ("kind", "state", "comma_at", "key_at")
+
+    def __init__(self, kind: str):
+        self.kind = kind                      # "{" or "["
+        self.state = "key" if kind == "{" else "value"
+        self.comma_at = -1                    # index in out of a comma that may turn out trailing
+        self.key_at = -1                      # index in out of the current member's key
+
+
+def repair_json(s: str) -> str:
+    """
+    Best-effort fix of a JSON-ish object: comments, trailing/missing commas,
+    single or curly quotes, unquoted keys and words, Python literals,
+    numbers with leading zeros or a plus sign, raw
+    newlines and stray quotes in strings, mismatched closers, and truncation
+    (open strings, dangling keys and all open brackets are closed).
+    """
+    out: List[str] = []
+    stack: List[_Frame] = []
+    i, n = 0, len(s)
+
+    def emit_value(text: str, is_key_candidate: bool = False) -> bool:
+        # Place one scalar/opener according to the enclosing container's state.
+        if not stack:
+            out.append(text)
+            return False
+        f = stack[-1]
+        if f.kind == "{":
+            if f.state == "next":
+                out.append(",")
+                f.state = "key"
+            if f.state == "key":
+                if not is_key_candidate:
+                    return False
+                f.key_at = len(out)
+                out.append(text)
+                f.state = "colon"
+                return True
+            if f.state == "colon":
+                out.append(":")
+            out.append(text)
+            f.state = "next"
+            return True
+        if f.state == "next":
+            out.append(",")
+        out.append(text)
+        f.state = "next"
+        return True
+
+    def close_frame(f: _Frame):
+        if f.kind == "{":
+            if f.state in ("colon", "value"):
+                # Key without a value (usually a cut-off reply): drop the member.
+                del out[f.key_at:]
+                if out and out[-1] == ",":
+                    out.pop()
+            elif f.state == "key" and f.comma_at >= 0:
+                out[f.comma_at] = ""
+            out.append("}")
+        else:
+            if f.state == "value" and f.comma_at >= 0:
+                out[f.comma_at] = ""
+            out.append("]")
+
+    while i < n:
+        c = s[i]
+        if c in " \t\r\n":
+            i += 1
+            continue
+        if c == "/" and s.startswith("//", i):
+            nl = s.find("\n", i)
+            i = n if nl < 0 else nl + 1
+            continue
+        if c == "/" and s.startswith("/*", i):
+            end = s.find("*/", i + 2)
+            i = n if end < 0 else end + 2
+            continue
+
+        if c in _OPEN_QUOTES:
+            close = _OPEN_QUOTES[c]
+            body: List[str] = []
+            j = i + 1
+            while j < n:
+                ch = s[j]
+                if ch == "\\" and j + 1 < n:
+                    nxt = s[j + 1]
+                    if nxt in _ESCAPES:
+                        body.append(ch + nxt)
+                    elif nxt == "'":
+                        body.append("'")
+                    else:
+                        body.append("\\\\" + nxt)
+                    j += 2
+                    continue
+                if ch == close or (c == "“" and ch == '"'):
+                    if _ends_string(s, j + 1):
+                        break
+                    # Not followed by JSON structure: an unescaped quote inside the text.
+                    body.append('\\"' if ch == '"' else ch)
+                    j += 1
+                    continue
+                if ch == '"':
+                    body.append('\\"')
+                elif ch in _CTRL:
+                    body.append(_CTRL[ch])
+                elif ch < " ":
+                    body.append("\\u%04x" % ord(ch))
+                else:
+                    body.append(ch)
+                j += 1
+            emit_value('"' + "".join(body) + '"', is_key_candidate=True)
+            i = j + 1
+            continue
+
+        if c in "{[":
+            if emit_value(c) or not stack:
+                stack.append(_Frame(c))
+            i += 1
+            continue
+
+        if c in "}]":
+            if not stack:
+                break
+            close_frame(stack.pop())
+            i += 1
+            if not stack:
+                break
+            continue
+
+        if c == ",":
+            if stack and stack[-1].state == "next":
+                f = stack[-1]
+                f.state = "key" if f.kind == "{" else "value"
+                f.comma_at = len(out)
+                out.append(",")
+            i += 1
+            continue
+
+        if c == ":":
+            if stack and stack[-1].kind == "{" and stack[-1].state == "colon":
+                out.append(":")
+                stack[-1].state = "value"
+            i += 1
+            continue
+
+        # Bare word: an unquoted key, a literal, a number or unquoted text.
+        f = stack[-1] if stack else None
+        expecting_key = f is not None and f.kind == "{" and f.state in ("key", "next")
+        stops = ":,{}[]\n" if expecting_key else ",}]\n"
+        j = i
+        while j < n and s[j] not in stops:
+            j += 1
+        if not expecting_key:
+            # A number or literal running into the next member ('2 "c": 3')
+            # is missing its comma: end the value there.
+            m = _SCALAR_RE.match(s, i)
+            if m is not None and m.end() < j:
+                k = m.end()
+                while k < j and s[k] in " \t\r":
+                    k += 1
+                if k < j and (s[k] in _OPEN_QUOTES or s[k] in "{["):
+                    if not m.group(0).isalpha() or m.group(0).lower() in _LITERALS:
+                        j = m.end()
+        word = s[i:j].strip()
+        i = j if j > i else i + 1
+        if not word:
+            continue
+        if expecting_key:
+            emit_value(json.dumps(word.strip("'\"")), is_key_candidate=True)
+            continue
+        low = word.lower()
+        if low in _LITERALS:
+            emit_value(_LITERALS[low])
+        elif _NUMBER_RE.fullmatch(word):
+            emit_value(word)
+        elif _INT_RE.fullmatch(word):
+            emit_value(str(int(word)))    # leading zeros or a plus sign: 01 -> 1, +5 -> 5
+        else:
+            try:
+                emit_value(json.dumps(float(word.lstrip("+"))))
+            except ValueError:
+                emit_value(json.dumps(word))
+
+    while stack:
+        close_frame(stack.pop())
+    return "".join(out)
+
+
+def _parse_at(s: str, start: int) -> Tuple[Optional[Any], int, bool, bool]:
+    """(object or None, end index, closed, repaired) for the candidate opening at s[start]."""
+    end, closed = _span(s, start)
+    span = s[start:end]
+    # Decode the slice, not s at start: a failing raw_decode counts newlines
+    # from the beginning of its input for the error message.
+    # RecursionError: the decoder recurses per nesting level, so '{"a": ' * 1000 overflows.
     try:
-        json.loads(text)
-        return text
-    except Exception:
+        obj, used = _decoder.raw_decode(span)
+        return obj, start + used, True, False
+    except (ValueError, RecursionError):
         pass
-    start = text.find("{")
-    while start != -1:
-        depth = 0
-        for i in range(start, len(text)):
-            if text[i] == "{": depth += 1
-            elif text[i] == "}":
-                depth -= 1
-                if depth == 0:
-                    cand = text[start:i+1]
-                    try:
-                        json.loads(cand)
-                        return cand
-                    except Exception:
-                        break
-        start = text.find("{", start+1)
-    return None
+    if ":" not in span:
+        return None, end, closed, True     # prose like "{x}", not an object worth repairing
+    try:
+        return json.loads(repair_json(span)), end, closed, True
+    except (ValueError, RecursionError):
+        return None, end, closed, True
+
+
+def iter_json_objects(s: str, _depth: int = 0) -> Iterator[Tuple[Any, bool]]:
+    """(object, repaired) for every top-level JSON object in s, in order."""
+    pos = 0
+    while True:
+        start = s.find("{", pos)
+        if start < 0:
+            return
+        obj, end, closed, repaired = _parse_at(s, start)
+        if isinstance(obj, dict):
+            yield obj, repaired
+        elif _depth < MAX_NESTED_RETRIES:
+            # Unusable even after repair: a valid object may still sit inside.
+            inner = s[start + 1:end - 1 if closed else end]
+            if ":" in inner:
+                yield from iter_json_objects(inner, _depth + 1)
+        if not closed:
+            return
+        pos = end
+
+
+def extract_json(text: str, validate: Optional[Callable[[Any], bool]] = None) -> Optional[Any]:
+    """
+    First JSON object in an LLM reply that passes `validate` (any dict when
+    None). Fenced code blocks are searched before the surrounding text, and
+    an object that parsed as-is wins over one that needed repair.
+    """
+    text = text or ""
+    sources = [m.group(1) for m in _FENCE_RE.finditer(text)] if "```" in text else []
+    sources.append(text)
+    fallback = None
+    for src in sources:
+        for obj, repaired in iter_json_objects(src):
+            if validate is not None and not validate(obj):
+                continue
+            if not repaired:
+                return obj
+            if fallback is None:
+                fallback = obj
+    return fallback
+
+
+def extract_json_block(text: str) -> Optional[str]:
+    """JSON text of the first object in an LLM reply (see extract_json), or None."""
+    obj = extract_json(text)
+    return None if obj is None else json.dumps(obj, ensure_ascii=False)
@@ -0,0 +1,234 @@
+import os, json, time, threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Minimal Prometheus-style metrics (text exposition format 0.0.4) plus
+# per-request timing spans, without pulling in a client library.
+
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "2000"))
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+Labels = Tuple[str, ...]
+
+
+def _fmt_labels(names: Sequence[str], values: Labels, extra: str = "") -> str:
+    parts = [f'{n}="{v}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, doc: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.doc = doc
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Labels, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels: str):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_fmt_labels(self.labelnames, key)} {value:g}")
+        return lines
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels: str):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram:
+    def __init__(self, name: str, doc: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.doc = doc
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Labels, List[float]] = {}   # bucket counts..., sum, count
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            s = self._series.get(key)
+            if s is None:
+                s = self._series[key] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    s[i] += 1
+            s[-2] += value
+            s[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, s in sorted(self._series.items()):
+                les = ['le="%g"' % b for b in self.buckets] + ['le="+Inf"']
+                for le, n in zip(les, s[:len(self.buckets)] + [s[-1]]):
+                    lines.append(f"{self.name}_bucket{_fmt_labels(self.labelnames, key, le)} {n:g}")
+                lines.append(f"{self.name}_sum{_fmt_labels(self.labelnames, key)} {s[-2]:.6f}")
+                lines.append(f"{self.name}_count{_fmt_labels(self.labelnames, key)} {s[-1]:g}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List = []
+
+    def counter(self, name: str, doc: str, labelnames: Sequence[str] = ()) -> Counter:
+        m = Counter(name, doc, labelnames)
+        self._metrics.append(m)
+        return m
+
+    def gauge(self, name: str, doc: str, labelnames: Sequence[str] = ()) -> Gauge:
+        m = Gauge(name, doc, labelnames)
+        self._metrics.append(m)
+        return m
+
+    def histogram(self, name: str, doc: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        m = Histogram(name, doc, labelnames, buckets)
+        self._metrics.append(m)
+        return m
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for m in self._metrics:
+            lines += m.render()
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+REQUEST_SECONDS = REGISTRY.histogram(
+    "circuit_request_duration_seconds", "HTTP request latency.", ("route", "method", "status"))
+STAGE_SECONDS = REGISTRY.histogram(
+    "circuit_stage_duration_seconds", "Latency of one pipeline stage.", ("stage",))
+LLM_SECONDS = REGISTRY.histogram(
+    "circuit_llm_call_duration_seconds", "Latency of one LLM call, including queueing.", ("model",))
+LLM_FAILURES = REGISTRY.counter(
+    "circuit_llm_failures_total", "LLM calls that raised or timed out.", ("model", "reason"))
+JSON_FAILURES = REGISTRY.counter(
+    "circuit_json_extraction_failures_total", "LLM replies with no usable JSON.", ("stage",))
+FALLBACKS = REGISTRY.counter(
+    "circuit_fallbacks_total", "Stages answered by a local fallback instead of the LLM.", ("stage",))
+FAST_PATH = REGISTRY.counter(
+    "circuit_fast_path_total", "Fast-path decisions: answered locally, or sent to the LLM (low coverage or unsupported parts).", ("outcome",))
+COALESCED = REGISTRY.counter(
+    "circuit_coalesced_requests_total",
+    "Single-flight outcomes: leader, follower, shared (other worker's result), retry, timeout.", ("role",))
+LLM_HEDGES = REGISTRY.counter(
+    "circuit_llm_hedges_total", "Duplicate LLM calls fired after the p95, and how many answered first.",
+    ("model", "outcome"))
+LLM_BREAKER_STATE = REGISTRY.gauge(
+    "circuit_llm_breaker_state", "Circuit breaker per model: 0 closed, 1 half-open, 2 open.", ("model",))
+STARTUP_SECONDS = REGISTRY.gauge(
+    "circuit_startup_seconds", "Cold-start milestones (import, warmup, first_generate), from main.py import.",
+    ("phase",))
+RULE_COVERAGE = REGISTRY.histogram(
+    "circuit_rule_coverage", "Share of each prompt the rule engine understood.", (),
+    buckets=(0.25, 0.5, 0.75, 0.9, 1.0))
+
+
+# --- per-request spans ---
+
+_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("circuit_timings", default=None)
+
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    """
+    Time a stage: observed in circuit_stage_duration_seconds and, inside a
+    request, added to its Server-Timing breakdown. Tasks created inside the
+    request share the same timings dict, so parallel stages are recorded too.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        timings = _timings.get()
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + elapsed * 1000.0
+
+
+def server_timing(timings: Dict[str, float], total_ms: float) -> str:
+    parts = [f"{name};dur={ms:.1f}" for name, ms in timings.items()]
+    parts.append(f"total;dur={total_ms:.1f}")
+    return ", ".join(parts)
+
+
+def _route(scope) -> str:
+    # Route templates only: raw paths of 404s and scans would make the
+    # number of series unbounded.
+    route = scope.get("route")
+    if route is not None and getattr(route, "path", None):
+        return route.path
+    return "unmatched"
+
+
+class TimingMiddleware:
+    """
+    ASGI middleware: collects the spans of each request, adds a
+    Server-Timing header (stages finished before the response starts; for
+    streams that is only what preceded the first byte) and logs requests
+    slower than SLOW_REQUEST_MS as one JSON line.
+    """
+
+    def __init__(self, app, slow_ms: float = SLOW_REQUEST_MS):
+        self.app = app
+        self.slow_ms = slow_ms
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings: Dict[str, float] = {}
+        token = _timings.set(timings)
+        start = time.perf_counter()
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                total = (time.perf_counter() - start) * 1000.0
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", server_timing(timings, total).encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _timings.reset(token)
+            total = (time.perf_counter() - start) * 1000.0
+            route = _route(scope)
+            REQUEST_SECONDS.observe(total / 1000.0, route=route, method=scope.get("method", ""),
+                                    status=status["code"])
+            if total >= self.slow_ms:
+                print(json.dumps({
+                    "event": "slow_request",
+                    "method": scope.get("method"),
+                    "route": route,
+                    "path": scope.get("path"),
+                    "status": status["code"],
+                    "duration_ms": round(total, 1),
+                    "stages_ms": {k: round(v, 1) for k, v in timings.items()},
+                }))
@@ -0,0 +1,232 @@
+import os, re, json, time, zlib, threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from netlist.rules import match_rules
+from utils.cache import normalize_query
+
+# Prompts that only differ in wording ("LED blink with arduino uno on pin 13"
+# vs "arduino blink led d13") map to nearby hashed TF-IDF vectors, so a
+# previously generated netlist can be reused without another LLM call.
+
+_STOPWORDS = frozenset(
+    "a an the with on to and of for using use in at via from by into connected connect "
+    "make build create design draw circuit schematic diagram please i want need me my "
+    "how simple basic small some that this it is".split()
+)
+_PIN_RE = re.compile(r"\b(?:pin|digital|dig)\s*(\d{1,2})\b")
+_VOLT_RE = re.compile(r"\b(\d+(?:\.\d+)?)\s*(?:v|volts?)\b")
+_WORD_RE = re.compile(r"[a-z0-9]+(?:\.\d+)?")
+
+
+def _stem(tok: str) -> str:
+    if tok.endswith("ing") and len(tok) > 5:
+        return tok[:-3]
+    if tok.endswith("es") and tok[:-2].endswith(("ch", "sh", "x")):
+        return tok[:-2]
+    if tok.endswith("s") and not tok.endswith("ss") and len(tok) > 3:
+        return tok[:-1]
+    return tok
+
+
+def prompt_tokens(query: str) -> List[str]:
+    """Canonical content tokens: "pin 13" -> "d13", "5 volts" -> "5v", plurals folded."""
+    t = normalize_query(query)
+    t = _PIN_RE.sub(r"d\1", t)
+    t = _VOLT_RE.sub(r"\1v", t)
+    return [_stem(w) for w in _WORD_RE.findall(t) if w not in _STOPWORDS]
+
+
+def _features(tokens: List[str]) -> Dict[str, float]:
+    # Whole tokens carry the meaning; character trigrams absorb typos ("arudino").
+    feats: Dict[str, float] = {}
+    for tok in tokens:
+        feats["w:" + tok] = feats.get("w:" + tok, 0.0) + 1.0
+        padded = f"#{tok}#"
+        for i in range(len(padded) - 2):
+            g = "c:" + padded[i:i + 3]
+            feats[g] = feats.get(g, 0.0) + 0.25
+    return feats
+
+
+def _hard(tokens: List[str]) -> Tuple[Any, ...]:
+    # Tokens with digits (pins, voltages, part numbers) must agree exactly:
+    # "led on d13" and "led on d12" are close in wording but not the same circuit.
+    # So must the board and parts the rules recognize: "arduino uno with led"
+    # scores close to "... led and button" but needs a different netlist.
+    digits = tuple(sorted({t for t in tokens if any(c.isdigit() for c in t)}))
+    match = match_rules(" ".join(tokens))
+    board = match.board["name"] if match.board else ""
+    return digits, board, tuple(sorted(match.parts.items()))
+
+
+class PromptIndex:
+    """
+    Bounded nearest-neighbour index from prompts to netlists. Rows are
+    l2-normalised TF-IDF vectors over hashed features (IDF taken when the row
+    is added), so a lookup is one matrix-vector product. When full, the least
+    recently used row is replaced. With a path, entries are written to disk as
+    JSON (prompt + netlist; vectors are rebuilt on load) at most every
+    save_interval seconds and on close.
+    """
+
+    def __init__(self, max_items: int = 2048, dim: int = 1024, threshold: float = 0.85,
+                 path: Optional[str] = None, save_interval: float = 30.0, model: str = ""):
+        self.max_items = max_items
+        self.dim = dim
+        self.threshold = threshold
+        self.path = path
+        self.save_interval = save_interval
+        self.model = model
+        self._lock = threading.Lock()
+        self._vectors = np.zeros((max_items, dim), dtype=np.float32)
+        self._present = np.zeros((max_items, dim), dtype=bool)
+        self._df = np.zeros(dim, dtype=np.float32)
+        self._atime = np.full(max_items, -np.inf)
+        self._entries: List[Optional[Dict[str, Any]]] = [None] * max_items
+        self._slots: Dict[str, int] = {}      # canonical prompt -> row
+        self._count = 0
+        self._dirty = False
+        self._saved_at = time.monotonic()
+        self.hits = 0
+        self.misses = 0
+        if path:
+            self._load()
+
+    # --- vectors ---
+
+    def _tf(self, tokens: List[str]) -> np.ndarray:
+        vec = np.zeros(self.dim, dtype=np.float32)
+        for feat, w in _features(tokens).items():
+            vec[zlib.crc32(feat.encode("utf-8")) % self.dim] += w
+        return np.log1p(vec)
+
+    def _weigh(self, tf: np.ndarray) -> np.ndarray:
+        idf = np.log((self._count + 1.0) / (self._df + 1.0)) + 1.0
+        vec = tf * idf
+        norm = float(np.linalg.norm(vec))
+        return vec / norm if norm else vec
+
+    # --- public API ---
+
+    def lookup(self, query: str) -> Optional[Any]:
+        """Netlist stored for the most similar prompt, or None below the threshold."""
+        if not self.max_items or self.threshold > 1.0:
+            return None
+        tokens = prompt_tokens(query)
+        if not tokens:
+            return None
+        with self._lock:
+            if not self._count:
+                self.misses += 1
+                return None
+            sims = self._vectors @ self._weigh(self._tf(tokens))
+            hard = _hard(tokens)
+            for row in np.argsort(sims)[::-1][:8]:
+                if sims[row] < self.threshold:
+                    break
+                entry = self._entries[row]
+                if entry is not None and entry["hard"] == hard:
+                    self._atime[row] = time.time()
+                    self.hits += 1
+                    return entry["netlist"]
+            self.misses += 1
+            return None
+
+    def add(self, query: str, netlist: Any):
+        if not self.max_items:
+            return
+        tokens = prompt_tokens(query)
+        if not tokens:
+            return
+        with self._lock:
+            self._insert(" ".join(tokens), tokens, netlist, time.time())
+            self._dirty = True
+        self.maybe_save()
+
+    def _insert(self, canon: str, tokens: List[str], netlist: Any, atime: float):
+        row = self._slots.get(canon)
+        if row is None:
+            if self._count < self.max_items:
+                row = self._count
+                self._count += 1
+            else:
+                row = int(np.argmin(self._atime))
+                self._df -= self._present[row]
+                del self._slots[self._entries[row]["canon"]]
+        else:
+            self._df -= self._present[row]
+        tf = self._tf(tokens)
+        self._present[row] = tf > 0
+        self._df += self._present[row]
+        self._vectors[row] = self._weigh(tf)
+        self._atime[row] = atime
+        self._entries[row] = {"canon": canon, "hard": _hard(tokens), "netlist": netlist}
+        self._slots[canon] = row
+
+    def stats(self) -> Dict[str, Any]:
+        return {"entries": self._count, "max_items": self.max_items,
+                "threshold": self.threshold, "hits": self.hits, "misses": self.misses}
+
+    # --- persistence ---
+
+    def maybe_save(self):
+        if self.path and self._dirty and time.monotonic() - self._saved_at >= self.save_interval:
+            self.save()
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            rows = [
+                {"prompt": e["canon"], "netlist": e["netlist"], "atime": float(self._atime[i])}
+                for i, e in enumerate(self._entries[:self._count]) if e is not None
+            ]
+            self._dirty = False
+            self._saved_at = time.monotonic()
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            tmp = f"{self.path}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"model": self.model, "entries": rows}, f, ensure_ascii=False)
+            os.replace(tmp, self.path)
+        except Exception as e:
+            print("⚠️ Prompt index save failed:", e)
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            print("⚠️ Prompt index load failed:", e)
+            return
+        if data.get("model") != self.model:
+            return   # netlists from another model: start fresh
+        rows = sorted(data.get("entries", []), key=lambda r: r.get("atime", 0.0))
+        for r in rows[-self.max_items:]:
+            tokens = r["prompt"].split()
+            if tokens:
+                self._insert(r["prompt"], tokens, r["netlist"], r.get("atime", 0.0))
+        # IDF drifted while rows were added one by one; re-weigh with the final counts.
+        for row in range(self._count):
+            self._vectors[row] = self._weigh(self._tf(self._entries[row]["canon"].split()))
+
+
+def _build_index() -> PromptIndex:
+    from netlist.llm import NETLIST_MODEL
+    return PromptIndex(
+        max_items=int(os.getenv("SIMILAR_MAX_ITEMS", "2048")),
+        dim=int(os.getenv("SIMILAR_DIM", "1024")),
+        threshold=float(os.getenv("SIMILAR_THRESHOLD", "0.85")),
+        path=os.getenv("SIMILAR_INDEX_PATH"),  # e.g. /tmp/circuit-prompts.json
+        save_interval=float(os.getenv("SIMILAR_SAVE_INTERVAL_S", "30")),
+        model=NETLIST_MODEL,
+    )
+
+
+prompt_index = _build_index()